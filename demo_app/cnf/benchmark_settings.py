@@ -0,0 +1,30 @@
+# settings for the benchmarks in gna/benchmark_locking.py and contention.py - runs on sqlite, see demo_app/pytest.ini
+from cnf.settings import *
+
+
+DEBUG = False
+
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCHMARK_DATABASE', os.path.join(BASE_DIR, 'benchmark.sqlite3')),
+        # concurrent writers wait for sqlite's database lock instead of failing right away
+        'OPTIONS': {'timeout': 30},
+    }
+}
+
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+# keep logging out of the measured wall time
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        '': {
+            'level': 'WARNING',
+        },
+    },
+}
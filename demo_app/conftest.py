@@ -0,0 +1,15 @@
+def pytest_terminal_summary(terminalreporter):
+    from gna.benchmark_locking import RESULTS, LATENCY_BUDGETS_MS, LATENCY_FACTOR
+
+    if not RESULTS:
+        return
+
+    terminalreporter.section('pessimist_locking benchmarks')
+    terminalreporter.write_line('%-40s %8s %12s %12s' % ('benchmark', 'queries', 'median ms', 'budget ms'))
+
+    for name, (queries, median_ms) in sorted(RESULTS.items()):
+        budget_ms = LATENCY_BUDGETS_MS[name] * (LATENCY_FACTOR or 1)
+        # without BENCHMARK_LATENCY_FACTOR latency budgets don't fail the run - so point out the ones exceeded here
+        terminalreporter.write_line('%-40s %8s %12.3f %12.3f%s' % (
+            name, queries, median_ms, budget_ms, ' exceeded' if median_ms > budget_ms else ''
+        ))
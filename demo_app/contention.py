@@ -0,0 +1,276 @@
+"""
+contention harness for pessimist_locking: N editors (threads or processes) acquire locks on a hot set of cheeses with
+add_pessimistic_lock and drop them with release_pessimistic_locks_of_user - like editors jumping between change views.
+reports throughput, latency percentiles, the denial rate and every violation of the single holder invariant.
+
+runs on a file-backed sqlite database which is created from scratch on every run:
+
+    python contention.py --editors 8 --hot-set 4 --seconds 10 [--processes] [--database /tmp/contention.sqlite3]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--editors', type=int, default=8, help='concurrent editors')
+    parser.add_argument('--hot-set', type=int, default=4, help='count of cheeses all editors fight for')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of the run')
+    parser.add_argument('--release-ratio', type=float, default=0.3,
+                        help='probability of releasing all own locks after an acquisition')
+    parser.add_argument('--think-time', type=float, default=0, help='seconds between two operations of an editor')
+    parser.add_argument('--processes', action='store_true', help='run editors as processes instead of threads')
+    parser.add_argument('--database', default=os.path.join(tempfile.gettempdir(), 'pessimist_contention.sqlite3'),
+                        help='sqlite file - deleted and migrated before the run')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+
+def setup_django(database):
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'cnf.benchmark_settings'
+    os.environ['BENCHMARK_DATABASE'] = database
+
+    # runs from demo_app - the package itself may not be installed
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:0] = [base_dir, os.path.dirname(base_dir)]
+
+    import django
+    django.setup()
+
+
+def prepare(args):
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from gna.models import Cheese
+
+    call_command('migrate', verbosity=0)
+
+    editors = [get_user_model().objects.create_user('editor%s' % i).pk for i in range(args.editors)]
+    cheeses = [Cheese.objects.create(name='hot cheese %s' % i).pk for i in range(args.hot_set)]
+    return editors, cheeses
+
+
+class HolderRegistry(object):
+    """
+    tracks who got a lock from add_pessimistic_lock. an editor drops its entries before it releases in the database -
+    so a second holder of the same cheese means two editors were granted the lock at the same time.
+    """
+
+    def __init__(self, holders, mutex):
+        self.holders = holders
+        self.mutex = mutex
+
+    def acquired(self, editor, cheese):
+        with self.mutex:
+            holder = self.holders.get(cheese)
+            self.holders[cheese] = editor
+
+        return holder is None or holder == editor
+
+    def releasing(self, editor, cheeses):
+        with self.mutex:
+            for cheese in cheeses:
+                if self.holders.get(cheese) == editor:
+                    del self.holders[cheese]
+
+
+def run_editor(editor, cheeses, args, registry, seed):
+    """
+    :return: list of (operation, seconds, outcome), list of invariant violations, seconds the editor ran
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import RequestFactory
+    from gna.models import Cheese
+    from pessimist_locking.exceptions import SoftPessimisticLockException
+    from pessimist_locking.locking_services import add_pessimistic_lock, release_pessimistic_locks_of_user
+
+    rnd = random.Random(seed)
+    user = get_user_model().objects.get(pk=editor)
+    objects = list(Cheese.objects.filter(pk__in=cheeses))
+    ip_address = '10.0.%s.%s' % (editor // 256, editor % 256)
+
+    records = []
+    violations = []
+    held = set()
+    started_at = time.monotonic()
+    deadline = started_at + args.seconds
+
+    try:
+        while time.monotonic() < deadline:
+            cheese = rnd.choice(objects)
+            request = RequestFactory().get('/admin/gna/cheese/%s/change/' % cheese.pk, REMOTE_ADDR=ip_address)
+
+            started = time.perf_counter()
+            try:
+                add_pessimistic_lock(request, user, cheese)
+                outcome = 'acquired'
+
+            except SoftPessimisticLockException:
+                outcome = 'denied'
+
+            except Exception as e:
+                outcome = 'error: %s' % e.__class__.__name__
+
+            records.append(('acquire', time.perf_counter() - started, outcome))
+
+            if outcome == 'acquired':
+                held.add(cheese.pk)
+                if not registry.acquired(editor, cheese.pk):
+                    violations.append('editor %s got cheese %s while another editor held it' % (editor, cheese.pk))
+
+            if held and rnd.random() < args.release_ratio:
+                registry.releasing(editor, held)
+
+                started = time.perf_counter()
+                try:
+                    release_pessimistic_locks_of_user(ip_address, user)
+                    outcome = 'released'
+
+                except Exception as e:
+                    outcome = 'error: %s' % e.__class__.__name__
+
+                records.append(('release', time.perf_counter() - started, outcome))
+                held.clear()
+
+            if args.think_time:
+                time.sleep(args.think_time)
+
+    finally:
+        connection.close()
+
+    return records, violations, time.monotonic() - started_at
+
+
+def run_editor_process(editor, cheeses, args, holders, mutex, seed, results):
+    setup_django(args.database)
+    results.put(run_editor(editor, cheeses, args, HolderRegistry(holders, mutex), seed))
+
+
+def run(args, editors, cheeses):
+    """
+    :return: list of (operation, seconds, outcome), list of violations, elapsed seconds - not counting process start
+    """
+    seeds = random.Random(args.seed)
+
+    if args.processes:
+        from django.db import connections
+        connections.close_all()
+
+        context = multiprocessing.get_context('spawn')
+        manager = context.Manager()
+        holders, mutex, results = manager.dict(), manager.Lock(), manager.Queue()
+
+        workers = [
+            context.Process(target=run_editor_process,
+                            args=(editor, cheeses, args, holders, mutex, seeds.random(), results))
+            for editor in editors
+        ]
+        for worker in workers:
+            worker.start()
+
+        outputs = [results.get() for _ in workers]
+
+        for worker in workers:
+            worker.join()
+
+    else:
+        registry = HolderRegistry({}, threading.Lock())
+        outputs = [None] * len(editors)
+
+        def target(index, editor, seed):
+            outputs[index] = run_editor(editor, cheeses, args, registry, seed)
+
+        workers = [
+            threading.Thread(target=target, args=(index, editor, seeds.random()))
+            for index, editor in enumerate(editors)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    elapsed = max(output[2] for output in outputs)
+
+    records = [record for output in outputs for record in output[0]]
+    violations = [violation for output in outputs for violation in output[1]]
+    return records, violations, elapsed
+
+
+def check_table():
+    """
+    :return: violations of the single holder invariant left in the lock table
+    """
+    from django.db.models import Count
+    from pessimist_locking.models import SoftPessimisticChangeLock
+
+    duplicates = SoftPessimisticChangeLock.objects.values('content_type_id', 'object_id').annotate(
+        rows=Count('id')
+    ).filter(rows__gt=1)
+
+    return ['%(rows)s lock rows for content_type %(content_type_id)s / object %(object_id)s' % row
+            for row in duplicates]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def report(args, records, violations, elapsed):
+    acquisitions = [record for record in records if record[0] == 'acquire']
+    denied = sum(1 for record in acquisitions if record[2] == 'denied')
+    errors = [record for record in records if record[2].startswith('error')]
+
+    print('%s editors (%s) on %s hot cheeses for %.1fs' % (
+        args.editors, 'processes' if args.processes else 'threads', args.hot_set, elapsed
+    ))
+    print('operations:  %s (%.1f/s)' % (len(records), len(records) / elapsed))
+    print('denial rate: %.1f%% of %s acquisitions' % (100.0 * denied / max(len(acquisitions), 1), len(acquisitions)))
+    print('errors:      %s' % len(errors))
+
+    for error in sorted(set(record[2] for record in errors)):
+        print('    %s' % error)
+
+    print('%-10s %10s %10s %10s %10s' % ('latency ms', 'p50', 'p90', 'p99', 'max'))
+
+    for operation in ('acquire', 'release'):
+        durations = [record[1] * 1000 for record in records if record[0] == operation]
+        print('%-10s %10.2f %10.2f %10.2f %10.2f' % (
+            operation, percentile(durations, .5), percentile(durations, .9), percentile(durations, .99),
+            max(durations or [0])
+        ))
+
+    print('invariant violations: %s' % len(violations))
+
+    for violation in violations:
+        print('    %s' % violation)
+
+
+def main():
+    args = parse_args()
+
+    if os.path.exists(args.database):
+        os.remove(args.database)
+
+    setup_django(args.database)
+
+    editors, cheeses = prepare(args)
+    records, violations, elapsed = run(args, editors, cheeses)
+    violations += check_table()
+
+    report(args, records, violations, elapsed)
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
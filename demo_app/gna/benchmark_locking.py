@@ -0,0 +1,225 @@
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from pessimist_locking.exceptions import SoftPessimisticLockException
+from pessimist_locking.locking_services import add_pessimistic_lock, add_pessimistic_locks, get_pessimistic_lock, \
+    release_pessimistic_locks_of_user, release_pessimistic_lock, renew_pessimistic_locks_of_user, \
+    cleanup_outdated_pessimistic_locks, LOCK_HOLDER_SESSION_KEY
+from pessimist_locking.middleware import SoftPessimisticLockReleaseMiddleware
+from pessimist_locking.models import SoftPessimisticChangeLock
+from .models import Cheese
+import os
+import pytest
+import statistics
+import time
+
+
+# calls per benchmark
+ROUNDS = int(os.environ.get('BENCHMARK_ROUNDS', 50))
+
+# wall times depend on the machine - latency budgets are only reported unless BENCHMARK_LATENCY_FACTOR is set (1 on
+# a machine like the one the budgets were taken on, more on slower ones)
+LATENCY_FACTOR = float(os.environ['BENCHMARK_LATENCY_FACTOR']) if 'BENCHMARK_LATENCY_FACTOR' in os.environ else None
+
+# maximum queries per call - raise a budget only together with the change that needs the extra query
+QUERY_BUDGETS = {
+    # upsert, inline cleanup
+    'add_pessimistic_lock': 2,
+    'add_pessimistic_lock_renew': 2,
+    # upsert that leaves the holder's lock alone, select of the holder
+    'add_pessimistic_lock_denied': 2,
+    # savepoint, select for update, update renewals, insert, select, release savepoint
+    'add_pessimistic_locks': 6,
+    'get_pessimistic_lock': 2,
+    'release_pessimistic_locks_of_user': 1,
+    'release_pessimistic_lock': 1,
+    'renew_pessimistic_locks_of_user': 1,
+    'cleanup_outdated_pessimistic_locks': 1,
+    'middleware_release': 1,
+    'middleware_no_release': 0,
+    # session, user, cheese, lock upsert, inline cleanup, session update and friends
+    'change_view': 7,
+}
+
+# maximum median wall time per call in milliseconds
+LATENCY_BUDGETS_MS = {
+    'add_pessimistic_lock': 5,
+    'add_pessimistic_lock_renew': 5,
+    'add_pessimistic_lock_denied': 5,
+    'add_pessimistic_locks': 10,
+    'get_pessimistic_lock': 5,
+    'release_pessimistic_locks_of_user': 5,
+    'release_pessimistic_lock': 5,
+    'renew_pessimistic_locks_of_user': 5,
+    'cleanup_outdated_pessimistic_locks': 5,
+    'middleware_release': 5,
+    'middleware_no_release': 1,
+    'change_view': 50,
+}
+
+RESULTS = {}
+
+
+def run_benchmark(name, func, setup=None):
+    """
+    calls func ROUNDS times - with the arguments returned by setup(round), which is neither counted nor timed - and
+    checks the worst query count and - with LATENCY_FACTOR set - the median wall time against the budgets.
+    """
+    query_counts = []
+    durations = []
+
+    for i in range(ROUNDS):
+        args = setup(i) if setup is not None else ()
+
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            func(*args)
+            durations.append(time.perf_counter() - started)
+
+        query_counts.append(len(context))
+
+    queries = max(query_counts)
+    median_ms = statistics.median(durations) * 1000
+    RESULTS[name] = (queries, median_ms)
+
+    assert queries <= QUERY_BUDGETS[name], \
+        "%s: %s queries per call exceed the budget of %s" % (name, queries, QUERY_BUDGETS[name])
+    if LATENCY_FACTOR is not None:
+        assert median_ms <= LATENCY_BUDGETS_MS[name] * LATENCY_FACTOR, \
+            "%s: median %.2fms per call exceeds the budget of %sms" % (name, median_ms, LATENCY_BUDGETS_MS[name])
+
+
+def make_request(user, path='/admin/gna/cheese/'):
+    request = RequestFactory().get(path, REMOTE_ADDR='127.0.0.1')
+    request.user = user
+    request.session = SessionStore()
+    request.resolver_match = resolve(path)
+    return request
+
+
+@pytest.fixture
+def users(db):
+    return [get_user_model().objects.create_superuser('user%s' % i, 'user%s@example.com' % i, 'password')
+            for i in range(2)]
+
+
+@pytest.fixture
+def cheeses(db):
+    # content types are cached per process - a warm cache is what production sees
+    ContentType.objects.get_for_model(Cheese)
+
+    return [Cheese.objects.create(name='cheese %s' % i) for i in range(ROUNDS + 10)]
+
+
+def test_add_pessimistic_lock(users, cheeses):
+    run_benchmark(
+        'add_pessimistic_lock', add_pessimistic_lock, lambda i: (make_request(users[0]), users[0], cheeses[i])
+    )
+
+
+def test_add_pessimistic_lock_renew(users, cheeses):
+    add_pessimistic_lock(make_request(users[0]), users[0], cheeses[0])
+
+    run_benchmark(
+        'add_pessimistic_lock_renew', add_pessimistic_lock, lambda i: (make_request(users[0]), users[0], cheeses[0])
+    )
+
+
+def test_add_pessimistic_lock_denied(users, cheeses):
+    add_pessimistic_lock(make_request(users[0]), users[0], cheeses[0])
+
+    def acquire(request, user, cheese):
+        with pytest.raises(SoftPessimisticLockException):
+            add_pessimistic_lock(request, user, cheese)
+
+    run_benchmark('add_pessimistic_lock_denied', acquire, lambda i: (make_request(users[1]), users[1], cheeses[0]))
+
+
+def test_add_pessimistic_locks(users, cheeses):
+    def setup(i):
+        release_pessimistic_locks_of_user('127.0.0.1', users[0])
+        return make_request(users[0]), users[0], cheeses[:10]
+
+    run_benchmark('add_pessimistic_locks', add_pessimistic_locks, setup)
+
+
+def test_get_pessimistic_lock(users, cheeses):
+    lock = add_pessimistic_lock(make_request(users[0]), users[0], cheeses[0])
+
+    run_benchmark('get_pessimistic_lock', lambda: get_pessimistic_lock(lock.content_type_id, lock.object_id))
+
+
+def test_release_pessimistic_locks_of_user(users, cheeses):
+    def setup(i):
+        add_pessimistic_lock(make_request(users[0]), users[0], cheeses[i])
+        return '127.0.0.1', users[0]
+
+    run_benchmark('release_pessimistic_locks_of_user', release_pessimistic_locks_of_user, setup)
+
+
+def test_release_pessimistic_lock(users, cheeses):
+    def setup(i):
+        lock = add_pessimistic_lock(make_request(users[0]), users[0], cheeses[i])
+        return '127.0.0.1', users[0], lock.content_type_id, lock.object_id
+
+    run_benchmark('release_pessimistic_lock', release_pessimistic_lock, setup)
+
+
+def test_renew_pessimistic_locks_of_user(users, cheeses):
+    add_pessimistic_locks(make_request(users[0]), users[0], cheeses[:10])
+
+    run_benchmark('renew_pessimistic_locks_of_user', renew_pessimistic_locks_of_user, lambda i: ('127.0.0.1', users[0]))
+
+
+def test_cleanup_outdated_pessimistic_locks(users, cheeses):
+    add_pessimistic_locks(make_request(users[0]), users[0], cheeses[:10])
+
+    run_benchmark('cleanup_outdated_pessimistic_locks', cleanup_outdated_pessimistic_locks)
+
+
+def test_middleware_release(users, cheeses):
+    middleware = SoftPessimisticLockReleaseMiddleware(lambda request: HttpResponse())
+
+    def setup(i):
+        request = make_request(users[0])
+        add_pessimistic_lock(request, users[0], cheeses[i])
+        return request,
+
+    run_benchmark('middleware_release', middleware, setup)
+
+    assert not SoftPessimisticChangeLock.objects.exists()
+
+
+def test_middleware_no_release(users, cheeses):
+    middleware = SoftPessimisticLockReleaseMiddleware(lambda request: HttpResponse())
+
+    # session without holder marker
+    run_benchmark('middleware_no_release', middleware, lambda i: (make_request(users[0]),))
+
+    # holder on the change view
+    cheese = cheeses[0]
+    path = '/admin/gna/cheese/%s/change/' % cheese.pk
+
+    def setup(i):
+        request = make_request(users[0], path)
+        request.session[LOCK_HOLDER_SESSION_KEY] = True
+        return request,
+
+    run_benchmark('middleware_no_release', middleware, setup)
+
+
+def test_change_view(users, cheeses, client):
+    client.force_login(users[0])
+    path = '/admin/gna/cheese/%s/change/' % cheeses[0].pk
+
+    # first request warms caches (content types, templates)
+    assert client.get(path).status_code == 200
+
+    run_benchmark('change_view', lambda: client.get(path))
+
+    assert SoftPessimisticChangeLock.objects.filter(user_id=users[0].pk).count() == 1
@@ -15,13 +15,4 @@ __version__ = '0.1'
 VERSION = __version__
 
 
-# TODO: possible improvement
-# def cleanup_logs(sender, user, request, **kwargs):
-#     try:
-#         release_pessimistic_locks_of_user(get_client_ip(request), user)
-#
-#     except:
-#         logging.getLogger(__name__).error("failed to cleanup lock for logged-out user: %s", user, exc_info=True)
-#
-#
-# user_logged_out.connect(cleanup_logs)
+default_app_config = 'pessimist_locking.apps.PessimistLockingConfig'
@@ -9,14 +9,24 @@
 #
 ################################################################
 from django.contrib import admin
+from django.contrib.admin.options import get_content_type_for_model
+from django.contrib.admin.utils import unquote
 from django.contrib.auth import get_user_model
 from django.core.checks import messages
 from django.shortcuts import redirect
-from django.urls import reverse
-from django.utils.translation import ugettext as _
-from pessimist_locking.exceptions import SoftPessimisticLockException
-from pessimist_locking.locking_services import add_pessimistic_lock
+from django.template.response import TemplateResponse
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from django.utils.translation import ugettext as _, ugettext_lazy, ungettext
+from pessimist_locking.conf import get_heartbeat_interval, is_waiting_list_enabled, get_waiting_list, \
+    is_lock_admin_enabled, is_async_wait_enabled
+from pessimist_locking.exceptions import SoftPessimisticLockException, LockBackendFullError
+from pessimist_locking.locking_services import add_pessimistic_lock, is_locked_within_request, send_lock_released, \
+    send_locks_expired, get_lock_within_request
+from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.querysets import add_lock_info
 import logging
+import uuid
 
 
 logger = logging.getLogger(__name__)
@@ -25,39 +35,176 @@ logger = logging.getLogger(__name__)
 class SoftPessimisticChangeLockModelAdmin(admin.ModelAdmin):
     """
     subclass to ModelAdmin that brings in pessimistic locking
+
+    set show_lock_holder = True to add a "locked by" column to the changelist. the locks of the page's rows and their
+    holders are loaded with one query each - the changelist's count queries stay plain (database lock backend only).
+
+    the change form renews the locks of the user periodically and releases its lock when the page is left as long as
+    pessimist_locking.urls are included in the projects urlconf. a custom change_form_template should extend admin/pessimist_locking/change_form.html to keep it.
     """
 
+    show_lock_holder = False
+
+    change_form_template = 'admin/pessimist_locking/change_form.html'
+
+    def get_changelist_instance(self, request):
+        changelist = super(SoftPessimisticChangeLockModelAdmin, self).get_changelist_instance(request)
+
+        if self.show_lock_holder:
+            add_lock_info(changelist.result_list)
+
+        return changelist
+
+    def get_list_display(self, request):
+        list_display = super(SoftPessimisticChangeLockModelAdmin, self).get_list_display(request)
+
+        if self.show_lock_holder:
+            list_display = list(list_display) + ['lock_holder']
+
+        return list_display
+
+    def lock_holder(self, obj):
+        if getattr(obj, 'lock_user_id', None) is None:
+            return ''
+
+        return '{} ({})'.format(obj.lock_username or obj.lock_user_id, obj.lock_user_ip_address)
+
+    lock_holder.short_description = ugettext_lazy('locked by')
+
     def change_view(self, request, object_id, form_url='', extra_context=None):
         logger.debug("change_view object_id: %s", object_id)
 
+        extra_context = dict(extra_context or {}, **self.get_locking_context(request, object_id))
+
         try:
-            return super(SoftPessimisticChangeLockModelAdmin, self).change_view(request, object_id, form_url, extra_context)
+            response = super(SoftPessimisticChangeLockModelAdmin, self).change_view(
+                request, object_id, form_url, extra_context
+            )
 
         except SoftPessimisticLockException as e:
             logger.info("object_id: {} locked".format(object_id))
 
             opts = self.model._meta
+            message = self.get_locked_message(object_id, e.lock)
 
-            self.message_user(
-                request,
-                _('[%(model)s id:%(obj)s] wird gerade von %(user)s auf %(ip)s bearbeitet.') % {
-                    'model': opts.verbose_name,
-                    'obj': object_id,
-                    'user': get_user_model().objects.get(id=e.lock.user_id),
-                    'ip': e.lock.user_ip_address
-                },
-                messages.ERROR
-            )
+            if is_waiting_list_enabled():
+                try:
+                    return self.wait_view(request, object_id, message)
+
+                except NoReverseMatch:
+                    logger.warning("pessimist_locking.urls not included - can't wait for the lock")
+
+            self.message_user(request, message, messages.ERROR)
 
             # as an alternative: set everything readonly by overriding has_change_permission of modelAdmin
             return redirect(reverse('admin:%s_%s_changelist' % (opts.app_label, opts.model_name)))
 
+        except LockBackendFullError:
+            logger.error("no room for a lock on object_id: %s", object_id, exc_info=True)
+
+            opts = self.model._meta
+            self.message_user(request, _('No lock available right now - please try again later.'), messages.ERROR)
+            return redirect(reverse('admin:%s_%s_changelist' % (opts.app_label, opts.model_name)))
+
+        self.add_lock_touched_at(request, response)
+        return response
+
+    @staticmethod
+    def add_lock_touched_at(request, response):
+        """
+        renders the last touch of the lock into the change form - the page's release is ignored for locks touched
+        later. the response is rendered lazily, so the lock acquired by get_object is known by now.
+        """
+        context = getattr(response, 'context_data', None)
+        if not context or context.get('original') is None:
+            return
+
+        lock = get_lock_within_request(request, request.user, context['original'])
+        if lock is not None:
+            context['pessimist_locking_touched_at'] = (lock.updated_at or lock.created_at).isoformat()
+
+    def get_locked_message(self, object_id, lock):
+        return _('[%(model)s id:%(obj)s] wird gerade von %(user)s auf %(ip)s bearbeitet.') % {
+            'model': self.model._meta.verbose_name,
+            'obj': object_id,
+            'user': get_user_model().objects.get(id=lock.user_id),
+            'ip': lock.user_ip_address
+        }
+
+    def wait_view(self, request, object_id, message):
+        """
+        renders the wait page for a locked object (settings.LOCK_WAITING_LIST) and puts the user on the object's
+        waiting list. the page long-polls pessimist_locking.views.wait and reloads the change view once the lock is
+        free - or leaves the waiting list through pessimist_locking.views.leave when it's closed.
+        """
+        wait_url = reverse('pessimist_locking:async_wait' if is_async_wait_enabled() else 'pessimist_locking:wait')
+        leave_url = reverse('pessimist_locking:leave')
+
+        content_type_id = get_content_type_for_model(self.model).pk
+        object_id = unquote(object_id)
+        waiter = uuid.uuid4().hex
+
+        position = get_waiting_list().join((content_type_id, int(object_id)), waiter)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title=_('Waiting for %s') % self.model._meta.verbose_name,
+            pessimist_locking_message=message,
+            pessimist_locking_position=position + 1,
+            pessimist_locking_wait_url=wait_url,
+            pessimist_locking_leave_url=leave_url,
+            pessimist_locking_content_type_id=content_type_id,
+            pessimist_locking_object_id=object_id,
+            pessimist_locking_waiter=waiter,
+        )
+
+        return TemplateResponse(request, 'admin/pessimist_locking/wait.html', context)
+
+    @staticmethod
+    def is_page_touch_needed(request):
+        """
+        a change form that releases its lock when it's left has to touch the lock on every load - even if the renewal
+        isn't due yet. the release of the page it replaced arrives later and must find the lock touched since.
+        """
+        if request.method != 'GET':
+            return False
+
+        try:
+            reverse('pessimist_locking:release')
+
+        except NoReverseMatch:
+            return False
+
+        return True
+
+    def get_locking_context(self, request, object_id):
+        try:
+            heartbeat_url = reverse('pessimist_locking:heartbeat')
+            release_url = reverse('pessimist_locking:release')
+
+        except NoReverseMatch:
+            logger.debug("pessimist_locking.urls not included - no heartbeat and release")
+            heartbeat_url = release_url = None
+
+        return {
+            'pessimist_locking_heartbeat_url': heartbeat_url,
+            'pessimist_locking_heartbeat_interval': get_heartbeat_interval(),
+            'pessimist_locking_release_url': release_url,
+            'pessimist_locking_content_type_id': get_content_type_for_model(self.model).pk,
+            'pessimist_locking_object_id': unquote(object_id),
+        }
+
     def get_object(self, request, object_id, from_field=None, temp_nolock=False):
         logger.debug("get_object object_id: %s", object_id)
 
         # first get the instance
         instance = super(SoftPessimisticChangeLockModelAdmin, self).get_object(request, object_id, from_field)
 
+        # change_view calls get_object more than once - permission and lock are settled by the first call
+        if instance is None or is_locked_within_request(request, request.user, instance):
+            return instance
+
         url_name = request.resolver_match.url_name
         change_permission = "%s.%s%s" % (self.model._meta.app_label, 'change_', self.model._meta.model_name)
         if request.user.has_perm(change_permission):
@@ -65,9 +212,135 @@ class SoftPessimisticChangeLockModelAdmin(admin.ModelAdmin):
 
             if url_name is not None and url_name.endswith('_change') and not temp_nolock:
                 try:
-                    add_pessimistic_lock(request, request.user, instance)
+                    add_pessimistic_lock(
+                        request, request.user, instance, force_renewal=self.is_page_touch_needed(request)
+                    )
 
                 except SoftPessimisticLockException as e:
                     raise e
 
         return instance
+
+
+class LockExpiryListFilter(admin.SimpleListFilter):
+    title = ugettext_lazy('expiry')
+
+    parameter_name = 'expired'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('0', ugettext_lazy('valid')),
+            ('1', ugettext_lazy('expired')),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == '0':
+            return queryset.filter(expires_at__gt=timezone.now())
+
+        if self.value() == '1':
+            return queryset.filter(expires_at__lte=timezone.now())
+
+        return queryset
+
+
+class SoftPessimisticChangeLockAdmin(admin.ModelAdmin):
+    """
+    read-only view on the lock table (database lock backend) for ops - with actions to force the release of locks and
+    to purge expired ones, each a single DELETE.
+
+    the changelist loads locked objects with one query per content type and lock holders with one query, it skips
+    the count of the unfiltered table and is ordered by the indexed expires_at - to keep big lock tables browsable.
+    """
+
+    list_display = ('id', 'locked_object', 'content_type', 'lock_user', 'user_ip_address', 'created_at', 'updated_at',
+                    'expires_at', 'is_valid')
+
+    list_filter = (LockExpiryListFilter, ('content_type', admin.RelatedOnlyFieldListFilter))
+
+    list_select_related = ('content_type',)
+
+    ordering = ('-expires_at',)
+
+    show_full_result_count = False
+
+    actions = ['force_release', 'purge_expired']
+
+    def get_queryset(self, request):
+        return super(SoftPessimisticChangeLockAdmin, self).get_queryset(request).prefetch_related('content_object')
+
+    def get_changelist_instance(self, request):
+        changelist = super(SoftPessimisticChangeLockAdmin, self).get_changelist_instance(request)
+
+        # user_id is no foreign key - so load all lock holders of the page at once
+        locks = list(changelist.result_list)
+        users = get_user_model().objects.in_bulk({lock.user_id for lock in locks})
+
+        for lock in locks:
+            lock.lock_user = users.get(lock.user_id)
+
+        return changelist
+
+    def get_actions(self, request):
+        actions = super(SoftPessimisticChangeLockAdmin, self).get_actions(request)
+
+        # deleting one by one renders every lock (and its locked object) for confirmation
+        actions.pop('delete_selected', None)
+        return actions
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def locked_object(self, obj):
+        return obj.content_object
+
+    locked_object.short_description = ugettext_lazy('locked object')
+
+    def lock_user(self, obj):
+        return getattr(obj, 'lock_user', None) or obj.user_id
+
+    lock_user.short_description = ugettext_lazy('user')
+
+    def is_valid(self, obj):
+        return obj.expires_at > timezone.now()
+
+    is_valid.boolean = True
+    is_valid.short_description = ugettext_lazy('valid')
+
+    def force_release(self, request, queryset):
+        self.delete_locks(request, queryset)
+
+    force_release.allowed_permissions = ('delete',)
+    force_release.short_description = ugettext_lazy('Force release of selected locks')
+
+    def purge_expired(self, request, queryset):
+        self.delete_locks(request, queryset.filter(expires_at__lte=timezone.now()), expired=True)
+
+    purge_expired.allowed_permissions = ('delete',)
+    purge_expired.short_description = ugettext_lazy('Purge expired of selected locks')
+
+    def delete_locks(self, request, queryset, expired=False):
+        """
+        deletes the locks of queryset - and counts and signals them like the lock services do: as expired locks
+        deleted by the cleanup or as locks released (by nobody in particular - user and ip_address are None).
+        """
+        keys = list(queryset.values_list('content_type_id', 'object_id')) if is_waiting_list_enabled() else None
+
+        deleted = queryset.order_by().delete()
+        count = deleted[0]
+        logger.info("user: %s deleted %s locks", request.user, count)
+
+        if expired:
+            send_locks_expired(deleted, keys)
+        else:
+            send_lock_released(deleted, None, None, keys)
+
+        self.message_user(
+            request, ungettext('%(count)d lock deleted.', '%(count)d locks deleted.', count) % {'count': count}
+        )
+
+
+if is_lock_admin_enabled():
+    admin.site.register(SoftPessimisticChangeLock, SoftPessimisticChangeLockAdmin)
@@ -9,7 +9,13 @@
 #
 ################################################################
 from django.apps import AppConfig
+from django.contrib.auth.signals import user_logged_out
 
 
 class PessimistLockingConfig(AppConfig):
     name = 'pessimist_locking'
+
+    def ready(self):
+        from pessimist_locking.receivers import release_locks_on_logout
+
+        user_logged_out.connect(release_locks_on_logout, dispatch_uid='pessimist_locking.release_locks_on_logout')
@@ -0,0 +1,809 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.core.cache import caches
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Q
+from django.utils.translation import ugettext as _
+from django.utils import timezone
+from pessimist_locking.conf import get_expiry, get_lock_duration, get_lock_cache_alias, get_renewal_limit, \
+    needs_renewal, get_shared_memory_path, get_shared_memory_slots
+from pessimist_locking.exceptions import SoftPessimisticLockException, LockBackendFullError
+from pessimist_locking.lock_table import LockEntry, SharedLockTable
+from pessimist_locking.models import SoftPessimisticChangeLock
+from functools import reduce
+import logging
+import operator
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseLockBackend:
+    """
+    interface for lock stores used by locking_services. a backend is selected by settings.LOCK_BACKEND and always
+    hands out SoftPessimisticChangeLock instances (saved or not) so clients don't have to care where locks live.
+
+    delete-like methods return the same (count, {label: count}) tuple as QuerySet.delete().
+    """
+
+    # whether lookups should delete outdated locks (settings.LOCK_INLINE_CLEANUP) - backends that reuse outdated
+    # locks in place don't need it
+    inline_cleanup = True
+
+    def get_lock(self, content_type_id, object_id, timestamp):
+        """
+        :return: valid lock on content_type_id/object_id at timestamp or None
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide a get_lock() method')
+
+    def acquire_lock(self, content_type_id, object_id, user_id, ip_address, timestamp, force_renewal=False):
+        """
+        creates a lock for user_id/ip_address or renews the one they already hold - unless it doesn't need a renewal
+        yet (see conf.get_renewal_threshold). a lock that isn't renewed isn't written at all.
+
+        :param force_renewal: renew even if the renewal isn't due yet - e.g. to touch the lock for a new page
+        :return: created or renewed lock
+        :raises SoftPessimisticLockException in case another user holds a valid lock
+        :raises LockBackendFullError in case there is no room for another lock
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide an acquire_lock() method')
+
+    def acquire_locks(self, keys, user_id, ip_address, timestamp):
+        """
+        all-or-nothing version of acquire_lock for many content_type_id/object_id keys. keys are acquired in sorted
+        order. this default implementation acquires one by one and releases the locks it created on conflict.
+
+        :return: created or renewed locks in key order
+        :raises SoftPessimisticLockException with all conflicting locks
+        :raises LockBackendFullError in case there is no room for all locks
+        """
+        locks = []
+        conflicts = []
+
+        for content_type_id, object_id in sorted(set(keys)):
+            try:
+                locks.append(self.acquire_lock(content_type_id, object_id, user_id, ip_address, timestamp))
+
+            except SoftPessimisticLockException as e:
+                conflicts.append(e.lock)
+
+            except LockBackendFullError:
+                self._release_created(locks, user_id, ip_address, timestamp)
+                raise
+
+        if conflicts:
+            self._release_created(locks, user_id, ip_address, timestamp)
+            raise SoftPessimisticLockException(_('Locked by another User!'), conflicts[0], conflicts)
+
+        return locks
+
+    def _release_created(self, locks, user_id, ip_address, timestamp):
+        """
+        rolls back a failed acquire_locks - releases the locks it created, renewed ones stay
+        """
+        created_keys = [
+            (lock.content_type_id, lock.object_id) for lock in locks
+            if lock.updated_at is None and lock.created_at == timestamp
+        ]
+        self.release_locks(created_keys, user_id, ip_address)
+
+    def release_locks(self, keys, user_id, ip_address, touched_before=None):
+        """
+        deletes the locks user_id/ip_address holds on the given content_type_id/object_id keys - only those not created
+        or renewed after touched_before if given.
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide a release_locks() method')
+
+    def release_locks_of_user(self, user_id, ip_address, touched_before=None):
+        """
+        deletes all locks of user_id/ip_address - only those not created or renewed after touched_before if given.
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide a release_locks_of_user() method')
+
+    def get_lock_holder_ids(self):
+        """
+        :return: set of the ids of all users holding locks - valid or not
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide a get_lock_holder_ids() method')
+
+    def release_locks_of_users(self, user_ids, touched_before=None):
+        """
+        deletes all locks of the given users - whatever ip address they were acquired from, only those not created or
+        renewed after touched_before if given.
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide a release_locks_of_users() method')
+
+    def renew_locks(self, keys, user_id, ip_address, timestamp):
+        """
+        renews the valid locks user_id/ip_address holds on the given content_type_id/object_id keys.
+
+        :return: count of renewed locks
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide a renew_locks() method')
+
+    def renew_locks_of_user(self, user_id, ip_address, timestamp):
+        """
+        renews all valid locks of user_id/ip_address.
+
+        :return: count of renewed locks
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide a renew_locks_of_user() method')
+
+    def cleanup(self, batch_size=None):
+        """
+        deletes outdated locks - at most batch_size of them if given.
+        """
+        raise NotImplementedError('subclasses of BaseLockBackend must provide a cleanup() method')
+
+    @staticmethod
+    def _deleted(count):
+        return count, {SoftPessimisticChangeLock._meta.label: count}
+
+
+class DatabaseLockBackend(BaseLockBackend):
+    """
+    default backend - keeps locks in the SoftPessimisticChangeLock table.
+    """
+
+    def get_lock(self, content_type_id, object_id, timestamp):
+        return SoftPessimisticChangeLock.objects.filter(
+            content_type_id=content_type_id, object_id=object_id, expires_at__gt=timestamp
+        ).first()
+
+    def acquire_lock(self, content_type_id, object_id, user_id, ip_address, timestamp, force_renewal=False):
+        """
+        acquires with a single INSERT ... ON CONFLICT DO UPDATE ... WHERE ... RETURNING statement where the database
+        supports it (postgres, sqlite >= 3.35) - with INSERT ... ON DUPLICATE KEY UPDATE and an indexed SELECT of the
+        lock on mysql - and falls back to SELECT ... FOR UPDATE + INSERT/UPDATE in a transaction otherwise. either way the unique constraint on content_type/object_id guarantees a single holder. expired locks
+        of the object are taken over in place, so no cleanup is needed here. denials and renewals that aren't due yet
+        (see conf.get_renewal_threshold) write nothing - the upsert returns no row then and the lock is read by a
+        plain SELECT.
+        """
+        connection = connections[router.db_for_write(SoftPessimisticChangeLock)]
+        renewal_limit = None if force_renewal else get_renewal_limit(timestamp)
+
+        if self._supports_upsert(connection):
+            lock = self._upsert_lock(
+                connection, content_type_id, object_id, user_id, ip_address, timestamp, renewal_limit
+            )
+        else:
+            lock = self._select_and_write_lock(
+                connection, content_type_id, object_id, user_id, ip_address, timestamp, renewal_limit
+            )
+
+        if lock.user_id != user_id or lock.user_ip_address != ip_address:
+            raise SoftPessimisticLockException(_('Locked by another User!'), lock)
+
+        return lock
+
+    @staticmethod
+    def _supports_upsert(connection):
+        # NOTE: mysql has no RETURNING - the lock is read by a SELECT after the upsert there
+        if connection.vendor == 'postgresql':
+            return connection.pg_version >= 90500
+
+        if connection.vendor == 'sqlite':
+            return connection.Database.sqlite_version_info >= (3, 35, 0)
+
+        return connection.vendor == 'mysql'
+
+    @classmethod
+    def _upsert_lock(cls, connection, content_type_id, object_id, user_id, ip_address, timestamp, renewal_limit):
+        while True:
+            if connection.vendor == 'mysql':
+                with connection.cursor() as cursor:
+                    cursor.execute(*cls._upsert_sql_mysql(
+                        connection, content_type_id, object_id, user_id, ip_address, timestamp, renewal_limit
+                    ))
+                lock = None
+
+            else:
+                lock = next(iter(SoftPessimisticChangeLock.objects.using(connection.alias).raw(
+                    *cls._upsert_sql(
+                        connection, content_type_id, object_id, user_id, ip_address, timestamp, renewal_limit
+                    )
+                )), None)
+
+            if lock is not None:
+                return lock
+
+            # mysql, denied or renewal not due - read the lock unless it was released meanwhile
+            lock = SoftPessimisticChangeLock.objects.using(connection.alias).filter(
+                content_type_id=content_type_id, object_id=object_id
+            ).first()
+
+            if lock is not None:
+                return lock
+
+    @staticmethod
+    def _upsert_sql(connection, content_type_id, object_id, user_id, ip_address, timestamp, renewal_limit):
+        opts = SoftPessimisticChangeLock._meta
+        qn = connection.ops.quote_name
+
+        table = qn(opts.db_table)
+        columns = {field.attname: qn(field.column) for field in opts.concrete_fields}
+
+        def current(attname):
+            return '{}.{}'.format(table, columns[attname])
+
+        def excluded(attname):
+            return 'EXCLUDED.{}'.format(columns[attname])
+
+        expired = '{} <= %s'.format(current('expires_at'))
+        holder = '{} = {} AND {} = {}'.format(
+            current('user_id'), excluded('user_id'), current('user_ip_address'), excluded('user_ip_address')
+        )
+        renewal = holder if renewal_limit is None else '{} AND {} < %s'.format(holder, current('expires_at'))
+
+        # all SET expressions see the row before the update. an expired lock is taken over and a lock of the same
+        # holder that is due gets renewed - any other conflict updates no row and returns none.
+        sql = (
+            'INSERT INTO {table} ({user_id}, {user_ip_address}, {content_type_id}, {object_id}, {created_at}, {updated_at}, {expires_at}) '
+            'VALUES (%s, %s, %s, %s, %s, NULL, %s) '
+            'ON CONFLICT ({content_type_id}, {object_id}) DO UPDATE SET '
+            '{user_id} = CASE WHEN {expired} THEN {new_user_id} ELSE {old_user_id} END, '
+            '{user_ip_address} = CASE WHEN {expired} THEN {new_user_ip_address} ELSE {old_user_ip_address} END, '
+            '{created_at} = CASE WHEN {expired} THEN {new_created_at} ELSE {old_created_at} END, '
+            '{updated_at} = CASE WHEN {expired} THEN NULL ELSE {new_created_at} END, '
+            '{expires_at} = {new_expires_at} '
+            'WHERE {expired} OR {renewal} '
+            'RETURNING {returning}'
+        ).format(
+            table=table,
+            expired=expired,
+            renewal=renewal,
+            new_user_id=excluded('user_id'),
+            old_user_id=current('user_id'),
+            new_user_ip_address=excluded('user_ip_address'),
+            old_user_ip_address=current('user_ip_address'),
+            new_created_at=excluded('created_at'),
+            old_created_at=current('created_at'),
+            new_expires_at=excluded('expires_at'),
+            returning=', '.join(columns.values()),
+            **columns
+        )
+
+        params = [user_id, ip_address, content_type_id, object_id, timestamp, get_expiry(timestamp)] + [timestamp] * 5
+
+        if renewal_limit is not None:
+            params.append(renewal_limit)
+
+        return sql, params
+
+    @staticmethod
+    def _upsert_sql_mysql(connection, content_type_id, object_id, user_id, ip_address, timestamp, renewal_limit):
+        opts = SoftPessimisticChangeLock._meta
+        qn = connection.ops.quote_name
+
+        columns = {field.attname: qn(field.column) for field in opts.concrete_fields}
+
+        def inserted(attname):
+            return 'VALUES({})'.format(columns[attname])
+
+        expired = '{} <= %s'.format(columns['expires_at'])
+        holder = '{} = {} AND {} = {}'.format(
+            columns['user_id'], inserted('user_id'), columns['user_ip_address'], inserted('user_ip_address')
+        )
+        renewal = holder if renewal_limit is None else '{} AND {} < %s'.format(holder, columns['expires_at'])
+
+        # mysql assigns left to right and later assignments see the new values - so expires_at goes last and every
+        # CASE before reads the old one. user_id and user_ip_address only change on the expired branch, which is
+        # checked first. an expired lock is taken over, a lock of the same holder that is due gets renewed - any other
+        # conflict assigns the old values and changes no row.
+        sql = (
+            'INSERT INTO {table} ({user_id}, {user_ip_address}, {content_type_id}, {object_id}, {created_at}, {updated_at}, {expires_at}) '
+            'VALUES (%s, %s, %s, %s, %s, NULL, %s) '
+            'ON DUPLICATE KEY UPDATE '
+            '{user_id} = CASE WHEN {expired} THEN {new_user_id} ELSE {user_id} END, '
+            '{user_ip_address} = CASE WHEN {expired} THEN {new_user_ip_address} ELSE {user_ip_address} END, '
+            '{created_at} = CASE WHEN {expired} THEN {new_created_at} ELSE {created_at} END, '
+            '{updated_at} = CASE WHEN {expired} THEN NULL WHEN {renewal} THEN {new_created_at} ELSE {updated_at} END, '
+            '{expires_at} = CASE WHEN {expired} OR {renewal} THEN {new_expires_at} ELSE {expires_at} END'
+        ).format(
+            table=qn(opts.db_table),
+            expired=expired,
+            renewal=renewal,
+            new_user_id=inserted('user_id'),
+            new_user_ip_address=inserted('user_ip_address'),
+            new_created_at=inserted('created_at'),
+            new_expires_at=inserted('expires_at'),
+            **columns
+        )
+
+        adapt = connection.ops.adapt_datetimefield_value
+        renewal_params = [adapt(renewal_limit)] if renewal_limit is not None else []
+
+        params = [user_id, ip_address, content_type_id, object_id, adapt(timestamp), adapt(get_expiry(timestamp))]
+        params += [adapt(timestamp)] * 4 + renewal_params + [adapt(timestamp)] + renewal_params
+
+        return sql, params
+
+    @staticmethod
+    def _select_and_write_lock(connection, content_type_id, object_id, user_id, ip_address, timestamp, renewal_limit):
+        lock_objects = SoftPessimisticChangeLock.objects.using(connection.alias).select_for_update().filter(
+            content_type_id=content_type_id, object_id=object_id
+        )
+
+        with transaction.atomic(using=connection.alias):
+            lock = lock_objects.first()
+
+            if lock is None:
+                lock = SoftPessimisticChangeLock(
+                    user_id=user_id,
+                    content_type_id=content_type_id,
+                    object_id=object_id,
+                    user_ip_address=ip_address,
+                    created_at=timestamp,
+                    expires_at=get_expiry(timestamp)
+                )
+
+                try:
+                    with transaction.atomic(using=connection.alias):
+                        lock.save(force_insert=True, using=connection.alias)
+                    return lock
+
+                except IntegrityError:
+                    logger.debug("concurrent lock on %s/%s", content_type_id, object_id)
+                    lock = lock_objects.get()
+
+            if lock.expires_at <= timestamp:
+                lock.user_id = user_id
+                lock.user_ip_address = ip_address
+                lock.created_at = timestamp
+                lock.updated_at = None
+                lock.expires_at = get_expiry(timestamp)
+                lock.save(force_update=True, using=connection.alias)
+
+            elif lock.user_id == user_id and lock.user_ip_address == ip_address and \
+                    (renewal_limit is None or lock.expires_at < renewal_limit):
+                lock.updated_at = timestamp
+                lock.expires_at = get_expiry(timestamp)
+                lock.save(update_fields=['updated_at', 'expires_at'], using=connection.alias)
+
+        return lock
+
+    def acquire_locks(self, keys, user_id, ip_address, timestamp):
+        """
+        locks the existing rows in key order (SELECT ... FOR UPDATE) and then renews, replaces and inserts in bulk - a
+        constant number of queries no matter how many keys. a concurrent insert makes the whole transaction fail, so
+        it's retried once.
+        """
+        keys = sorted(set(keys))
+        if not keys:
+            return []
+
+        db_alias = router.db_for_write(SoftPessimisticChangeLock)
+
+        try:
+            return self._acquire_locks(db_alias, keys, user_id, ip_address, timestamp)
+
+        except IntegrityError:
+            logger.debug("concurrent lock on one of: %s", keys)
+            return self._acquire_locks(db_alias, keys, user_id, ip_address, timestamp)
+
+    def _acquire_locks(self, db_alias, keys, user_id, ip_address, timestamp):
+        lock_objects = SoftPessimisticChangeLock.objects.using(db_alias).filter(self._keys_q(keys)).order_by(
+            'content_type_id', 'object_id'
+        )
+
+        with transaction.atomic(using=db_alias):
+            existing_locks = list(lock_objects.select_for_update())
+
+            conflicts = [
+                lock for lock in existing_locks
+                if lock.expires_at > timestamp and (lock.user_id != user_id or lock.user_ip_address != ip_address)
+            ]
+            if conflicts:
+                raise SoftPessimisticLockException(_('Locked by another User!'), conflicts[0], conflicts)
+
+            renewed_locks = [lock for lock in existing_locks if lock.expires_at > timestamp]
+            renewal_ids = [lock.id for lock in renewed_locks if needs_renewal(lock.expires_at, timestamp)]
+            if renewal_ids:
+                SoftPessimisticChangeLock.objects.using(db_alias).filter(id__in=renewal_ids).update(
+                    updated_at=timestamp, expires_at=get_expiry(timestamp)
+                )
+
+            outdated_ids = [lock.id for lock in existing_locks if lock.expires_at <= timestamp]
+            if outdated_ids:
+                SoftPessimisticChangeLock.objects.using(db_alias).filter(id__in=outdated_ids).delete()
+
+            renewed_keys = {(lock.content_type_id, lock.object_id) for lock in renewed_locks}
+            SoftPessimisticChangeLock.objects.using(db_alias).bulk_create([
+                SoftPessimisticChangeLock(
+                    user_id=user_id,
+                    content_type_id=content_type_id,
+                    object_id=object_id,
+                    user_ip_address=ip_address,
+                    created_at=timestamp,
+                    expires_at=get_expiry(timestamp)
+                )
+                for content_type_id, object_id in keys if (content_type_id, object_id) not in renewed_keys
+            ])
+
+            # bulk_create sets no ids on most databases
+            return list(lock_objects)
+
+    def release_locks(self, keys, user_id, ip_address, touched_before=None):
+        if not keys:
+            return self._deleted(0)
+
+        lock_objects = SoftPessimisticChangeLock.objects.filter(
+            self._keys_q(keys),
+            user_id=user_id,
+            user_ip_address=ip_address
+        )
+
+        if touched_before is not None:
+            lock_objects = lock_objects.filter(self._touched_before_q(touched_before))
+
+        return lock_objects.delete()
+
+    @staticmethod
+    def _keys_q(keys):
+        object_ids = {}
+        for content_type_id, object_id in keys:
+            object_ids.setdefault(content_type_id, []).append(object_id)
+
+        return reduce(operator.or_, (
+            Q(content_type_id=content_type_id, object_id__in=ids) for content_type_id, ids in object_ids.items()
+        ))
+
+    def release_locks_of_user(self, user_id, ip_address, touched_before=None):
+        lock_objects = SoftPessimisticChangeLock.objects.filter(
+            user_id=user_id,
+            user_ip_address=ip_address
+        )
+
+        if touched_before is not None:
+            lock_objects = lock_objects.filter(self._touched_before_q(touched_before))
+
+        return lock_objects.delete()
+
+    @staticmethod
+    def _touched_before_q(touched_before):
+        return Q(updated_at__isnull=True, created_at__lte=touched_before) | \
+            Q(updated_at__isnull=False, updated_at__lte=touched_before)
+
+    def get_lock_holder_ids(self):
+        return set(SoftPessimisticChangeLock.objects.values_list('user_id', flat=True).distinct())
+
+    def release_locks_of_users(self, user_ids, touched_before=None):
+        if not user_ids:
+            return self._deleted(0)
+
+        lock_objects = SoftPessimisticChangeLock.objects.filter(user_id__in=user_ids)
+
+        if touched_before is not None:
+            lock_objects = lock_objects.filter(self._touched_before_q(touched_before))
+
+        return lock_objects.delete()
+
+    def renew_locks(self, keys, user_id, ip_address, timestamp):
+        if not keys:
+            return 0
+
+        return self._renew(SoftPessimisticChangeLock.objects.filter(
+            self._keys_q(keys),
+            user_id=user_id,
+            user_ip_address=ip_address,
+            expires_at__gt=timestamp
+        ), timestamp)
+
+    def renew_locks_of_user(self, user_id, ip_address, timestamp):
+        return self._renew(SoftPessimisticChangeLock.objects.filter(
+            user_id=user_id,
+            user_ip_address=ip_address,
+            expires_at__gt=timestamp
+        ), timestamp)
+
+    @staticmethod
+    def _renew(lock_objects, timestamp):
+        renewal_limit = get_renewal_limit(timestamp)
+        if renewal_limit is not None:
+            lock_objects = lock_objects.filter(expires_at__lt=renewal_limit)
+
+        return lock_objects.update(updated_at=timestamp, expires_at=get_expiry(timestamp))
+
+    def cleanup(self, batch_size=None):
+        outdated_locks = SoftPessimisticChangeLock.objects.filter(expires_at__lt=timezone.now())
+
+        if batch_size is None:
+            return outdated_locks.delete()
+
+        # mysql can't DELETE ... LIMIT with a subquery on the same table, so select the batch first
+        outdated_ids = list(outdated_locks.order_by('expires_at').values_list('id', flat=True)[:batch_size])
+        if not outdated_ids:
+            return self._deleted(0)
+
+        return SoftPessimisticChangeLock.objects.filter(id__in=outdated_ids).delete()
+
+
+class CacheLockBackend(BaseLockBackend):
+    """
+    keeps locks in django's cache framework (settings.LOCK_CACHE_ALIAS) so lock traffic never touches the database.
+    use a shared cache (redis, memcached) as soon as more than one process serves the admin - LocMemCache is only
+    good for tests and single process setups.
+
+    a lock is a single cache entry per content_type_id/object_id that is created with cache.add() - which is atomic
+    on all shared caches - and expires by the cache's ttl. to release all locks of a user an index entry per
+    user_id/ip_address lists the lock keys they acquired. the index is maintained best-effort: a lost entry only means
+    the lock lives until its ttl.
+
+    an outdated lock still in the cache is taken over by delete() + add() - guarded by a short-lived takeover entry so
+    only one of several editors racing for it deletes it. the others retry a few times and then see the new holder.
+    """
+
+    key_prefix = 'pessimist_locking'
+
+    # attempts to add a lock that is outdated or vanished meanwhile - and seconds to wait between them
+    acquire_attempts = 5
+    acquire_retry_delay = 0.05
+
+    # ttl of the takeover entry - in case its owner dies between delete() and add()
+    takeover_timeout = 5
+
+    @property
+    def cache(self):
+        return caches[get_lock_cache_alias()]
+
+    def lock_key(self, content_type_id, object_id):
+        return '{}:lock:{}:{}'.format(self.key_prefix, content_type_id, object_id)
+
+    def takeover_key(self, lock_key):
+        return '{}:takeover'.format(lock_key)
+
+    def user_key(self, user_id, ip_address):
+        return '{}:user:{}:{}'.format(self.key_prefix, user_id, ip_address)
+
+    @staticmethod
+    def get_timeout():
+        return get_lock_duration() * 60
+
+    @staticmethod
+    def _is_valid(data, timestamp):
+        return data['expires_at'] > timestamp
+
+    @staticmethod
+    def _is_holder(data, user_id, ip_address):
+        return data['user_id'] == user_id and data['user_ip_address'] == ip_address
+
+    @staticmethod
+    def _is_touched_before(data, touched_before):
+        return touched_before is None or (data['updated_at'] or data['created_at']) <= touched_before
+
+    @staticmethod
+    def _to_lock(content_type_id, object_id, data):
+        return SoftPessimisticChangeLock(
+            user_id=data['user_id'],
+            user_ip_address=data['user_ip_address'],
+            content_type_id=content_type_id,
+            object_id=object_id,
+            created_at=data['created_at'],
+            updated_at=data['updated_at'],
+            expires_at=data['expires_at'],
+        )
+
+    def _remember(self, user_id, ip_address, content_type_id, object_id):
+        user_key = self.user_key(user_id, ip_address)
+        lock_keys = self.cache.get(user_key) or set()
+        lock_keys.add((content_type_id, object_id))
+        self.cache.set(user_key, lock_keys, self.get_timeout())
+
+    def get_lock(self, content_type_id, object_id, timestamp):
+        data = self.cache.get(self.lock_key(content_type_id, object_id))
+
+        if data is None or not self._is_valid(data, timestamp):
+            return None
+
+        return self._to_lock(content_type_id, object_id, data)
+
+    def acquire_lock(self, content_type_id, object_id, user_id, ip_address, timestamp, force_renewal=False):
+        key = self.lock_key(content_type_id, object_id)
+        data = {
+            'user_id': user_id,
+            'user_ip_address': ip_address,
+            'created_at': timestamp,
+            'updated_at': None,
+            'expires_at': get_expiry(timestamp),
+        }
+
+        existing = None
+
+        for attempt in range(self.acquire_attempts):
+            if attempt:
+                time.sleep(self.acquire_retry_delay)
+
+            if self.cache.add(key, data, self.get_timeout()):
+                break
+
+            existing = self.cache.get(key)
+
+            # expired between add() and get() - add again
+            if existing is None:
+                continue
+
+            if self._is_valid(existing, timestamp):
+                if not self._is_holder(existing, user_id, ip_address):
+                    raise SoftPessimisticLockException(_('Locked by another User!'), self._to_lock(content_type_id, object_id, existing))
+
+                data = existing
+
+                # a renewal that isn't due yet writes nothing
+                if force_renewal or needs_renewal(existing['expires_at'], timestamp):
+                    data['updated_at'] = timestamp
+                    data['expires_at'] = get_expiry(timestamp)
+                    self.cache.set(key, data, self.get_timeout())
+                break
+
+            # outdated - only the editor owning the takeover entry deletes it, all of them race for the add() again
+            if self._take_over(key, data, timestamp):
+                break
+
+        else:
+            logger.debug("no takeover of outdated lock %s within %s attempts", key, self.acquire_attempts)
+            raise SoftPessimisticLockException(
+                _('Locked by another User!'), self._to_lock(content_type_id, object_id, existing or data)
+            )
+
+        self._remember(user_id, ip_address, content_type_id, object_id)
+        return self._to_lock(content_type_id, object_id, data)
+
+    def _take_over(self, key, data, timestamp):
+        """
+        :return: True if data replaced the outdated lock at key
+        """
+        takeover_key = self.takeover_key(key)
+
+        if not self.cache.add(takeover_key, True, self.takeover_timeout):
+            return False
+
+        try:
+            # another editor may have taken it over before we got the takeover entry
+            existing = self.cache.get(key)
+            if existing is not None and self._is_valid(existing, timestamp):
+                return False
+
+            if existing is not None:
+                self.cache.delete(key)
+
+            return self.cache.add(key, data, self.get_timeout())
+
+        finally:
+            self.cache.delete(takeover_key)
+
+    def release_locks_of_user(self, user_id, ip_address, touched_before=None):
+        user_key = self.user_key(user_id, ip_address)
+        lock_keys = {self.lock_key(*item): item for item in self.cache.get(user_key) or ()}
+
+        released_keys = []
+        kept_items = set()
+
+        for key, data in self.cache.get_many(list(lock_keys)).items():
+            # only delete what's still ours - a lock may have expired and been taken over meanwhile
+            if not self._is_holder(data, user_id, ip_address):
+                continue
+
+            if self._is_touched_before(data, touched_before):
+                released_keys.append(key)
+            else:
+                kept_items.add(lock_keys[key])
+
+        self.cache.delete_many(released_keys)
+
+        if kept_items:
+            self.cache.set(user_key, kept_items, self.get_timeout())
+        else:
+            self.cache.delete(user_key)
+
+        return self._deleted(len(released_keys))
+
+    def release_locks(self, keys, user_id, ip_address, touched_before=None):
+        lock_keys = [self.lock_key(*key) for key in keys]
+
+        released_keys = [
+            key for key, data in self.cache.get_many(lock_keys).items()
+            if self._is_holder(data, user_id, ip_address) and self._is_touched_before(data, touched_before)
+        ]
+        self.cache.delete_many(released_keys)
+
+        # the user index may still list released keys - release_locks_of_user skips what's gone
+        return self._deleted(len(released_keys))
+
+    def renew_locks(self, keys, user_id, ip_address, timestamp):
+        return self._renew([self.lock_key(*key) for key in keys], user_id, ip_address, timestamp)
+
+    def renew_locks_of_user(self, user_id, ip_address, timestamp):
+        user_key = self.user_key(user_id, ip_address)
+        return self._renew([self.lock_key(*item) for item in self.cache.get(user_key) or ()], user_id, ip_address,
+                           timestamp)
+
+    def _renew(self, lock_keys, user_id, ip_address, timestamp):
+        renewed = {}
+        for key, data in self.cache.get_many(lock_keys).items():
+            if self._is_holder(data, user_id, ip_address) and self._is_valid(data, timestamp) and \
+                    needs_renewal(data['expires_at'], timestamp):
+                data['updated_at'] = timestamp
+                data['expires_at'] = get_expiry(timestamp)
+                renewed[key] = data
+
+        if renewed:
+            self.cache.set_many(renewed, self.get_timeout())
+            self.cache.touch(self.user_key(user_id, ip_address), self.get_timeout())
+
+        return len(renewed)
+
+    def cleanup(self, batch_size=None):
+        # entries expire by the cache's ttl
+        return self._deleted(0)
+
+
+class SharedMemoryLockBackend(BaseLockBackend):
+    """
+    keeps locks in a memory-mapped hash table (lock_table.SharedLockTable) at settings.LOCK_SHARED_MEMORY_PATH that
+    all worker processes of a single host share - lock checks cost no database or network round trip. the table has
+    settings.LOCK_SHARED_MEMORY_SLOTS fixed slots and expired locks free their slot for reuse.
+
+    only for deployments where all processes serving the admin run on one host (and unix) - locks don't survive a
+    reboot of the host. a full table raises lock_table.LockTableFullError (a LockBackendFullError), ip addresses that
+    aren't ascii or longer than 48 bytes a ValueError.
+    """
+
+    # expired slots are reused in place - scanning the whole table under the host-wide lock per lookup isn't needed
+    inline_cleanup = False
+
+    def __init__(self):
+        self.table = SharedLockTable(get_shared_memory_path(), get_shared_memory_slots())
+
+    @staticmethod
+    def _to_lock(entry):
+        return SoftPessimisticChangeLock(**entry._asdict())
+
+    def get_lock(self, content_type_id, object_id, timestamp):
+        entry = self.table.get(content_type_id, object_id, timestamp)
+        return self._to_lock(entry) if entry is not None else None
+
+    def acquire_lock(self, content_type_id, object_id, user_id, ip_address, timestamp, force_renewal=False):
+        entry = self.table.acquire(
+            LockEntry(content_type_id, object_id, user_id, ip_address, timestamp, None, get_expiry(timestamp)),
+            None if force_renewal else get_renewal_limit(timestamp)
+        )
+        lock = self._to_lock(entry)
+
+        if entry.user_id != user_id or entry.user_ip_address != ip_address:
+            raise SoftPessimisticLockException(_('Locked by another User!'), lock)
+
+        return lock
+
+    def release_locks(self, keys, user_id, ip_address, touched_before=None):
+        return self._deleted(self.table.release(keys, user_id, ip_address, touched_before))
+
+    def release_locks_of_user(self, user_id, ip_address, touched_before=None):
+        return self._deleted(self.table.release_of_user(user_id, ip_address, touched_before))
+
+    def get_lock_holder_ids(self):
+        return self.table.holder_ids()
+
+    def release_locks_of_users(self, user_ids, touched_before=None):
+        return self._deleted(self.table.release_of_users(set(user_ids), touched_before))
+
+    def renew_locks(self, keys, user_id, ip_address, timestamp):
+        return self.table.renew(
+            keys, user_id, ip_address, timestamp, get_expiry(timestamp), get_renewal_limit(timestamp)
+        )
+
+    def renew_locks_of_user(self, user_id, ip_address, timestamp):
+        return self.table.renew_of_user(
+            user_id, ip_address, timestamp, get_expiry(timestamp), get_renewal_limit(timestamp)
+        )
+
+    def cleanup(self, batch_size=None):
+        return self._deleted(self.table.cleanup(timezone.now(), batch_size))
@@ -0,0 +1,265 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+from datetime import timedelta
+import logging
+import os
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_LOCK_DURATION_MINUTES = 5
+
+DEFAULT_LOCK_BACKEND = 'pessimist_locking.backends.DatabaseLockBackend'
+
+DEFAULT_LOCK_CACHE_ALIAS = 'default'
+
+DEFAULT_DEFERRED_RELEASE_QUEUE_SIZE = 1000
+
+DEFAULT_SHARED_MEMORY_SLOTS = 4096
+
+DEFAULT_WAITING_LIST_BACKEND = 'pessimist_locking.waiting.LocalWaitingList'
+
+DEFAULT_WAIT_TIMEOUT_SECONDS = 25
+
+DEFAULT_WAIT_POLL_SECONDS = 2
+
+
+def get_lock_duration():
+    return getattr(settings, 'LOCK_DURATION_MINUTES', DEFAULT_LOCK_DURATION_MINUTES)
+
+
+def get_expiry(timestamp):
+    """
+    :return: expires_at of a lock touched at timestamp
+    """
+    return timestamp + timedelta(minutes=get_lock_duration())
+
+
+def get_renewal_threshold():
+    """
+    a lock its holder acquires again is only rewritten (updated_at and expires_at) when less than
+    settings.LOCK_RENEWAL_THRESHOLD_SECONDS of its lifetime remain - otherwise nothing is written. change form loads
+    force the renewal, as the release of the page they replace only keeps locks touched later. defaults to None
+    (extend on every renewal). keep it above LOCK_HEARTBEAT_SECONDS, otherwise heartbeats may skip extensions until the
+    lock expires.
+    """
+    return getattr(settings, 'LOCK_RENEWAL_THRESHOLD_SECONDS', None)
+
+
+def get_renewal_limit(timestamp):
+    """
+    :return: locks expiring at or after this datetime don't need a renewal at timestamp - None if every lock does
+    """
+    threshold = get_renewal_threshold()
+
+    if threshold is None:
+        return None
+
+    return timestamp + timedelta(seconds=threshold)
+
+
+def needs_renewal(expires_at, timestamp):
+    renewal_limit = get_renewal_limit(timestamp)
+    return renewal_limit is None or expires_at < renewal_limit
+
+
+def is_inline_cleanup_enabled():
+    """
+    inline cleanup deletes outdated locks on every lookup and acquisition. turn it off
+    (settings.LOCK_INLINE_CLEANUP = False) as soon as the sweep_pessimistic_locks management command runs.
+    """
+    return getattr(settings, 'LOCK_INLINE_CLEANUP', True)
+
+
+def get_cleanup_interval():
+    """
+    inline cleanup runs at most once per settings.LOCK_CLEANUP_INTERVAL_SECONDS across all processes sharing the lock
+    cache. 0 (default) runs it on every lookup and acquisition.
+    """
+    return getattr(settings, 'LOCK_CLEANUP_INTERVAL_SECONDS', 0)
+
+
+def is_holder_marker_enabled():
+    """
+    acquiring a lock marks the session as lock holder and the middleware skips the release for sessions without that
+    marker. turn it off (settings.LOCK_HOLDER_MARKER = False) to release on every request.
+    """
+    return getattr(settings, 'LOCK_HOLDER_MARKER', True)
+
+
+def is_deferred_release_enabled():
+    """
+    with settings.LOCK_DEFERRED_RELEASE the middleware hands releases to a background thread instead of running them
+    before the response is returned.
+    """
+    return getattr(settings, 'LOCK_DEFERRED_RELEASE', False)
+
+
+def get_deferred_release_queue_size():
+    return getattr(settings, 'LOCK_DEFERRED_RELEASE_QUEUE_SIZE', DEFAULT_DEFERRED_RELEASE_QUEUE_SIZE)
+
+
+def get_heartbeat_interval():
+    """
+    seconds between two heartbeats of an open change form - defaults to a third of the lock duration
+    """
+    return getattr(settings, 'LOCK_HEARTBEAT_SECONDS', get_lock_duration() * 60 // 3)
+
+
+def get_lock_cache_alias():
+    return getattr(settings, 'LOCK_CACHE_ALIAS', DEFAULT_LOCK_CACHE_ALIAS)
+
+
+def get_shared_memory_path():
+    """
+    file of the SharedMemoryLockBackend's lock table - all processes using the same path share their locks
+    """
+    return getattr(settings, 'LOCK_SHARED_MEMORY_PATH', os.path.join(tempfile.gettempdir(), 'pessimist_locking.locks'))
+
+
+def get_shared_memory_slots():
+    """
+    maximum count of locks held at the same time by SharedMemoryLockBackend
+    """
+    return getattr(settings, 'LOCK_SHARED_MEMORY_SLOTS', DEFAULT_SHARED_MEMORY_SLOTS)
+
+
+def is_release_on_logout_enabled():
+    """
+    a user's locks (acquired from the ip address they log out from) are released on logout unless
+    settings.LOCK_RELEASE_ON_LOGOUT is False.
+    """
+    return getattr(settings, 'LOCK_RELEASE_ON_LOGOUT', True)
+
+
+def is_lock_admin_enabled():
+    """
+    the lock table is registered in the admin site unless settings.LOCK_ADMIN is False - e.g. to register your own
+    ModelAdmin for it.
+    """
+    return getattr(settings, 'LOCK_ADMIN', True)
+
+
+def is_profiling_enabled():
+    """
+    with settings.LOCK_PROFILING the middleware profiles lock handling per request and sends the result as Server-Timing
+    header (see profiling.py).
+    """
+    return getattr(settings, 'LOCK_PROFILING', False)
+
+
+def is_waiting_list_enabled():
+    """
+    with settings.LOCK_WAITING_LIST users who hit a locked change view get a wait page instead of being redirected -
+    it reloads the change view as soon as the lock is free (see waiting.py).
+    """
+    return getattr(settings, 'LOCK_WAITING_LIST', False)
+
+
+def get_wait_timeout():
+    """
+    seconds a wait request is held open before the wait page asks again
+    """
+    return getattr(settings, 'LOCK_WAIT_TIMEOUT_SECONDS', DEFAULT_WAIT_TIMEOUT_SECONDS)
+
+
+def get_wait_poll_interval():
+    """
+    seconds between two checks of the lock while waiting - bounds how late an expired lock is noticed
+    """
+    return getattr(settings, 'LOCK_WAIT_POLL_SECONDS', DEFAULT_WAIT_POLL_SECONDS)
+
+
+def get_wait_max_concurrent():
+    """
+    maximum count of wait requests a process holds open at the same time (settings.LOCK_WAIT_MAX_CONCURRENT) - each
+    occupies a worker thread. None (default) holds open all of them.
+    """
+    return getattr(settings, 'LOCK_WAIT_MAX_CONCURRENT', None)
+
+
+def is_async_wait_enabled():
+    """
+    with settings.LOCK_ASYNC_WAIT the wait page long-polls views.async_wait - which waits without occupying a thread
+    on asgi servers (django >= 3.1).
+    """
+    return getattr(settings, 'LOCK_ASYNC_WAIT', False)
+
+
+_lock_backend = None
+
+
+def get_lock_backend():
+    """
+    returns the lock backend configured by settings.LOCK_BACKEND (dotted path to a BaseLockBackend subclass).
+    the instance is created once and reused until the setting changes.
+    """
+    global _lock_backend
+
+    if _lock_backend is None:
+        backend_path = getattr(settings, 'LOCK_BACKEND', DEFAULT_LOCK_BACKEND)
+        logger.debug("loading lock backend: %s", backend_path)
+        _lock_backend = import_string(backend_path)()
+
+    return _lock_backend
+
+
+_waiting_list = None
+
+
+def get_waiting_list():
+    """
+    returns the waiting list configured by settings.LOCK_WAITING_LIST_BACKEND (dotted path to a BaseWaitingList
+    subclass). the instance is created once and reused until the setting changes.
+    """
+    global _waiting_list
+
+    if _waiting_list is None:
+        _waiting_list = import_string(getattr(settings, 'LOCK_WAITING_LIST_BACKEND', DEFAULT_WAITING_LIST_BACKEND))()
+
+    return _waiting_list
+
+
+_tracing_hook = _NOT_LOADED = object()
+
+
+def get_tracing_hook():
+    """
+    returns the callable configured by settings.LOCK_TRACING_HOOK (see tracing.traced) or None.
+    """
+    global _tracing_hook
+
+    if _tracing_hook is _NOT_LOADED:
+        hook_path = getattr(settings, 'LOCK_TRACING_HOOK', None)
+        _tracing_hook = import_string(hook_path) if hook_path else None
+
+    return _tracing_hook
+
+
+def reset_lock_settings(**kwargs):
+    global _lock_backend, _tracing_hook, _waiting_list
+
+    if kwargs['setting'] in ('LOCK_BACKEND', 'LOCK_CACHE_ALIAS', 'LOCK_SHARED_MEMORY_PATH', 'LOCK_SHARED_MEMORY_SLOTS'):
+        _lock_backend = None
+
+    if kwargs['setting'] == 'LOCK_TRACING_HOOK':
+        _tracing_hook = _NOT_LOADED
+
+    if kwargs['setting'] in ('LOCK_WAITING_LIST_BACKEND', 'LOCK_CACHE_ALIAS'):
+        _waiting_list = None
+
+
+setting_changed.connect(reset_lock_settings)
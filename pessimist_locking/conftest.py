@@ -0,0 +1,26 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib.auth import get_user_model
+import pytest
+
+
+@pytest.fixture
+def users(db):
+    return (
+        get_user_model().objects.create_user(username='editor1'),
+        get_user_model().objects.create_user(username='editor2'),
+    )
+
+
+@pytest.fixture
+def editor(db):
+    return get_user_model().objects.create_user(username='editor')
+
@@ -0,0 +1,144 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.db import close_old_connections
+from django.utils import timezone
+from pessimist_locking.conf import get_deferred_release_queue_size
+from pessimist_locking.locking_services import release_pessimistic_locks_of_user
+import atexit
+import logging
+import os
+import queue
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredReleaseQueue:
+    """
+    bounded queue of lock releases drained by a single daemon thread - used by SoftPessimisticLockReleaseMiddleware
+    when settings.LOCK_DEFERRED_RELEASE is on, so the response doesn't wait for the release DELETE.
+
+    every release carries the time it was requested and only deletes locks that weren't acquired or renewed after
+    that - a user who already opened the next change view keeps that lock. a renewal that isn't due yet writes
+    nothing though (settings.LOCK_RENEWAL_THRESHOLD_SECONDS), so add_pessimistic_lock drops the pending releases of
+    the user from the queue of its process (see discard()). if the queue is full, the release runs right away in the
+    calling thread. pending releases are flushed when the process exits.
+    """
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        # after a fork only the forking thread survives - so check the owner process too
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+
+        with self._start_lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='pessimist-locking-release', daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def submit(self, ip_address, user):
+        item = (ip_address, user, timezone.now())
+
+        try:
+            self.queue.put_nowait(item)
+
+        except queue.Full:
+            logger.warning("deferred release queue is full - releasing locks of user: %s right away", user)
+            self._release(*item)
+
+    def discard(self, ip_address, user):
+        """
+        drops the pending releases of user / ip_address - they acquired a lock again. their other locks are released by
+        their next release or expire.
+
+        :return: count of dropped releases
+        """
+        with self.queue.mutex:
+            pending = [item for item in self.queue.queue if item[0] == ip_address and item[1].pk == user.pk]
+
+            for item in pending:
+                self.queue.queue.remove(item)
+
+            if pending:
+                self.queue.unfinished_tasks -= len(pending)
+                if not self.queue.unfinished_tasks:
+                    self.queue.all_tasks_done.notify_all()
+                self.queue.not_full.notify(len(pending))
+
+        return len(pending)
+
+    def flush(self):
+        """
+        runs all pending releases in the calling thread
+        """
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+            try:
+                self._release(*item)
+            finally:
+                self.queue.task_done()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+
+            try:
+                self._release(*item)
+            finally:
+                self.queue.task_done()
+                close_old_connections()
+
+    @staticmethod
+    def _release(ip_address, user, requested_at):
+        try:
+            release_pessimistic_locks_of_user(ip_address, user, touched_before=requested_at)
+
+        except:
+            logger.warning("failed to release locks of user: %s", user, exc_info=True)
+
+
+_release_queue = None
+_release_queue_lock = threading.Lock()
+
+
+def get_release_queue():
+    """
+    :return: the process wide, started DeferredReleaseQueue
+    """
+    global _release_queue
+
+    if _release_queue is None:
+        with _release_queue_lock:
+            if _release_queue is None:
+                _release_queue = DeferredReleaseQueue(get_deferred_release_queue_size())
+                atexit.register(_release_queue.flush)
+
+    _release_queue.start()
+    return _release_queue
+
+
+def discard_deferred_releases(ip_address, user):
+    """
+    drops the releases of user / ip_address pending in this process - if any
+    """
+    if _release_queue is not None and _release_queue.discard(ip_address, user):
+        logger.debug("dropped pending releases of user: %s", user)
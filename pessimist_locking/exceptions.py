@@ -15,6 +15,17 @@ logger = logging.getLogger(__name__)
 
 
 class SoftPessimisticLockException(Exception):
-    def __init__(self, message, lock):
+    def __init__(self, message, lock, locks=None):
         super(SoftPessimisticLockException, self).__init__(message)
         self.lock = lock
+
+        # all conflicting locks - more than one for bulk acquisition
+        self.locks = locks if locks is not None else [lock]
+
+
+class LockBackendFullError(Exception):
+    """
+    the lock backend has no room for another lock - e.g. all settings.LOCK_SHARED_MEMORY_SLOTS of the shared memory
+    backend are in use. no lock was acquired.
+    """
+    pass
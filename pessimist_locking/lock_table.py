@@ -0,0 +1,425 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as datetime_timezone
+from django.conf import settings
+from django.utils import timezone
+from pessimist_locking.exceptions import LockBackendFullError
+import logging
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+
+except ImportError:  # windows
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+LockEntry = namedtuple('LockEntry', [
+    'content_type_id', 'object_id', 'user_id', 'user_ip_address', 'created_at', 'updated_at', 'expires_at'
+])
+
+
+class LockTableFullError(LockBackendFullError):
+    pass
+
+
+class SharedLockTable:
+    """
+    fixed-slot hash table of locks in a memory-mapped file - shared by all processes on the host that open the same
+    path. slots are found by open addressing (linear probing) on content_type_id/object_id. released slots become
+    tombstones, expired slots are reused by the next lock that probes them.
+
+    every operation holds an exclusive flock on the file (between processes) and a threading lock (between the threads
+    of a process) - so reading and writing a slot is one atomic compare-and-set. operations on all locks of a user
+    scan the whole table without locks first and only lock it if the user holds any.
+
+    timestamps are stored as microseconds since the epoch, updated_at 0 means None. ip addresses are stored as ascii
+    of at most 48 bytes - others are rejected with a ValueError.
+    """
+
+    MAGIC = b'PLOCKTBL'
+    VERSION = 1
+
+    HEADER = struct.Struct('<8sII')
+    HEADER_SIZE = 64
+
+    # state, content_type_id, object_id, user_id, created_at, updated_at, expires_at, user_ip_address
+    SLOT = struct.Struct('<B7xqqqqqq48s')
+    SLOT_KEY = struct.Struct('<B7xqq')
+    EXPIRES_AT_OFFSET = 48
+
+    EMPTY, USED, TOMBSTONE = 0, 1, 2
+
+    def __init__(self, path, slots):
+        if fcntl is None:
+            raise RuntimeError('SharedLockTable needs fcntl - it is not available on this platform')
+
+        self.path = path
+        self.slots = slots
+        self.size = self.HEADER_SIZE + slots * self.SLOT.size
+
+        self._fd = None
+        self._mmap = None
+        self._pid = None
+        self._thread_lock = None
+
+        # never replaced - so all threads of a process agree on the thread lock _open sets up
+        self._open_lock = threading.Lock()
+
+    def _open(self):
+        """
+        maps the file - again after a fork, as the child would share the parent's flock otherwise. flock doesn't
+        exclude threads sharing a descriptor, so every process gets a single new thread lock too.
+        """
+        if self._pid == os.getpid():
+            return
+
+        with self._open_lock:
+            if self._pid == os.getpid():
+                return
+
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, self.HEADER.size, 0)
+
+                if os.fstat(fd).st_size != self.size or header != self.HEADER.pack(self.MAGIC, self.VERSION, self.slots):
+                    logger.info("initializing shared lock table: %s with %s slots", self.path, self.slots)
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, self.HEADER.pack(self.MAGIC, self.VERSION, self.slots), 0)
+
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+            self._fd = fd
+            self._mmap = mmap.mmap(fd, self.size)
+            self._thread_lock = threading.Lock()
+
+            # last - other threads skip _open as soon as they see it
+            self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self):
+        self._open()
+
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, index):
+        return self.HEADER_SIZE + index * self.SLOT.size
+
+    def _home(self, content_type_id, object_id):
+        return ((content_type_id * 0x9E3779B1) ^ object_id) % self.slots
+
+    def _find(self, content_type_id, object_id, now):
+        """
+        :return: index of the slot holding content_type_id/object_id or None, index of the first reusable slot on the
+                 probe path or None
+        """
+        reusable = None
+        index = self._home(content_type_id, object_id)
+
+        for _ in range(self.slots):
+            offset = self._offset(index)
+            state, slot_content_type_id, slot_object_id = self.SLOT_KEY.unpack_from(self._mmap, offset)
+
+            if state == self.EMPTY:
+                return None, reusable if reusable is not None else index
+
+            if state == self.USED and slot_content_type_id == content_type_id and slot_object_id == object_id:
+                return index, reusable
+
+            if reusable is None and (
+                    state == self.TOMBSTONE or struct.unpack_from('<q', self._mmap, offset + self.EXPIRES_AT_OFFSET)[0] <= now):
+                reusable = index
+
+            index = (index + 1) % self.slots
+
+        return None, reusable
+
+    def _read(self, index):
+        state, content_type_id, object_id, user_id, created_at, updated_at, expires_at, ip_address = \
+            self.SLOT.unpack_from(self._mmap, self._offset(index))
+
+        return LockEntry(
+            content_type_id, object_id, user_id, ip_address.rstrip(b'\0').decode('ascii'),
+            from_micros(created_at), from_micros(updated_at) if updated_at else None, from_micros(expires_at)
+        )
+
+    def _write(self, index, entry):
+        self.SLOT.pack_into(
+            self._mmap, self._offset(index), self.USED, entry.content_type_id, entry.object_id, entry.user_id,
+            to_micros(entry.created_at), to_micros(entry.updated_at) if entry.updated_at else 0,
+            to_micros(entry.expires_at), encode_ip_address(entry.user_ip_address)
+        )
+
+    def _remove(self, index):
+        # a tombstone followed by an empty slot ends no probe path - so it and the tombstones before it can be emptied
+        self._mmap[self._offset(index)] = self.TOMBSTONE
+
+        if self._mmap[self._offset((index + 1) % self.slots)] == self.EMPTY:
+            while self._mmap[self._offset(index)] == self.TOMBSTONE:
+                self._mmap[self._offset(index)] = self.EMPTY
+                index = (index - 1) % self.slots
+
+    def _scan(self, user_id=None, ip_address=None):
+        """
+        yields index and entry of all used slots - of user_id/ip_address only if given
+        """
+        for index in self._used_slots(user_id, ip_address):
+            yield index, self._read(index)
+
+    def _used_slots(self, user_id=None, ip_address=None):
+        """
+        yields the index of all used slots - of user_id/ip_address only if given, checked on the raw slot
+        """
+        raw_ip_address = None
+        if ip_address is not None:
+            try:
+                raw_ip_address = encode_ip_address(ip_address).ljust(48, b'\0')
+
+            except ValueError:
+                # never stored
+                return
+
+        for index in range(self.slots):
+            offset = self._offset(index)
+
+            if self._mmap[offset] != self.USED:
+                continue
+
+            if user_id is not None:
+                slot = self.SLOT.unpack_from(self._mmap, offset)
+
+                if slot[3] != user_id or slot[7] != raw_ip_address:
+                    continue
+
+            yield index
+
+    def get(self, content_type_id, object_id, timestamp):
+        """
+        :return: valid LockEntry of content_type_id/object_id at timestamp or None
+        """
+        with self._locked():
+            index, _ = self._find(content_type_id, object_id, to_micros(timestamp))
+
+            if index is None:
+                return None
+
+            entry = self._read(index)
+            return entry if entry.expires_at > timestamp else None
+
+    def acquire(self, entry, renewal_limit=None):
+        """
+        stores entry unless another holder has a valid lock on its content_type_id/object_id. a valid lock of the
+        same holder is renewed with entry's created_at and expires_at - unless it expires after renewal_limit, then
+        it's left as it is.
+
+        :return: the lock now stored
+        :raises LockTableFullError if there is no free slot left
+        :raises ValueError if entry's ip address can't be stored
+        """
+        timestamp = entry.created_at
+        encode_ip_address(entry.user_ip_address)
+
+        with self._locked():
+            index, reusable = self._find(entry.content_type_id, entry.object_id, to_micros(timestamp))
+
+            if index is not None:
+                existing = self._read(index)
+
+                if existing.expires_at > timestamp:
+                    if existing.user_id != entry.user_id or existing.user_ip_address != entry.user_ip_address:
+                        return existing
+
+                    if renewal_limit is not None and existing.expires_at >= renewal_limit:
+                        return existing
+
+                    renewed = existing._replace(updated_at=timestamp, expires_at=entry.expires_at)
+                    self._write(index, renewed)
+                    return renewed
+
+            elif reusable is not None:
+                index = reusable
+
+            else:
+                raise LockTableFullError('no free slot in shared lock table: %s' % self.path)
+
+            self._write(index, entry)
+            return entry
+
+    def release(self, keys, user_id, ip_address, touched_before=None):
+        """
+        :return: count of released locks of user_id/ip_address on the given content_type_id/object_id keys - not
+                 created or renewed after touched_before if given
+        """
+        released = 0
+
+        with self._locked():
+            for content_type_id, object_id in keys:
+                index, _ = self._find(content_type_id, object_id, 0)
+
+                if index is not None:
+                    entry = self._read(index)
+
+                    if entry.user_id == user_id and entry.user_ip_address == ip_address and \
+                            is_touched_before(entry, touched_before):
+                        self._remove(index)
+                        released += 1
+
+        return released
+
+    def _holds_any(self, user_id, ip_address):
+        """
+        lock-free look for a slot of user_id/ip_address - a torn read only costs a locked scan that finds nothing. a
+        lock acquired concurrently may be missed, just like by a locked scan that ran a moment earlier.
+        """
+        self._open()
+        return next(self._used_slots(user_id, ip_address), None) is not None
+
+    def release_of_user(self, user_id, ip_address, touched_before=None):
+        released = 0
+
+        # most users release on every request without holding a lock - don't take the host-wide lock for them
+        if not self._holds_any(user_id, ip_address):
+            return released
+
+        with self._locked():
+            for index, entry in list(self._scan(user_id, ip_address)):
+                if is_touched_before(entry, touched_before):
+                    self._remove(index)
+                    released += 1
+
+        return released
+
+    def holder_ids(self):
+        with self._locked():
+            return {entry.user_id for _, entry in self._scan()}
+
+    def release_of_users(self, user_ids, touched_before=None):
+        released = 0
+
+        with self._locked():
+            for index, entry in list(self._scan()):
+                if entry.user_id in user_ids and is_touched_before(entry, touched_before):
+                    self._remove(index)
+                    released += 1
+
+        return released
+
+    def renew(self, keys, user_id, ip_address, timestamp, expires_at, renewal_limit=None):
+        """
+        :return: count of renewed valid locks of user_id/ip_address on the given content_type_id/object_id keys - only
+                 those expiring before renewal_limit if given
+        """
+        renewed = 0
+
+        with self._locked():
+            for content_type_id, object_id in keys:
+                index, _ = self._find(content_type_id, object_id, 0)
+
+                if index is not None:
+                    entry = self._read(index)
+
+                    if entry.user_id == user_id and entry.user_ip_address == ip_address and \
+                            is_due(entry, timestamp, renewal_limit):
+                        self._write(index, entry._replace(updated_at=timestamp, expires_at=expires_at))
+                        renewed += 1
+
+        return renewed
+
+    def renew_of_user(self, user_id, ip_address, timestamp, expires_at, renewal_limit=None):
+        renewed = 0
+
+        if not self._holds_any(user_id, ip_address):
+            return renewed
+
+        with self._locked():
+            for index, entry in self._scan(user_id, ip_address):
+                if is_due(entry, timestamp, renewal_limit):
+                    self._write(index, entry._replace(updated_at=timestamp, expires_at=expires_at))
+                    renewed += 1
+
+        return renewed
+
+    def cleanup(self, timestamp, batch_size=None):
+        deleted = 0
+        now = to_micros(timestamp)
+
+        with self._locked():
+            for index in range(self.slots):
+                if batch_size is not None and deleted >= batch_size:
+                    break
+
+                offset = self._offset(index)
+
+                if self._mmap[offset] == self.USED and \
+                        struct.unpack_from('<q', self._mmap, offset + self.EXPIRES_AT_OFFSET)[0] <= now:
+                    self._remove(index)
+                    deleted += 1
+
+        return deleted
+
+    def close(self):
+        if self._mmap is not None and self._pid == os.getpid():
+            self._mmap.close()
+            os.close(self._fd)
+
+        self._fd = self._mmap = self._pid = None
+
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=datetime_timezone.utc)
+
+
+def encode_ip_address(ip_address):
+    """
+    :return: ip_address as stored in a slot
+    :raises ValueError if it isn't ascii or longer than 48 bytes - a truncated address would never match again
+    """
+    raw_ip_address = ip_address.encode('ascii')
+
+    if len(raw_ip_address) > 48:
+        raise ValueError('ip address too long for shared lock table: %r' % ip_address)
+
+    return raw_ip_address
+
+
+def is_due(entry, timestamp, renewal_limit=None):
+    return entry.expires_at > timestamp and (renewal_limit is None or entry.expires_at < renewal_limit)
+
+
+def is_touched_before(entry, touched_before):
+    return touched_before is None or (entry.updated_at or entry.created_at) <= touched_before
+
+
+def to_micros(timestamp):
+    delta = timestamp - (_EPOCH_UTC if timezone.is_aware(timestamp) else _EPOCH)
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_micros(micros):
+    timestamp = _EPOCH + timedelta(microseconds=micros)
+    return timestamp.replace(tzinfo=datetime_timezone.utc) if settings.USE_TZ else timestamp
@@ -8,52 +8,82 @@
 #     Copyright (c) 2019. All rights reserved.
 #
 ################################################################
-from django.conf import settings
+from asgiref.sync import sync_to_async
 from django.contrib.admin.options import get_content_type_for_model
-from django.db.models import Q
-from django.utils.translation import ugettext as _
+from django.core.cache import caches
 from django.utils import timezone
+# NOTE: DEFAULT_LOCK_DURATION_MINUTES and get_lock_duration are still importable from here for existing clients
+from pessimist_locking.conf import DEFAULT_LOCK_DURATION_MINUTES, get_lock_duration, get_lock_backend, \
+    is_inline_cleanup_enabled, get_cleanup_interval, get_lock_cache_alias, is_holder_marker_enabled, \
+    is_waiting_list_enabled, get_waiting_list, get_wait_timeout, get_wait_poll_interval, is_deferred_release_enabled
 from pessimist_locking.exceptions import SoftPessimisticLockException
+from pessimist_locking.metrics import count_acquired, count_denied, count_renewed, count_released, \
+    count_cleanup_deleted
 from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.signals import lock_acquired, lock_renewed, lock_denied, lock_released, locks_expired
+from pessimist_locking.tracing import traced
 from pessimist_locking.utils import get_client_ip
-from datetime import timedelta
+import asyncio
 import logging
+import time
 
 
 logger = logging.getLogger(__name__)
 
 
-DEFAULT_LOCK_DURATION_MINUTES = 5
+CLEANUP_LEASE_CACHE_KEY = 'pessimist_locking:cleanup'
 
+LOCK_HOLDER_SESSION_KEY = '_pessimist_locking_holder'
 
-def get_lock_duration():
-    return getattr(settings, 'LOCK_DURATION_MINUTES', DEFAULT_LOCK_DURATION_MINUTES)
+
+@traced('pessimist_locking.cleanup_outdated_pessimistic_locks')
+def cleanup_outdated_pessimistic_locks(batch_size=None):
+    """
+    deletes all outdated locks form lock backend - that is all locks with expires_at < now.
+
+    :param batch_size: delete at most batch_size locks - to keep the delete short on big tables
+    :return: count of deleted objects
+    """
+    logger.debug("cleanup_outdated_pessimistic_locks / batch_size: %s", batch_size)
+
+    deleted = get_lock_backend().cleanup(batch_size)
+    send_locks_expired(deleted)
+    return deleted
 
 
-def cleanup_outdated_pessimistic_locks():
+def acquire_cleanup_lease():
     """
-    deletes all outdated locks form database - outdated either by created_at or by updated_at field.
-    created_at outdated = created_at < settings.LOCK_DURATION_MINUTES & updated_at = NULL
-    updated_at outdated = created_at < settings.LOCK_DURATION_MINUTES & updated_at < settings.LOCK_DURATION_MINUTES
+    decides whether this process should run the inline cleanup now. with settings.LOCK_CLEANUP_INTERVAL_SECONDS set
+    the first process to add the lease key to the lock cache wins and all others skip the cleanup until the key
+    expires. use a shared cache (redis, memcached) to coordinate more than one process.
+
+    :return: True if cleanup should run
     """
-    logger.debug("cleanup_outdated_pessimistic_locks")
+    interval = get_cleanup_interval()
+    if not interval:
+        return True
 
-    time_threshold = timezone.now() - timedelta(minutes=get_lock_duration())
+    return caches[get_lock_cache_alias()].add(CLEANUP_LEASE_CACHE_KEY, True, interval)
 
-    return SoftPessimisticChangeLock.objects.filter(
-        Q(created_at__lt=time_threshold, updated_at__isnull=True) |
-        Q(updated_at__isnull=False, updated_at__lt=time_threshold)
 
-    ).delete()
+def run_inline_cleanup(backend):
+    """
+    calls cleanup_outdated_pessimistic_locks - unless settings.LOCK_INLINE_CLEANUP is turned off, another process did
+    so within settings.LOCK_CLEANUP_INTERVAL_SECONDS or the lock backend reuses outdated locks in place (shared memory
+    backend).
+    """
+    if backend.inline_cleanup and is_inline_cleanup_enabled() and acquire_cleanup_lease():
+        cleanup_outdated_pessimistic_locks()
 
 
+@traced('pessimist_locking.get_pessimistic_lock')
 def get_pessimistic_lock(content_type_id, object_id, timestamp=None):
     """
-    looks up database for existing lock on model - that is instance_id and content_type_id in combination with
-    created_at and updated_at timestamp fields. method is used internally and has no real value to be used from
+    looks up lock backend for existing lock on model - that is instance_id and content_type_id in combination with
+    the expires_at timestamp field. method is used internally and has no real value to be used from
     clients directly
 
-    also calls cleanup_outdated_pessimistic_locks to handle outdated locks.
+    also runs the inline cleanup (run_inline_cleanup) to handle outdated locks.
     only one lock item is return - even if there would be more in the database.
 
     :param content_type_id: content-type of the model to lock
@@ -68,19 +98,10 @@ def get_pessimistic_lock(content_type_id, object_id, timestamp=None):
     logger.debug("get_pessimistic_lock  current_content_type_id: %s, current_object_id: %s", content_type_id, object_id)
 
     # first to a cleanup - this is the simplest implementation
-    cleanup_outdated_pessimistic_locks()
-
-    time_threshold = timestamp - timedelta(minutes=get_lock_duration())
-
-    lock_objects = SoftPessimisticChangeLock.objects.filter(content_type_id=content_type_id, object_id=object_id).filter(
-        Q(updated_at__isnull=True, created_at__gt=time_threshold) |
-        Q(updated_at__isnull=False, updated_at__gt=time_threshold)
-    )
-
-    if lock_objects.count() == 0:
-        return None
+    backend = get_lock_backend()
+    run_inline_cleanup(backend)
 
-    return lock_objects.first()
+    return backend.get_lock(content_type_id, object_id, timestamp)
 
 
 def get_pessimistic_lock_for_model(model, timestamp=None):
@@ -96,21 +117,27 @@ def get_pessimistic_lock_for_model(model, timestamp=None):
     return get_pessimistic_lock(current_content_type_id, current_object_id, timestamp)
 
 
-def add_pessimistic_lock(request, user, model, timestamp=None):
+@traced('pessimist_locking.add_pessimistic_lock')
+def add_pessimistic_lock(request, user, model, timestamp=None, force_renewal=False):
     """
     this is the main entry to clients of locking_services. try to get a lock on model for a user - the method looks
     up lock-database entries and than compares given params for user/user-ip/model and timestamp to decide about giving
     a pessimistic lock or raise a SoftPessimisticWriteLockException in case of lock exists for another user.
 
     this implementation also updates an existing lock. so this method should also be called when user is still
-    interacting with the locked model.
+    interacting with the locked model. within the same request a lock is acquired only once - further calls return
+    the lock memoized on the request. a renewal that isn't due yet (settings.LOCK_RENEWAL_THRESHOLD_SECONDS) writes
+    nothing - unless force_renewal is set. a successful acquisition runs the inline cleanup (run_inline_cleanup)
+    afterwards - the acquisition itself takes over outdated locks without it.
 
     :param  request: current django request
     :param  user: model object of current user
     :param  model: model object of current model
     :param  timestamp: datetime to avoid monkey-patching for tests
+    :param  force_renewal: renew the lock even if the renewal isn't due - so it counts as touched by this request
     :return created lock object
     :raises SoftPessimisticLockException in case other user holds a pessimistic lock on that models-instance
+    :raises LockBackendFullError in case the lock backend has no room for another lock
     """
 
     if timestamp == None:
@@ -121,50 +148,447 @@ def add_pessimistic_lock(request, user, model, timestamp=None):
     current_content_type_id = get_content_type_for_model(model).pk
     current_object_id = model.pk
 
-    # get valid lock
-    existing_lock = get_pessimistic_lock(current_content_type_id, current_object_id, timestamp)
-
     current_remote_ip = get_client_ip(request)
     current_user_id = user.pk
 
-    if existing_lock is not None:
+    request_locks = get_request_locks(request)
+    request_lock_key = (current_content_type_id, current_object_id, current_user_id)
+
+    if request_lock_key in request_locks:
+        logger.debug("lock on %s already acquired within this request", model)
+        return request_locks[request_lock_key]
+
+    backend = get_lock_backend()
+
+    started = time.perf_counter()
+    try:
+        lock = backend.acquire_lock(
+            current_content_type_id, current_object_id, current_user_id, current_remote_ip, timestamp, force_renewal
+        )
+
+    except SoftPessimisticLockException as e:
+        count_denied(time.perf_counter() - started)
+        send_lock_denied(e, request, user)
+        raise
+
+    count_acquired((lock,), timestamp, time.perf_counter() - started)
+    send_lock_acquired((lock,), timestamp, request, user)
+
+    # a pending deferred release would drop a lock that wasn't written by this acquisition
+    if is_deferred_release_enabled():
+        # deferred imports this module
+        from pessimist_locking.deferred import discard_deferred_releases
+        discard_deferred_releases(current_remote_ip, user)
+
+    run_inline_cleanup(backend)
+
+    request_locks[request_lock_key] = lock
+    mark_lock_holder(request)
+    return lock
+
+
+def get_request_locks(request):
+    """
+    :return: locks acquired within request by (content_type_id, object_id, user_id)
+    """
+    try:
+        return request._pessimist_locking_locks
 
-        if existing_lock.user_id != current_user_id or existing_lock.user_ip_address != current_remote_ip:
-            raise SoftPessimisticLockException(_('Locked by another User!'), existing_lock)
+    except AttributeError:
+        request._pessimist_locking_locks = {}
+        return request._pessimist_locking_locks
 
-        else:
-            existing_lock.updated_at = timestamp
-            existing_lock.save(force_update=True)
-            return existing_lock
 
-    logger.debug("no lock for: %s so let's created on for user_id: %s / ip: %s", model, current_user_id, current_remote_ip)
+def get_lock_within_request(request, user, model):
+    """
+    :return: the lock add_pessimistic_lock acquired on model for user within request - or None
+    """
+    return get_request_locks(request).get((get_content_type_for_model(model).pk, model.pk, user.pk))
 
-    new_lock = SoftPessimisticChangeLock(
-        user_id=current_user_id,
-        content_type_id=current_content_type_id,
-        object_id=current_object_id,
-        user_ip_address=current_remote_ip,
-        created_at=timestamp
-    )
 
-    new_lock.save(force_insert=True)
-    return new_lock
+def is_locked_within_request(request, user, model):
+    """
+    :return: True if add_pessimistic_lock already locked model for user within request
+    """
+    return (get_content_type_for_model(model).pk, model.pk, user.pk) in get_request_locks(request)
 
 
-def release_pessimistic_locks_of_user(ip_address, user):
+@traced('pessimist_locking.release_pessimistic_locks_of_user')
+def release_pessimistic_locks_of_user(ip_address, user, touched_before=None):
     """
     releases all locks of a given user / uio-address combination.
     this can be useful if a logout signal was caught or the user went to some other page on the app.
 
     :param ip_address: current django request
     :param user: model object of current user
+    :param touched_before: only release locks not created or renewed after this datetime - for releases that are
+                           executed later than they were requested
     :return: count of deleted objects
     """
     logger.debug("release_pessimistic_locks_of_user / ip_address: %s, user: %s", ip_address, user)
 
     current_user_id = user.pk
 
-    return SoftPessimisticChangeLock.objects.filter(
-        user_id=current_user_id,
-        user_ip_address__iexact=ip_address
-    ).delete()
\ No newline at end of file
+    released = get_lock_backend().release_locks_of_user(current_user_id, ip_address, touched_before)
+    send_lock_released(released, user, ip_address)
+    return released
+
+
+def get_pessimistic_lock_holder_ids():
+    """
+    :return: set of the ids of all users holding locks
+    :raises NotImplementedError if the lock backend can't enumerate locks (cache backend)
+    """
+    return get_lock_backend().get_lock_holder_ids()
+
+
+@traced('pessimist_locking.release_pessimistic_locks_of_users')
+def release_pessimistic_locks_of_users(user_ids, touched_before=None):
+    """
+    releases the locks of all given users with a single delete - to get rid of the locks of expired sessions before
+    their timeout (see management command release_session_locks).
+
+    :param user_ids: ids of users to release the locks of - whatever ip address they were acquired from
+    :param touched_before: only release locks not created or renewed after this datetime - so a user who acquired a
+                           lock after the decision to release keeps it
+    :return: count of deleted objects
+    :raises NotImplementedError if the lock backend can't enumerate locks (cache backend)
+    """
+    logger.debug("release_pessimistic_locks_of_users / users: %s", len(user_ids))
+
+    released = get_lock_backend().release_locks_of_users(user_ids, touched_before)
+    # the locks of many users - counted as one release by nobody in particular
+    send_lock_released(released, None, None)
+    return released
+
+
+@traced('pessimist_locking.renew_pessimistic_locks_of_user')
+def renew_pessimistic_locks_of_user(ip_address, user, timestamp=None):
+    """
+    renews all valid locks of a given user / ip-address combination with a single update - to keep locks alive while
+    the user is still editing (see views.heartbeat).
+
+    :param ip_address: current django request
+    :param user: model object of current user
+    :param timestamp: datetime to avoid monkey-patching for tests
+    :return: count of renewed locks
+    """
+
+    if timestamp == None:
+        timestamp = timezone.now()
+
+    logger.debug("renew_pessimistic_locks_of_user / ip_address: %s, user: %s", ip_address, user)
+
+    renewed = get_lock_backend().renew_locks_of_user(user.pk, ip_address, timestamp)
+    count_renewed(renewed)
+    return renewed
+
+
+@traced('pessimist_locking.renew_pessimistic_lock')
+def renew_pessimistic_lock(ip_address, user, content_type_id, object_id, timestamp=None):
+    """
+    renews the lock user / ip-address holds on content_type_id / object_id with a single update - if any. unlike
+    renew_pessimistic_locks_of_user it leaves the user's other locks alone, so a page left in another tab can still
+    release its lock by touched_before (see views.heartbeat and views.release).
+
+    :param ip_address: current django request
+    :param user: model object of current user
+    :param content_type_id: content-type of the locked model
+    :param object_id: pk of the locked model instance
+    :param timestamp: datetime to avoid monkey-patching for tests
+    :return: count of renewed locks
+    """
+
+    if timestamp == None:
+        timestamp = timezone.now()
+
+    logger.debug("renew_pessimistic_lock / ip_address: %s, user: %s, content_type_id: %s, object_id: %s",
+                 ip_address, user, content_type_id, object_id)
+
+    renewed = get_lock_backend().renew_locks([(content_type_id, object_id)], user.pk, ip_address, timestamp)
+    count_renewed(renewed)
+    return renewed
+
+
+@traced('pessimist_locking.add_pessimistic_locks')
+def add_pessimistic_locks(request, user, objects, timestamp=None):
+    """
+    bulk version of add_pessimistic_lock: locks all model objects for user or none of them. the lock backend checks
+    and writes all locks in a constant number of queries and acquires them in a deterministic order.
+
+    :param  request: current django request
+    :param  user: model object of current user
+    :param  objects: model objects to lock - may be of different models
+    :param  timestamp: datetime to avoid monkey-patching for tests
+    :return created or renewed lock objects
+    :raises SoftPessimisticLockException with all conflicting locks in exception.locks
+    :raises LockBackendFullError in case the lock backend has no room for all locks - none of them is acquired then
+    """
+
+    if timestamp == None:
+        timestamp = timezone.now()
+
+    logger.debug("add_pessimistic_locks / request: %s, user: %s, objects: %s", request, user, objects)
+
+    lock_keys = get_lock_keys(objects)
+
+    backend = get_lock_backend()
+
+    started = time.perf_counter()
+    try:
+        locks = backend.acquire_locks(lock_keys, user.pk, get_client_ip(request), timestamp)
+
+    except SoftPessimisticLockException as e:
+        count_denied(time.perf_counter() - started)
+        send_lock_denied(e, request, user)
+        raise
+
+    count_acquired(locks, timestamp, time.perf_counter() - started)
+    send_lock_acquired(locks, timestamp, request, user)
+
+    run_inline_cleanup(backend)
+
+    if locks:
+        mark_lock_holder(request)
+
+    return locks
+
+
+@traced('pessimist_locking.release_pessimistic_locks')
+def release_pessimistic_locks(ip_address, user, objects):
+    """
+    releases the locks user / ip-address holds on the given model objects with a single delete.
+
+    :param ip_address: current django request
+    :param user: model object of current user
+    :param objects: model objects to unlock
+    :return: count of deleted objects
+    """
+    logger.debug("release_pessimistic_locks / ip_address: %s, user: %s, objects: %s", ip_address, user, objects)
+
+    keys = get_lock_keys(objects)
+
+    released = get_lock_backend().release_locks(keys, user.pk, ip_address)
+    send_lock_released(released, user, ip_address, keys)
+    return released
+
+
+@traced('pessimist_locking.release_pessimistic_lock')
+def release_pessimistic_lock(ip_address, user, content_type_id, object_id, touched_before=None):
+    """
+    releases the lock user / ip-address holds on content_type_id / object_id - if any.
+
+    :param ip_address: current django request
+    :param user: model object of current user
+    :param content_type_id: content-type of the locked model
+    :param object_id: pk of the locked model instance
+    :param touched_before: only release the lock if it wasn't created or renewed after this datetime - so a page that
+                           is left doesn't release the lock its reload acquired again
+    :return: count of deleted objects
+    """
+    logger.debug("release_pessimistic_lock / ip_address: %s, user: %s, content_type_id: %s, object_id: %s",
+                 ip_address, user, content_type_id, object_id)
+
+    keys = [(content_type_id, object_id)]
+
+    released = get_lock_backend().release_locks(keys, user.pk, ip_address, touched_before)
+    send_lock_released(released, user, ip_address, keys)
+    return released
+
+
+def send_lock_acquired(locks, timestamp, request, user):
+    """
+    sends lock_acquired or - for locks the user already held before timestamp - lock_renewed for every lock
+    """
+    for lock in locks:
+        signal = lock_renewed if lock.created_at != timestamp else lock_acquired
+        signal.send(sender=SoftPessimisticChangeLock, lock=lock, request=request, user=user)
+
+
+def send_lock_denied(exception, request, user):
+    for lock in exception.locks:
+        lock_denied.send(sender=SoftPessimisticChangeLock, lock=lock, request=request, user=user)
+
+
+def send_lock_released(released, user, ip_address, keys=None):
+    count_released(released[0])
+
+    if released[0]:
+        lock_released.send(sender=SoftPessimisticChangeLock, user=user, ip_address=ip_address, count=released[0])
+        publish_lock_change(keys)
+
+
+def send_locks_expired(deleted, keys=None):
+    count_cleanup_deleted(deleted[0])
+
+    if deleted[0]:
+        locks_expired.send(sender=SoftPessimisticChangeLock, count=deleted[0])
+        publish_lock_change(keys)
+
+
+def publish_lock_change(keys=None):
+    """
+    wakes up users waiting for a lock (settings.LOCK_WAITING_LIST) - they check whether their lock is free now
+
+    :param keys: (content_type_id, object_id) of the released locks - None wakes up all waiters (the released locks
+                 aren't known)
+    """
+    if is_waiting_list_enabled():
+        get_waiting_list().publish(keys)
+
+
+@traced('pessimist_locking.wait_for_pessimistic_lock')
+def wait_for_pessimistic_lock(ip_address, user, content_type_id, object_id, waiter, timeout=None):
+    """
+    puts waiter on the waiting list of content_type_id/object_id and blocks until the lock is free and waiter is
+    first in line - or timeout (settings.LOCK_WAIT_TIMEOUT_SECONDS) passed. waiters are woken up by releases and
+    cleanups and check the lock at least every settings.LOCK_WAIT_POLL_SECONDS - to notice expired locks.
+    a waiter told that the lock is free leaves the waiting list - it's up to them to acquire it now. a waiter that
+    left meanwhile (see leave_waiting_list) stops waiting right away.
+
+    :param ip_address: ip address of the waiting user
+    :param user: model object of the waiting user
+    :param content_type_id: content-type of the locked model
+    :param object_id: pk of the locked model instance
+    :param waiter: id of the wait page - one user may wait in more than one page
+    :param timeout: seconds to wait at most
+    :return: True if the lock is free (or held by user), position of waiter on the waiting list (0 is next) - None
+             if waiter left
+    """
+    waiting_list = get_waiting_list()
+    key = (content_type_id, object_id)
+
+    deadline = time.monotonic() + (timeout if timeout is not None else get_wait_timeout())
+    generation = waiting_list.generation(key)
+    position = waiting_list.join(key, waiter)
+
+    while True:
+        if position is None:
+            return False, None
+
+        if position == 0 and is_lock_free_for(ip_address, user, content_type_id, object_id):
+            waiting_list.leave(key, waiter)
+            return True, 0
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False, position
+
+        generation = waiting_list.wait(key, generation, min(get_wait_poll_interval(), remaining))
+        # don't put back a waiter whose page was left while it waited
+        position = waiting_list.position(key, waiter)
+
+
+def is_lock_free_for(ip_address, user, content_type_id, object_id):
+    """
+    :return: True if nobody holds a lock on content_type_id/object_id - or user / ip-address does
+    """
+    lock = get_lock_backend().get_lock(content_type_id, object_id, timezone.now())
+    return lock is None or (lock.user_id == user.pk and lock.user_ip_address == ip_address)
+
+
+def leave_waiting_list(content_type_id, object_id, waiter):
+    """
+    takes waiter off the waiting list of content_type_id/object_id - the wait page was left. wakes up the other
+    waiters, one of them may be first in line now.
+    """
+    key = (content_type_id, object_id)
+
+    get_waiting_list().leave(key, waiter)
+    get_waiting_list().publish([key])
+
+
+def get_lock_keys(objects):
+    """
+    :return: (content_type_id, object_id) for every model object
+    """
+    return [(get_content_type_for_model(obj).pk, obj.pk) for obj in objects]
+
+
+async def aget_pessimistic_lock(content_type_id, object_id, timestamp=None):
+    """
+    async version of get_pessimistic_lock
+    """
+    return await sync_to_async(get_pessimistic_lock)(content_type_id, object_id, timestamp)
+
+
+async def aadd_pessimistic_lock(request, user, model, timestamp=None, force_renewal=False):
+    """
+    async version of add_pessimistic_lock
+    """
+    return await sync_to_async(add_pessimistic_lock)(request, user, model, timestamp, force_renewal)
+
+
+async def arelease_pessimistic_locks_of_user(ip_address, user, touched_before=None):
+    """
+    async version of release_pessimistic_locks_of_user
+    """
+    return await sync_to_async(release_pessimistic_locks_of_user)(ip_address, user, touched_before)
+
+
+async def await_for_pessimistic_lock(ip_address, user, content_type_id, object_id, waiter, timeout=None):
+    """
+    async version of wait_for_pessimistic_lock for asgi servers - sleeps with asyncio.sleep() and checks the
+    generation of the waiting list every poll_interval of the waiting list instead of blocking a thread. releases are
+    noticed up to that much later.
+    """
+    waiting_list = get_waiting_list()
+    key = (content_type_id, object_id)
+
+    deadline = time.monotonic() + (timeout if timeout is not None else get_wait_timeout())
+    generation = await sync_to_async(waiting_list.generation)(key)
+    position = await sync_to_async(waiting_list.join)(key, waiter)
+
+    while True:
+        if position is None:
+            return False, None
+
+        if position == 0 and await sync_to_async(is_lock_free_for)(ip_address, user, content_type_id, object_id):
+            await sync_to_async(waiting_list.leave)(key, waiter)
+            return True, 0
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False, position
+
+        wake_up = time.monotonic() + min(get_wait_poll_interval(), remaining)
+        current = generation
+
+        while current == generation and time.monotonic() < wake_up:
+            await asyncio.sleep(max(min(waiting_list.poll_interval, wake_up - time.monotonic()), 0))
+            current = await sync_to_async(waiting_list.generation)(key)
+
+        generation = current
+        # don't put back a waiter whose page was left while it waited
+        position = await sync_to_async(waiting_list.position)(key, waiter)
+
+
+def mark_lock_holder(request):
+    """
+    remembers in the session that the current user holds locks - so the middleware knows it has something to release.
+    the session is only written when the marker changes.
+    """
+    session = getattr(request, 'session', None)
+
+    if session is not None and is_holder_marker_enabled() and not session.get(LOCK_HOLDER_SESSION_KEY, False):
+        session[LOCK_HOLDER_SESSION_KEY] = True
+
+
+def is_lock_holder(request):
+    """
+    :return: False if the session tells the user holds no locks, True if they do or nobody knows (no session, marker
+             disabled)
+    """
+    session = getattr(request, 'session', None)
+
+    if session is None or not is_holder_marker_enabled():
+        return True
+
+    return session.get(LOCK_HOLDER_SESSION_KEY, False)
+
+
+def clear_lock_holder(request):
+    session = getattr(request, 'session', None)
+
+    if session is not None and LOCK_HOLDER_SESSION_KEY in session:
+        del session[LOCK_HOLDER_SESSION_KEY]
@@ -0,0 +1,78 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pessimist_locking.locking_services import get_pessimistic_lock_holder_ids, release_pessimistic_locks_of_users
+from importlib import import_module
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'releases the locks of users without a live session - run it after clearsessions (database sessions only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='count of sessions read per chunk (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        # locks touched from now on belong to users who just logged in or are still active - they are kept
+        started_at = timezone.now()
+
+        try:
+            holder_ids = get_pessimistic_lock_holder_ids()
+
+        except NotImplementedError:
+            raise CommandError("lock backend can't release locks of inactive users - its locks simply expire")
+
+        inactive_user_ids = self.get_inactive_user_ids(holder_ids, options['batch_size'])
+        count, _ = release_pessimistic_locks_of_users(inactive_user_ids, touched_before=started_at)
+
+        self.stdout.write('released {} locks of users without a live session'.format(count))
+
+    @staticmethod
+    def get_inactive_user_ids(holder_ids, batch_size):
+        """
+        :return: ids of lock holders without a live session - reads live sessions in chunks until all holders are found
+        """
+        session_store_class = import_module(settings.SESSION_ENGINE).SessionStore
+
+        if not hasattr(session_store_class, 'get_model_class'):
+            raise CommandError('session engine {} keeps no session table'.format(settings.SESSION_ENGINE))
+
+        inactive_user_ids = set(holder_ids)
+        if not inactive_user_ids:
+            return inactive_user_ids
+
+        session_store = session_store_class()
+        to_user_id = get_user_model()._meta.pk.to_python
+
+        session_data = session_store_class.get_model_class().objects.filter(
+            expire_date__gt=timezone.now()
+        ).values_list('session_data', flat=True)
+
+        for data in session_data.iterator(chunk_size=batch_size):
+            user_id = session_store.decode(data).get(SESSION_KEY)
+
+            if user_id is not None:
+                inactive_user_ids.discard(to_user_id(user_id))
+
+                if not inactive_user_ids:
+                    break
+
+        logger.debug("release_session_locks found %s lock holders without session", len(inactive_user_ids))
+        return inactive_user_ids
@@ -0,0 +1,70 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from pessimist_locking.locking_services import cleanup_outdated_pessimistic_locks
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'deletes outdated pessimistic locks in batches - to replace the inline cleanup (settings.LOCK_INLINE_CLEANUP)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='maximum count of locks deleted by a single statement (default: 1000)'
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='seconds to sleep between two batches (default: 0.1)'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='keep on sweeping every --interval seconds instead of sweeping once'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help='seconds between two sweeps in --loop mode (default: 60)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                deleted = self.sweep(options['batch_size'], options['pause'])
+                self.stdout.write('deleted {} outdated locks'.format(deleted))
+
+                if not options['loop']:
+                    break
+
+                # don't keep a connection open for the whole time of sleeping
+                close_old_connections()
+                time.sleep(options['interval'])
+
+        except KeyboardInterrupt:
+            logger.info("sweep_pessimistic_locks stopped")
+
+    @staticmethod
+    def sweep(batch_size, pause):
+        deleted = 0
+
+        while True:
+            count, _ = cleanup_outdated_pessimistic_locks(batch_size)
+            deleted += count
+            logger.debug("sweep_pessimistic_locks deleted batch of %s", count)
+
+            if count < batch_size:
+                return deleted
+
+            time.sleep(pause)
@@ -0,0 +1,117 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+try:
+    import prometheus_client
+
+except ImportError:
+    prometheus_client = None
+
+
+if prometheus_client is not None:
+    LOCK_ACQUISITIONS = prometheus_client.Counter(
+        'pessimist_locking_acquisitions', 'locks acquired - new locks and locks taken over from expired ones'
+    )
+    LOCK_RENEWALS = prometheus_client.Counter(
+        'pessimist_locking_renewals', 'locks renewed by their holder - on the change view or by the heartbeat'
+    )
+    LOCK_DENIALS = prometheus_client.Counter(
+        'pessimist_locking_denials', 'acquisitions denied with SoftPessimisticLockException'
+    )
+    LOCK_RELEASES = prometheus_client.Counter(
+        'pessimist_locking_releases', 'locks released by their holder'
+    )
+    LOCK_MIDDLEWARE_RELEASES = prometheus_client.Counter(
+        'pessimist_locking_middleware_releases', 'release passes run by the middleware', ['mode']
+    )
+    LOCK_CLEANUP_DELETED = prometheus_client.Counter(
+        'pessimist_locking_cleanup_deleted', 'outdated locks deleted by the cleanup'
+    )
+    LOCK_ACQUIRE_LATENCY = prometheus_client.Histogram(
+        'pessimist_locking_acquire_latency_seconds', 'time spent in the lock backend to acquire locks',
+        buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0)
+    )
+
+
+def is_metrics_available():
+    return prometheus_client is not None
+
+
+def count_acquired(locks, timestamp, duration):
+    """
+    counts locks returned by the lock backend as acquisitions or renewals - a renewed lock was created before timestamp
+
+    :param locks: locks acquired by one backend call
+    :param timestamp: datetime the locks were acquired at
+    :param duration: seconds the backend call took
+    """
+    if prometheus_client is None:
+        return
+
+    renewed = sum(1 for lock in locks if lock.created_at != timestamp)
+
+    LOCK_ACQUISITIONS.inc(len(locks) - renewed)
+    LOCK_RENEWALS.inc(renewed)
+    LOCK_ACQUIRE_LATENCY.observe(duration)
+
+
+def count_denied(duration):
+    if prometheus_client is None:
+        return
+
+    LOCK_DENIALS.inc()
+    LOCK_ACQUIRE_LATENCY.observe(duration)
+
+
+def count_renewed(count):
+    if prometheus_client is not None:
+        LOCK_RENEWALS.inc(count)
+
+
+def count_released(count):
+    if prometheus_client is not None:
+        LOCK_RELEASES.inc(count)
+
+
+def count_middleware_release(mode):
+    if prometheus_client is not None:
+        LOCK_MIDDLEWARE_RELEASES.labels(mode).inc()
+
+
+def count_cleanup_deleted(count):
+    if prometheus_client is not None:
+        LOCK_CLEANUP_DELETED.inc(count)
+
+
+def generate_metrics():
+    """
+    renders the lock metrics in prometheus text format. with PROMETHEUS_MULTIPROC_DIR set (gunicorn, uwsgi with more
+    than one worker) the metrics of all worker processes are aggregated from that directory - see the prometheus_client
+    documentation on multiprocess mode.
+
+    :return: body, content type
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    else:
+        registry = prometheus_client.REGISTRY
+
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
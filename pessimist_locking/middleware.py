@@ -8,13 +8,27 @@
 #     Copyright (c) 2019. All rights reserved.
 #
 ################################################################
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.contrib.auth import get_user_model
-from django.contrib.sessions.models import Session
-from django.urls import resolve
-from pessimist_locking.locking_services import release_pessimistic_locks_of_user
+from django.core.signals import setting_changed
+from pessimist_locking.conf import is_deferred_release_enabled, is_profiling_enabled
+from pessimist_locking.deferred import get_release_queue
+from pessimist_locking.locking_services import release_pessimistic_locks_of_user, is_lock_holder, clear_lock_holder
+from pessimist_locking.metrics import count_middleware_release
+from pessimist_locking.profiling import start_profile, stop_profile, add_profile_to_response
+from pessimist_locking.tracing import traced
 from pessimist_locking.utils import get_client_ip
+import asyncio
 import logging
+import re
+
+try:
+    from asgiref.sync import markcoroutinefunction
+
+except ImportError:  # asgiref < 3.6
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
 
 
 logger = logging.getLogger(__name__)
@@ -24,17 +38,62 @@ def get_lock_excluded_urls():
     return ['/jsi18n/', '/admin/jsi18n/', '/media/', '/static/', '/stats/', '/favicon.ico', '/login/', ] + getattr(settings, 'LOCK_EXCLUDE_URLS', [])
 
 
+_excluded_url_pattern = None
+
+
+def get_excluded_url_pattern():
+    """
+    compiles get_lock_excluded_urls (prefixes) and the excluded suffixes into a single regex. the pattern is built once
+    and rebuilt when settings.LOCK_EXCLUDE_URLS changes.
+    """
+    global _excluded_url_pattern
+
+    if _excluded_url_pattern is None:
+        prefixes = '|'.join(re.escape(url) for url in get_lock_excluded_urls())
+        _excluded_url_pattern = re.compile(r'^(?:{})|(?:-upload/|\.pdf)$'.format(prefixes))
+
+    return _excluded_url_pattern
+
+
+def reset_excluded_url_pattern(**kwargs):
+    global _excluded_url_pattern
+
+    if kwargs['setting'] == 'LOCK_EXCLUDE_URLS':
+        _excluded_url_pattern = None
+
+
+setting_changed.connect(reset_excluded_url_pattern)
+
+
+def has_change_permission_for_url(user, url_name):
+    """
+    admin change views are named <app_label>_<model_name>_change
+    """
+    app_label, _, model_name = url_name[:-len('_change')].rpartition('_')
+    return bool(app_label) and user.has_perm('{}.change_{}'.format(app_label, model_name))
+
+
 class SoftPessimisticLockReleaseMiddleware:
     """
-    middleware to listen for users current position
+    middleware to listen for users current position. works under WSGI and ASGI.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
 
+        if asyncio.iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
     def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+
         # Code to be executed for each request before
         # the view (and later middleware) are called.
+        profile_token = start_profile() if is_profiling_enabled() else None
 
         response = self.get_response(request)
 
@@ -42,50 +101,84 @@ class SoftPessimisticLockReleaseMiddleware:
         # the view is called.
         self.process_request(request)
 
+        if profile_token is not None:
+            add_profile_to_response(request, response, stop_profile(profile_token))
+
+        return response
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context - so views and the release record into this profile
+        profile_token = start_profile() if is_profiling_enabled() else None
+
+        response = await self.get_response(request)
+
+        # only hop to a thread if there might be something to release
+        if not self.is_excluded(request):
+            await sync_to_async(self.release_locks)(request)
+
+        if profile_token is not None:
+            add_profile_to_response(request, response, stop_profile(profile_token))
+
         return response
 
     def process_request(self, request):
-        excluded_urls = get_lock_excluded_urls()
+        """
+        releases the locks of the current user as soon as they leave the change view. works with what request already
+        knows - request.resolver_match and request.user - and checks the cheap conditions first, so requests that
+        don't need a release cost no query.
+        """
+        if not self.is_excluded(request):
+            self.release_locks(request)
 
-        client_ip = get_client_ip(request)
+        return None
+
+    @staticmethod
+    def is_excluded(request):
+        """
+        checks everything that can be told without session, user or database
+        """
         path_info = request.path_info
-        logger.debug("lock_handling_request_listener / client_ip: %s / path_info: %s", client_ip, path_info)
 
-        # TODO: improve here: startswith is not always the best … think about havin '/' in excluded_urls?!
-        if request.is_ajax() or any(path_info.startswith(x) for x in excluded_urls) or path_info.endswith('-upload/') or path_info.endswith('.pdf') or 'nolock' in request.GET.urlencode():
+        if request.META.get('HTTP_X_REQUESTED_WITH') == 'XMLHttpRequest' or \
+                get_excluded_url_pattern().search(path_info) or 'nolock' in request.META.get('QUERY_STRING', ''):
             logger.debug("url: %s is excluded from lock handling", path_info)
-            return None
+            return True
 
-        try:
-            logger.debug("%s is lock handling since not in exclude.list: %s", path_info, excluded_urls)
+        # not resolved (e.g. 404) - nothing to tell about users position
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None or resolver_match.url_name is None:
+            return True
 
-            cookie = request.COOKIES.get('sessionid')
-            if cookie is None:
-                logger.debug("no cookie")
-                return None
+        # heartbeats and friends come from the change view
+        return 'pessimist_locking' in resolver_match.namespaces
 
-            session = Session.objects.get(pk=cookie)
-            if session is None:
-                logger.debug("no session for cookie: %s", cookie)
-                return None
+    @staticmethod
+    @traced('pessimist_locking.middleware.release_locks')
+    def release_locks(request):
+        # nothing to release if the session never acquired a lock
+        if not is_lock_holder(request):
+            return
 
-            uid = session.get_decoded().get('_auth_user_id')
-            url_conf = resolve(path_info)
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return
 
-            if url_conf.url_name is not None:
-                url_name = url_conf.url_name
-                url_splitted = url_name.split('_')
+        url_name = request.resolver_match.url_name
+        if url_name.endswith('_change') and has_change_permission_for_url(user, url_name):
+            return
 
-                has_permission = False
-                if len(url_splitted) >= 2:
-                    permission_str = "{}_change_{}".format(url_splitted[0], url_splitted[1])
-                    has_permission = request.user.has_perm(permission_str)
+        try:
+            client_ip = get_client_ip(request)
+            logger.debug("release locks / client_ip: %s / path_info: %s", client_ip, request.path_info)
 
-                if not url_name.endswith('_change') or not has_permission:
-                    logger.debug("path: %s", path_info)
-                    release_pessimistic_locks_of_user(client_ip, get_user_model().objects.get(pk=uid))
+            if is_deferred_release_enabled():
+                get_release_queue().submit(client_ip, user)
+                count_middleware_release('deferred')
+            else:
+                release_pessimistic_locks_of_user(client_ip, user)
+                count_middleware_release('direct')
 
-        except:
-            logger.warning("failed to resolve url: %s", path_info, exc_info=True)
+            clear_lock_holder(request)
 
-        return None
+        except:
+            logger.warning("failed to release locks for url: %s", request.path_info, exc_info=True)
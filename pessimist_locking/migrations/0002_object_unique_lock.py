@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:29
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def delete_duplicate_locks(apps, schema_editor):
+    """
+    keeps only the latest lock per object so the unique constraint can be created
+    """
+    SoftPessimisticChangeLock = apps.get_model('pessimist_locking', 'SoftPessimisticChangeLock')
+    db_alias = schema_editor.connection.alias
+
+    duplicates = SoftPessimisticChangeLock.objects.using(db_alias).values('content_type_id', 'object_id').annotate(
+        lock_count=Count('id'), latest_id=Max('id')
+    ).filter(lock_count__gt=1)
+
+    for duplicate in duplicates:
+        SoftPessimisticChangeLock.objects.using(db_alias).filter(
+            content_type_id=duplicate['content_type_id'],
+            object_id=duplicate['object_id'],
+        ).exclude(id=duplicate['latest_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pessimist_locking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_locks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='softpessimisticchangelock',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id'), name='pessimist_locking_object_unique'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pessimist_locking', '0002_object_unique_lock'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='softpessimisticchangelock',
+            name='user_id',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='softpessimisticchangelock',
+            name='user_ip_address',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='softpessimisticchangelock',
+            index=models.Index(fields=['user_id', 'user_ip_address'], name='pessimist_lock_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='softpessimisticchangelock',
+            index=models.Index(fields=['updated_at', 'created_at'], name='pessimist_lock_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:42
+
+from django.db import migrations, models
+from django.db.models import DateTimeField, ExpressionWrapper, F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import timedelta
+
+
+def set_expires_at(apps, schema_editor):
+    """
+    expires_at = last touch (updated_at or created_at) + settings.LOCK_DURATION_MINUTES
+    """
+    from pessimist_locking.conf import get_lock_duration
+
+    SoftPessimisticChangeLock = apps.get_model('pessimist_locking', 'SoftPessimisticChangeLock')
+    locks = SoftPessimisticChangeLock.objects.using(schema_editor.connection.alias)
+
+    locks.update(expires_at=ExpressionWrapper(
+        Coalesce(F('updated_at'), F('created_at')) + timedelta(minutes=get_lock_duration()),
+        output_field=DateTimeField()
+    ))
+
+    # created_at is nullable - treat those as just touched
+    locks.filter(expires_at__isnull=True).update(expires_at=timezone.now() + timedelta(minutes=get_lock_duration()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pessimist_locking', '0003_lock_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='softpessimisticchangelock',
+            name='expires_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_expires_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='softpessimisticchangelock',
+            name='expires_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.RemoveIndex(
+            model_name='softpessimisticchangelock',
+            name='pessimist_lock_expiry_idx',
+        ),
+        migrations.AddIndex(
+            model_name='softpessimisticchangelock',
+            index=models.Index(fields=['expires_at'], name='pessimist_lock_expires_idx'),
+        ),
+    ]
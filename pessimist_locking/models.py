@@ -12,6 +12,7 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.utils import timezone
+from pessimist_locking.conf import get_expiry
 
 
 class SoftPessimisticChangeLock(models.Model):
@@ -21,15 +22,16 @@ class SoftPessimisticChangeLock(models.Model):
     database layer (such as select_for_update would produce). a lock is represented by the combination of: user_id,
     user_ip_address, content_type_id and instance_id. so a user concurrently logged in on multiple devices can be handled.
 
-    to model automatic timeouts the fields created_at and updated_at are used. they use of 2 fields was argued by easing
-    debugging and testing (compared to a single field 'timestamp').
+    to model automatic timeouts every write stores expires_at (last touch + settings.LOCK_DURATION_MINUTES), so expiry
+    checks are a single indexed range predicate. the fields created_at and updated_at are kept for easing debugging
+    and testing.
 
     model makes use of generic foreignkeys to separate this feature completely from other apps.
     """
 
-    user_id = models.PositiveIntegerField(null=False, blank=False, db_index=True)
+    user_id = models.PositiveIntegerField(null=False, blank=False)
 
-    user_ip_address = models.CharField(max_length=50, null=False, blank=False, db_index=True)
+    user_ip_address = models.CharField(max_length=50, null=False, blank=False)
 
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
 
@@ -41,6 +43,20 @@ class SoftPessimisticChangeLock(models.Model):
 
     updated_at = models.DateTimeField(null=True, blank=True, editable=False)
 
+    expires_at = models.DateTimeField(editable=False)
+
+    class Meta:
+        constraints = [
+            # there's only one lock per object - add_pessimistic_lock relies on it to acquire atomically
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='pessimist_locking_object_unique'),
+        ]
+        indexes = [
+            # release_pessimistic_locks_of_user
+            models.Index(fields=['user_id', 'user_ip_address'], name='pessimist_lock_user_idx'),
+            # expiry checks and cleanup
+            models.Index(fields=['expires_at'], name='pessimist_lock_expires_idx'),
+        ]
+
     # NOTE: MySQL 8.0.16 is the first version that supports CHECK constraints.
     # so this will not work for mysql … we need something else there are many legacy systems (with very old mysql)
     # to be supported.
@@ -70,6 +86,9 @@ class SoftPessimisticChangeLock(models.Model):
         if self.created_at is None:
             self.created_at = timezone.now()
 
+        if self.expires_at is None:
+            self.expires_at = get_expiry(self.updated_at or self.created_at)
+
         super(SoftPessimisticChangeLock, self).save(*args, **kwargs)
 
     def __str__(self):
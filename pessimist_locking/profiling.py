@@ -0,0 +1,107 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.db import connections, router
+import contextvars
+import json
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+_current_profile = contextvars.ContextVar('pessimist_locking_profile', default=None)
+
+
+class LockProfile:
+    """
+    time spent and queries issued by lock handling within one request - filled by tracing.traced for every service
+    call and the middleware's release pass while settings.LOCK_PROFILING is on. nested calls (e.g. the cleanup within
+    get_pessimistic_lock) are recorded on their own and within their caller.
+    """
+
+    def __init__(self):
+        # name -> [calls, seconds, queries]
+        self.timings = OrderedDict()
+
+    @contextmanager
+    def record(self, name):
+        from pessimist_locking.models import SoftPessimisticChangeLock
+
+        # entered before nested calls record - to keep the order of calls
+        timing = self.timings.setdefault(name, [0, 0.0, 0])
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connections[router.db_for_write(SoftPessimisticChangeLock)].execute_wrapper(count_queries):
+                yield
+
+        finally:
+            timing[0] += 1
+            timing[1] += time.perf_counter() - started
+            timing[2] += queries[0]
+
+    def as_dict(self):
+        return OrderedDict(
+            (name, {'calls': calls, 'ms': round(seconds * 1000, 3), 'queries': queries})
+            for name, (calls, seconds, queries) in self.timings.items()
+        )
+
+    def server_timing(self):
+        """
+        :return: value of a Server-Timing header - one metric per recorded name
+        """
+        return ', '.join(
+            '{};dur={:.3f};desc="calls={} queries={}"'.format(
+                'lock_' + name.rsplit('pessimist_locking.', 1)[-1].replace('.', '_'), seconds * 1000, calls, queries
+            )
+            for name, (calls, seconds, queries) in self.timings.items()
+        )
+
+
+def get_current_profile():
+    """
+    :return: LockProfile of the current request or None if profiling is off
+    """
+    return _current_profile.get()
+
+
+def start_profile():
+    return _current_profile.set(LockProfile())
+
+
+def stop_profile(token):
+    profile = _current_profile.get()
+    _current_profile.reset(token)
+    return profile
+
+
+def add_profile_to_response(request, response, profile):
+    """
+    sends profile as Server-Timing header and writes it as a json debug log line
+    """
+    if not profile.timings:
+        return
+
+    server_timing = profile.server_timing()
+    if response.has_header('Server-Timing'):
+        server_timing = '{}, {}'.format(response['Server-Timing'], server_timing)
+
+    response['Server-Timing'] = server_timing
+
+    logger.debug("lock profile %s", json.dumps({'path': request.path_info, 'timings': profile.as_dict()}))
@@ -0,0 +1,122 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib.admin.options import get_content_type_for_model
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+from pessimist_locking.models import SoftPessimisticChangeLock
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_lock_subquery(model, timestamp=None):
+    """
+    valid locks on the object of the outer query. hits the unique index on content_type/object_id.
+    """
+    if timestamp == None:
+        timestamp = timezone.now()
+
+    return SoftPessimisticChangeLock.objects.filter(
+        content_type_id=get_content_type_for_model(model).pk,
+        object_id=OuterRef('pk'),
+        expires_at__gt=timestamp
+    )
+
+
+def with_lock_info(queryset, timestamp=None):
+    """
+    annotates every object of queryset with the lock on it - within the same query, so listing locks costs no query
+    per row:
+
+    lock_user_id, lock_user_ip_address, lock_expires_at: taken from the lock or None if not locked
+    lock_username: username of the lock holder
+
+    the annotations are correlated subqueries - a count or pagination of the annotated queryset runs them as well. use
+    add_lock_info for the loaded page instead.
+
+    NOTE: only works with the database lock backend
+    """
+    locks = get_lock_subquery(queryset.model, timestamp)
+    user_model = get_user_model()
+
+    return queryset.annotate(
+        lock_user_id=Subquery(locks.values('user_id')[:1]),
+        lock_user_ip_address=Subquery(locks.values('user_ip_address')[:1]),
+        lock_expires_at=Subquery(locks.values('expires_at')[:1]),
+    ).annotate(
+        lock_username=Subquery(
+            user_model._default_manager.filter(pk=OuterRef('lock_user_id')).values(user_model.USERNAME_FIELD)[:1]
+        ),
+    )
+
+
+def add_lock_info(objects, timestamp=None):
+    """
+    sets the attributes of with_lock_info on objects already loaded - with one query for their locks and one for the
+    lock holders, no matter how many objects. for lists whose count runs as a query of its own (e.g. a changelist
+    page) - the count stays without lock subqueries then.
+
+    :param objects: model objects of the same model
+    :return: objects as list
+    NOTE: only works with the database lock backend
+    """
+    objects = list(objects)
+    if not objects:
+        return objects
+
+    if timestamp == None:
+        timestamp = timezone.now()
+
+    locks = {
+        lock.object_id: lock for lock in SoftPessimisticChangeLock.objects.filter(
+            content_type_id=get_content_type_for_model(objects[0]).pk,
+            object_id__in=[obj.pk for obj in objects],
+            expires_at__gt=timestamp
+        )
+    }
+    users = get_user_model()._default_manager.in_bulk({lock.user_id for lock in locks.values()})
+
+    for obj in objects:
+        lock = locks.get(obj.pk)
+        user = users.get(lock.user_id) if lock is not None else None
+
+        obj.lock_user_id = lock.user_id if lock is not None else None
+        obj.lock_user_ip_address = lock.user_ip_address if lock is not None else None
+        obj.lock_expires_at = lock.expires_at if lock is not None else None
+        obj.lock_username = user.get_username() if user is not None else None
+
+    return objects
+
+
+def exclude_locked(queryset, timestamp=None):
+    """
+    removes all objects from queryset that are locked by anybody.
+
+    NOTE: only works with the database lock backend
+    """
+    return queryset.annotate(
+        pessimistic_lock_exists=Exists(get_lock_subquery(queryset.model, timestamp))
+    ).filter(pessimistic_lock_exists=False)
+
+
+class SoftPessimisticLockQuerySet(models.QuerySet):
+    """
+    queryset to be used as manager of lockable models - e.g. objects = SoftPessimisticLockQuerySet.as_manager()
+    """
+
+    def with_lock_info(self, timestamp=None):
+        return with_lock_info(self, timestamp)
+
+    def exclude_locked(self, timestamp=None):
+        return exclude_locked(self, timestamp)
@@ -0,0 +1,33 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from pessimist_locking.conf import is_release_on_logout_enabled
+from pessimist_locking.locking_services import release_pessimistic_locks_of_user, is_lock_holder
+from pessimist_locking.utils import get_client_ip
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def release_locks_on_logout(sender, request, user, **kwargs):
+    """
+    user_logged_out receiver: releases the locks the user acquired from the ip address they log out from - other
+    devices keep their locks. connected by PessimistLockingConfig, turned off by settings.LOCK_RELEASE_ON_LOGOUT.
+    """
+    if not is_release_on_logout_enabled() or user is None or not is_lock_holder(request):
+        return
+
+    try:
+        release_pessimistic_locks_of_user(get_client_ip(request), user)
+
+    except Exception:
+        # never break a logout for locks - they expire anyway
+        logger.error("failed to release locks of logged-out user: %s", user, exc_info=True)
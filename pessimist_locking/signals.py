@@ -0,0 +1,30 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.dispatch import Signal
+
+
+# all signals are sent with sender=SoftPessimisticChangeLock - sending them without receivers costs next to nothing
+
+# a user got a new lock or took over an expired one - kwargs: lock, request, user
+lock_acquired = Signal()
+
+# the holder renewed their lock on a model (not sent for heartbeat renewals) - kwargs: lock, request, user
+lock_renewed = Signal()
+
+# the lock is held by another user - kwargs: lock (the conflicting lock), request, user
+lock_denied = Signal()
+
+# a user released locks - kwargs: user, ip_address, count. user and ip_address are None for locks released by
+# nobody in particular (admin force release, release_pessimistic_locks_of_users)
+lock_released = Signal()
+
+# the cleanup deleted outdated locks - kwargs: count
+locks_expired = Signal()
@@ -0,0 +1,76 @@
+/*
+ * keeps the locks of an open change form alive and releases the lock when the page is left without saving -
+ * see pessimist_locking.views.heartbeat and pessimist_locking.views.release
+ */
+(function() {
+    'use strict';
+
+    var config = document.getElementById('pessimist-locking-config');
+    if (!config) {
+        return;
+    }
+
+    function getCsrfToken() {
+        var input = document.querySelector('input[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    // last touch of the lock this page knows of - the release is ignored for a lock touched later (e.g. by a reload)
+    var touchedAt = config.dataset.touchedAt;
+
+    function heartbeat() {
+        // renew this page's lock only - the lock of a page closed in another tab stays releasable
+        var data = new FormData();
+        data.append('content_type_id', config.dataset.contentTypeId);
+        data.append('object_id', config.dataset.objectId);
+
+        window.fetch(config.dataset.heartbeatUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'X-CSRFToken': getCsrfToken(),
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: data
+        }).then(function(response) {
+            return response.ok ? response.json() : null;
+        }).then(function(data) {
+            if (data && data.renewed && touchedAt) {
+                touchedAt = data.touched_at;
+            }
+        });
+    }
+
+    var interval = parseInt(config.dataset.heartbeatInterval, 10);
+    if (config.dataset.heartbeatUrl && interval > 0) {
+        window.setInterval(heartbeat, interval * 1000);
+    }
+
+    // saving leads back to a page that decides about the lock itself - so don't release on submit
+    var submitting = false;
+    document.addEventListener('submit', function() {
+        submitting = true;
+    });
+
+    window.addEventListener('pagehide', function() {
+        // no lock acquired by this page - nothing to release
+        if (submitting || !touchedAt || !config.dataset.releaseUrl || !navigator.sendBeacon) {
+            return;
+        }
+
+        var data = new FormData();
+        data.append('csrfmiddlewaretoken', getCsrfToken());
+        data.append('content_type_id', config.dataset.contentTypeId);
+        data.append('object_id', config.dataset.objectId);
+        data.append('touched_at', touchedAt);
+        navigator.sendBeacon(config.dataset.releaseUrl, data);
+    });
+
+    // the lock was released when the page went into the back/forward cache - reload to acquire it again. a beacon
+    // arriving after the reload finds the lock touched later and keeps it
+    window.addEventListener('pageshow', function(event) {
+        if (event.persisted && config.dataset.releaseUrl) {
+            window.location.reload();
+        }
+    });
+})();
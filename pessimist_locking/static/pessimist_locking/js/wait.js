@@ -0,0 +1,73 @@
+/*
+ * waits for a locked change form - long-polls pessimist_locking.views.wait and reloads the change view as soon as the
+ * lock is free. leaving the page takes the waiter off the waiting list (pessimist_locking.views.leave)
+ */
+(function() {
+    'use strict';
+
+    var config = document.getElementById('pessimist-locking-wait');
+    if (!config) {
+        return;
+    }
+
+    var position = document.getElementById('pessimist-locking-position');
+
+    var url = config.dataset.waitUrl + '?' + new URLSearchParams({
+        content_type_id: config.dataset.contentTypeId,
+        object_id: config.dataset.objectId,
+        waiter: config.dataset.waiter
+    });
+
+    // the waiter already left the waiting list when told the lock is free
+    var opening = false;
+
+    function poll() {
+        window.fetch(url, {
+            credentials: 'same-origin',
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest'
+            }
+        }).then(function(response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.json();
+        }).then(function(data) {
+            if (data.free) {
+                opening = true;
+                window.location.reload();
+                return;
+            }
+
+            if (position) {
+                position.textContent = data.position + 1;
+            }
+            poll();
+        }).catch(function() {
+            // server gone or restarting - don't hammer it
+            window.setTimeout(poll, 5000);
+        });
+    }
+
+    window.addEventListener('pagehide', function() {
+        if (opening || !navigator.sendBeacon) {
+            return;
+        }
+
+        var data = new FormData();
+        data.append('csrfmiddlewaretoken', config.querySelector('[name=csrfmiddlewaretoken]').value);
+        data.append('content_type_id', config.dataset.contentTypeId);
+        data.append('object_id', config.dataset.objectId);
+        data.append('waiter', config.dataset.waiter);
+        navigator.sendBeacon(config.dataset.leaveUrl, data);
+    });
+
+    // the page left the waiting list when it went into the back/forward cache - reload to get in line again
+    window.addEventListener('pageshow', function(event) {
+        if (event.persisted) {
+            window.location.reload();
+        }
+    });
+
+    poll();
+})();
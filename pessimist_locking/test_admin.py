@@ -0,0 +1,179 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.db import connection
+from django.template.response import TemplateResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch
+from django.utils import timezone
+from pessimist_locking.admin import SoftPessimisticChangeLockAdmin, SoftPessimisticChangeLockModelAdmin
+from pessimist_locking.locking_services import add_pessimistic_lock
+from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.signals import lock_released, locks_expired
+from datetime import timedelta
+import pessimist_locking.admin
+import pytest
+
+
+@pytest.fixture
+def lock_admin():
+    return SoftPessimisticChangeLockAdmin(SoftPessimisticChangeLock, admin.site)
+
+
+@pytest.fixture
+def superuser(db):
+    return get_user_model().objects.create_superuser(username='ops', email='ops@example.com', password='ops')
+
+
+def make_request(user, query=None):
+    request = RequestFactory().get('/admin/pessimist_locking/softpessimisticchangelock/', query or {})
+    request.user = user
+    request.session = {}
+    request._messages = FallbackStorage(request)
+    return request
+
+
+def create_locks(count, expires_in=timedelta(minutes=5)):
+    now = timezone.now()
+    locked_content_types = SoftPessimisticChangeLock.objects.filter(
+        content_type=ContentType.objects.get_for_model(ContentType)
+    ).values('object_id')
+    targets = [ContentType.objects.exclude(id__in=locked_content_types).first()] + [
+        Group.objects.create(name='group-{}-{}'.format(count, i)) for i in range(count - 1)
+    ]
+    for i, target in enumerate(targets):
+        user = get_user_model().objects.create_user(username='user-{}-{}'.format(count, i))
+        SoftPessimisticChangeLock.objects.create(
+            user_id=user.id, user_ip_address='127.0.0.1', content_object=target, expires_at=now + expires_in
+        )
+
+
+def render_changelist_rows(lock_admin, request):
+    with CaptureQueriesContext(connection) as queries:
+        changelist = lock_admin.get_changelist_instance(request)
+        rows = [[str(getattr(lock_admin, column)(lock)) if hasattr(lock_admin, column) else getattr(lock, column)
+                 for column in lock_admin.list_display] for lock in changelist.result_list]
+    return rows, len(queries)
+
+
+def test_lock_admin_is_registered():
+    assert isinstance(admin.site._registry[SoftPessimisticChangeLock], SoftPessimisticChangeLockAdmin)
+
+
+def test_changelist_queries_do_not_grow_with_rows(lock_admin, superuser):
+    create_locks(2)
+    small_rows, small_queries = render_changelist_rows(lock_admin, make_request(superuser))
+
+    create_locks(20)
+    rows, queries = render_changelist_rows(lock_admin, make_request(superuser))
+
+    assert len(small_rows) == 2
+    assert len(rows) == 22
+    assert queries == small_queries
+    assert all(row[1] != 'None' and not row[3].isdigit() for row in rows)
+
+
+def test_expiry_filter(lock_admin, superuser):
+    create_locks(2)
+    create_locks(4, expires_in=-timedelta(minutes=5))
+
+    assert lock_admin.get_changelist_instance(make_request(superuser, {'expired': '1'})).result_count == 4
+    assert lock_admin.get_changelist_instance(make_request(superuser, {'expired': '0'})).result_count == 2
+
+
+def test_actions_replace_delete_selected(lock_admin, superuser):
+    actions = lock_admin.get_actions(make_request(superuser))
+
+    assert 'delete_selected' not in actions
+    assert {'force_release', 'purge_expired'} <= set(actions)
+
+
+def test_force_release_is_one_delete(lock_admin, superuser):
+    create_locks(6)
+    request = make_request(superuser)
+
+    with CaptureQueriesContext(connection) as queries:
+        lock_admin.force_release(request, SoftPessimisticChangeLock.objects.all())
+
+    assert [query['sql'].startswith('DELETE') for query in queries] == [True]
+    assert not SoftPessimisticChangeLock.objects.exists()
+
+
+def test_purge_expired_keeps_valid_locks(lock_admin, superuser):
+    create_locks(2)
+    create_locks(4, expires_in=-timedelta(minutes=5))
+    request = make_request(superuser)
+
+    with CaptureQueriesContext(connection) as queries:
+        lock_admin.purge_expired(request, SoftPessimisticChangeLock.objects.all())
+
+    assert len(queries) == 1
+    assert SoftPessimisticChangeLock.objects.count() == 2
+
+
+def test_deleted_locks_are_signalled(lock_admin, superuser):
+    create_locks(2)
+    create_locks(3, expires_in=-timedelta(minutes=5))
+
+    received = []
+
+    def receiver(sender, signal, **kwargs):
+        received.append((signal, kwargs))
+
+    lock_released.connect(receiver)
+    locks_expired.connect(receiver)
+    try:
+        lock_admin.purge_expired(make_request(superuser), SoftPessimisticChangeLock.objects.all())
+        lock_admin.force_release(make_request(superuser), SoftPessimisticChangeLock.objects.all())
+
+    finally:
+        lock_released.disconnect(receiver)
+        locks_expired.disconnect(receiver)
+
+    # like the cleanup and a release by nobody in particular
+    assert received == [
+        (locks_expired, {'count': 3}),
+        (lock_released, {'user': None, 'ip_address': None, 'count': 2}),
+    ]
+
+
+def test_change_form_load_touches_lock(monkeypatch):
+    def no_release_url(name):
+        raise NoReverseMatch(name)
+
+    monkeypatch.setattr(pessimist_locking.admin, 'reverse', no_release_url)
+    assert not SoftPessimisticChangeLockModelAdmin.is_page_touch_needed(RequestFactory().get('/'))
+
+    monkeypatch.setattr(pessimist_locking.admin, 'reverse', lambda name: '/locking/release/')
+    assert SoftPessimisticChangeLockModelAdmin.is_page_touch_needed(RequestFactory().get('/'))
+    assert not SoftPessimisticChangeLockModelAdmin.is_page_touch_needed(RequestFactory().post('/'))
+
+
+def test_change_form_knows_lock_touched_at(superuser):
+    target = ContentType.objects.get_for_model(Group)
+    request = make_request(superuser)
+    lock = add_pessimistic_lock(request, superuser, target)
+
+    response = TemplateResponse(request, 'admin/pessimist_locking/change_form.html', {'original': target})
+    SoftPessimisticChangeLockModelAdmin.add_lock_touched_at(request, response)
+
+    assert response.context_data['pessimist_locking_touched_at'] == lock.created_at.isoformat()
+
+    # nothing locked within this request
+    response = TemplateResponse(request, 'admin/pessimist_locking/change_form.html', {'original': superuser})
+    SoftPessimisticChangeLockModelAdmin.add_lock_touched_at(request, response)
+
+    assert 'pessimist_locking_touched_at' not in response.context_data
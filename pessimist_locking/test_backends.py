@@ -0,0 +1,453 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.db.backends.mysql.operations import DatabaseOperations as MySQLOperations
+from django.test import override_settings
+from django.utils import timezone
+from pessimist_locking.backends import CacheLockBackend, DatabaseLockBackend, SharedMemoryLockBackend
+from pessimist_locking.conf import get_lock_backend
+from pessimist_locking.exceptions import SoftPessimisticLockException, LockBackendFullError
+from pessimist_locking.lock_table import LockEntry, LockTableFullError, SharedLockTable
+from pessimist_locking.locking_services import add_pessimistic_lock, add_pessimistic_locks, \
+    get_pessimistic_lock_for_model, release_pessimistic_locks, release_pessimistic_locks_of_user
+from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.testing import make_request
+from datetime import timedelta, timezone as datetime_timezone
+from types import SimpleNamespace
+import os
+import pytest
+import threading
+
+
+CACHE_BACKEND_SETTINGS = {
+    'LOCK_BACKEND': 'pessimist_locking.backends.CacheLockBackend',
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pessimist-locking-tests',
+        }
+    },
+}
+
+
+@pytest.fixture
+def cache_backend():
+    with override_settings(**CACHE_BACKEND_SETTINGS):
+        backend = get_lock_backend()
+        backend.cache.clear()
+        yield backend
+
+
+def test_default_backend():
+    assert isinstance(get_lock_backend(), DatabaseLockBackend)
+
+
+@pytest.mark.django_db
+def test_cache_backend_acquire_and_renew(cache_backend, users):
+    assert isinstance(cache_backend, CacheLockBackend)
+
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    current_time = timezone.now()
+
+    lock = add_pessimistic_lock(make_request(), users[0], model, current_time)
+    assert lock.user_id == users[0].pk
+    assert lock.created_at == current_time
+    assert lock.updated_at is None
+
+    renewed = add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=1))
+    assert renewed.created_at == current_time
+    assert renewed.updated_at == current_time + timedelta(minutes=1)
+
+    found = get_pessimistic_lock_for_model(model)
+    assert found.user_id == users[0].pk
+
+    # nothing went to the database
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+
+@pytest.mark.django_db
+@override_settings(LOCK_RENEWAL_THRESHOLD_SECONDS=120)
+def test_cache_backend_renewal_threshold(cache_backend, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    current_time = timezone.now()
+
+    add_pessimistic_lock(make_request(), users[0], model, current_time)
+
+    fresh = add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=1))
+    assert fresh.updated_at is None
+    assert fresh.expires_at == current_time + timedelta(minutes=5)
+    assert cache_backend.renew_locks_of_user(users[0].pk, '127.0.0.1', current_time + timedelta(minutes=2)) == 0
+
+    renewed = add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=4))
+    assert renewed.expires_at == current_time + timedelta(minutes=9)
+
+
+@pytest.mark.django_db
+def test_cache_backend_denies_other_user(cache_backend, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+
+    add_pessimistic_lock(make_request(), users[0], model)
+
+    with pytest.raises(SoftPessimisticLockException) as e:
+        add_pessimistic_lock(make_request(), users[1], model)
+    assert e.value.lock.user_id == users[0].pk
+
+    # same user on another device is another lock holder
+    with pytest.raises(SoftPessimisticLockException):
+        add_pessimistic_lock(make_request(ip_address='10.0.0.1'), users[0], model)
+
+
+@pytest.mark.django_db
+def test_cache_backend_takes_over_outdated_lock(cache_backend, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    current_time = timezone.now()
+
+    add_pessimistic_lock(make_request(), users[0], model, current_time - timedelta(minutes=10))
+
+    lock = add_pessimistic_lock(make_request(), users[1], model, current_time)
+    assert lock.user_id == users[1].pk
+    assert lock.created_at == current_time
+
+
+@pytest.mark.django_db
+def test_cache_backend_interleaved_takeovers(cache_backend, users, monkeypatch):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    current_time = timezone.now()
+    third = get_user_model().objects.create_user(username='editor3')
+
+    add_pessimistic_lock(make_request(), users[0], model, current_time - timedelta(minutes=10))
+
+    cache = cache_backend.cache
+    interleave = []
+
+    class InterleavingCache:
+        """
+        runs the other editor's acquisition right after the first get() - both have read the outdated lock then
+        """
+        def __getattr__(self, name):
+            return getattr(cache, name)
+
+        def get(self, key, *args):
+            value = cache.get(key, *args)
+            while interleave:
+                interleave.pop()()
+            return value
+
+    monkeypatch.setattr(CacheLockBackend, 'cache', property(lambda self: InterleavingCache()))
+    monkeypatch.setattr(CacheLockBackend, 'acquire_retry_delay', 0)
+
+    taken_over = []
+    interleave.append(lambda: taken_over.append(add_pessimistic_lock(make_request(), third, model, current_time)))
+
+    with pytest.raises(SoftPessimisticLockException) as e:
+        add_pessimistic_lock(make_request(), users[1], model, current_time)
+
+    assert taken_over[0].user_id == third.pk
+    assert e.value.lock.user_id == third.pk
+    assert get_pessimistic_lock_for_model(model).user_id == third.pk
+
+
+@pytest.mark.django_db
+def test_cache_backend_release(cache_backend, users):
+    model1 = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    model2 = ContentType.objects.get_for_model(ContentType)
+
+    add_pessimistic_lock(make_request(), users[0], model1)
+    add_pessimistic_lock(make_request(), users[0], model2)
+
+    assert release_pessimistic_locks_of_user('10.0.0.1', users[0])[0] == 0
+    assert release_pessimistic_locks_of_user('127.0.0.1', users[0])[0] == 2
+
+    assert get_pessimistic_lock_for_model(model1) is None
+    assert add_pessimistic_lock(make_request(), users[1], model2).user_id == users[1].pk
+
+
+@pytest.mark.django_db
+def test_cache_backend_bulk(cache_backend, users):
+    objects = list(ContentType.objects.all()[:5])
+
+    add_pessimistic_lock(make_request(), users[1], objects[2])
+
+    with pytest.raises(SoftPessimisticLockException) as e:
+        add_pessimistic_locks(make_request(), users[0], objects)
+    assert [lock.object_id for lock in e.value.locks] == [objects[2].pk]
+
+    # all or nothing
+    assert get_pessimistic_lock_for_model(objects[0]) is None
+
+    release_pessimistic_locks('127.0.0.1', users[1], objects)
+    assert len(add_pessimistic_locks(make_request(), users[0], objects)) == 5
+
+
+@pytest.fixture
+def shared_memory_backend(tmp_path):
+    with override_settings(LOCK_BACKEND='pessimist_locking.backends.SharedMemoryLockBackend',
+                           LOCK_SHARED_MEMORY_PATH=str(tmp_path / 'locks'), LOCK_SHARED_MEMORY_SLOTS=8):
+        backend = get_lock_backend()
+        yield backend
+        backend.table.close()
+
+
+@pytest.mark.django_db
+def test_shared_memory_backend(shared_memory_backend, users, django_assert_num_queries):
+    assert isinstance(shared_memory_backend, SharedMemoryLockBackend)
+
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    current_time = timezone.now()
+
+    with django_assert_num_queries(0):
+        lock = add_pessimistic_lock(make_request(), users[0], model, current_time)
+    assert lock.user_id == users[0].pk
+    assert lock.user_ip_address == '127.0.0.1'
+    assert lock.created_at == current_time
+    assert lock.updated_at is None
+    assert lock.expires_at == current_time + timedelta(minutes=5)
+
+    renewed = add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=1))
+    assert renewed.created_at == current_time
+    assert renewed.updated_at == current_time + timedelta(minutes=1)
+
+    with pytest.raises(SoftPessimisticLockException) as e:
+        add_pessimistic_lock(make_request(), users[1], model, current_time + timedelta(minutes=2))
+    assert e.value.lock.user_id == users[0].pk
+
+    assert get_pessimistic_lock_for_model(model).user_id == users[0].pk
+
+    taken_over = add_pessimistic_lock(make_request(), users[1], model, current_time + timedelta(minutes=7))
+    assert taken_over.user_id == users[1].pk
+
+    assert release_pessimistic_locks_of_user('127.0.0.1', users[0])[0] == 0
+    assert release_pessimistic_locks_of_user('127.0.0.1', users[1])[0] == 1
+    assert get_pessimistic_lock_for_model(model) is None
+
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend_fixture', [None, 'shared_memory_backend'])
+def test_release_locks_of_users(request, backend_fixture, users, django_assert_max_num_queries):
+    backend = request.getfixturevalue(backend_fixture) if backend_fixture else get_lock_backend()
+    models = list(ContentType.objects.all()[:3])
+    current_time = timezone.now()
+
+    add_pessimistic_lock(make_request(), users[0], models[0], current_time)
+    add_pessimistic_lock(make_request(ip_address='10.0.0.1'), users[0], models[1], current_time)
+    add_pessimistic_lock(make_request(), users[1], models[2], current_time + timedelta(seconds=1))
+
+    assert backend.get_lock_holder_ids() == {users[0].pk, users[1].pk}
+
+    # one DELETE for the database backend - no matter how many users
+    with django_assert_max_num_queries(1):
+        assert backend.release_locks_of_users({users[0].pk, users[1].pk, 4711}, current_time)[0] == 2
+
+    assert get_pessimistic_lock_for_model(models[0]) is None
+    assert get_pessimistic_lock_for_model(models[1]) is None
+    assert get_pessimistic_lock_for_model(models[2]).user_id == users[1].pk
+
+    assert backend.release_locks_of_users(set())[0] == 0
+    assert backend.release_locks_of_users({users[1].pk})[0] == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend_fixture', [None, 'cache_backend', 'shared_memory_backend'])
+def test_renew_locks(request, backend_fixture, users, django_assert_max_num_queries):
+    backend = request.getfixturevalue(backend_fixture) if backend_fixture else get_lock_backend()
+    models = list(ContentType.objects.order_by('pk')[:2])
+    keys = [(ContentType.objects.get_for_model(ContentType).pk, model.pk) for model in models]
+    current_time = timezone.now()
+
+    for model in models:
+        add_pessimistic_lock(make_request(), users[0], model, current_time)
+
+    # one UPDATE for the database backend
+    with django_assert_max_num_queries(1):
+        assert backend.renew_locks(keys[:1], users[0].pk, '127.0.0.1', current_time + timedelta(minutes=1)) == 1
+
+    assert backend.renew_locks(keys, users[1].pk, '127.0.0.1', current_time + timedelta(minutes=1)) == 0
+    assert backend.renew_locks(keys, users[0].pk, '10.0.0.1', current_time + timedelta(minutes=1)) == 0
+    assert backend.renew_locks([], users[0].pk, '127.0.0.1', current_time + timedelta(minutes=1)) == 0
+
+    # the other lock stays untouched
+    assert get_pessimistic_lock_for_model(models[0]).updated_at == current_time + timedelta(minutes=1)
+    assert get_pessimistic_lock_for_model(models[1]).updated_at is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend_fixture', ['cache_backend', 'shared_memory_backend'])
+def test_coalesced_renewal_writes_nothing(request, backend_fixture, users):
+    backend = request.getfixturevalue(backend_fixture)
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    key = (ContentType.objects.get_for_model(ContentType).pk, model.pk)
+    current_time = timezone.now()
+
+    # within the backend fixture's settings - they are restored after the test
+    with override_settings(LOCK_RENEWAL_THRESHOLD_SECONDS=120):
+        add_pessimistic_lock(make_request(), users[0], model, current_time)
+
+        coalesced = backend.acquire_lock(*key, users[0].pk, '127.0.0.1', current_time + timedelta(seconds=6))
+        assert coalesced.updated_at is None
+        assert backend.renew_locks_of_user(users[0].pk, '127.0.0.1', current_time + timedelta(seconds=7)) == 0
+
+        # a release requested after the lock was created but before the coalesced renewal still releases it
+        assert backend.release_locks([key], users[0].pk, '127.0.0.1', current_time + timedelta(seconds=5))[0] == 1
+
+        add_pessimistic_lock(make_request(), users[0], model, current_time)
+
+        # a forced renewal touches the lock - releases requested before keep it
+        forced = backend.acquire_lock(*key, users[0].pk, '127.0.0.1', current_time + timedelta(seconds=6), True)
+        assert forced.updated_at == current_time + timedelta(seconds=6)
+        assert backend.release_locks([key], users[0].pk, '127.0.0.1', current_time + timedelta(seconds=5))[0] == 0
+
+        lock = get_pessimistic_lock_for_model(model, current_time + timedelta(seconds=11))
+        assert lock.updated_at == current_time + timedelta(seconds=6)
+        assert lock.expires_at == current_time + timedelta(seconds=6, minutes=5)
+
+
+@pytest.mark.parametrize('renewal_window', [None, timedelta(minutes=2)])
+def test_mysql_upsert_sql(renewal_window):
+    # no mysql here - render the statement with mysql's quoting and datetime adaption
+    connection = SimpleNamespace(timezone=datetime_timezone.utc)
+    connection.ops = MySQLOperations(connection)
+    current_time = timezone.now()
+
+    sql, params = DatabaseLockBackend._upsert_sql_mysql(
+        connection, 1, 2, 3, '127.0.0.1', current_time, current_time + renewal_window if renewal_window else None
+    )
+    assignments = sql.split(' ON DUPLICATE KEY UPDATE ')[1].split(' END, ')
+
+    # mysql assigns left to right - expires_at goes last so every CASE before reads the old one
+    assert [assignment.split('`')[1] for assignment in assignments] == [
+        'user_id', 'user_ip_address', 'created_at', 'updated_at', 'expires_at'
+    ]
+    assert all(assignment.split(' = ', 1)[1].startswith('CASE WHEN `expires_at` <= %s ') for assignment in assignments)
+    assert sql.count('%s') == len(params) == (13 if renewal_window else 11)
+    # raw sql bypasses the field adaption
+    assert all(not isinstance(param, type(current_time)) for param in params)
+
+
+def test_shared_lock_table_slots(tmp_path):
+    table = SharedLockTable(str(tmp_path / 'locks'), 4)
+    current_time = timezone.now()
+
+    def entry(object_id, user_id=1, timestamp=current_time):
+        return LockEntry(1, object_id, user_id, '127.0.0.1', timestamp, None, timestamp + timedelta(minutes=5))
+
+    for object_id in range(4):
+        assert table.acquire(entry(object_id)).user_id == 1
+
+    with pytest.raises(LockTableFullError):
+        table.acquire(entry(4))
+
+    # released and expired slots are reused - the other locks are still found
+    assert table.release([(1, 1)], 1, '127.0.0.1') == 1
+    assert table.acquire(entry(4, user_id=2)).user_id == 2
+
+    assert table.get(1, 4, current_time).user_id == 2
+    assert table.get(1, 1, current_time) is None
+
+    # all locks expired - one of them makes room
+    later = current_time + timedelta(minutes=10)
+    assert table.acquire(entry(5, user_id=3, timestamp=later)).user_id == 3
+    assert table.get(1, 5, later).user_id == 3
+
+    assert table.cleanup(later) == 3
+    assert table.release_of_user(3, '127.0.0.1') == 1
+    table.close()
+
+
+def test_shared_lock_table_between_processes(tmp_path):
+    path = str(tmp_path / 'locks')
+    current_time = timezone.now()
+    entry = LockEntry(1, 1, 1, '127.0.0.1', current_time, None, current_time + timedelta(minutes=5))
+
+    table = SharedLockTable(path, 8)
+    table.acquire(entry)
+
+    pid = os.fork()
+    if pid == 0:
+        # the child sees the parent's lock and can't take it
+        code = 0 if table.acquire(entry._replace(user_id=2)).user_id == 1 else 1
+        table.acquire(entry._replace(object_id=2, user_id=2))
+        os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert table.get(1, 2, current_time).user_id == 2
+    table.close()
+
+
+def test_shared_lock_table_first_use_from_threads(tmp_path):
+    table = SharedLockTable(str(tmp_path / 'locks'), 64)
+    current_time = timezone.now()
+    barrier = threading.Barrier(8)
+    winners = []
+
+    def acquire(user_id):
+        barrier.wait()
+        entry = LockEntry(1, 1, user_id, '127.0.0.1', current_time, None, current_time + timedelta(minutes=5))
+        if table.acquire(entry).user_id == user_id:
+            winners.append(user_id)
+
+    threads = [threading.Thread(target=acquire, args=(user_id,)) for user_id in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(winners) == 1
+    table.close()
+
+
+def test_shared_lock_table_ip_addresses(tmp_path):
+    table = SharedLockTable(str(tmp_path / 'locks'), 8)
+    current_time = timezone.now()
+
+    def entry(ip_address):
+        return LockEntry(1, 1, 1, ip_address, current_time, None, current_time + timedelta(minutes=5))
+
+    # stored as given - never silently truncated
+    with pytest.raises(ValueError):
+        table.acquire(entry('1' * 49))
+    with pytest.raises(ValueError):
+        table.acquire(entry('fe80::1%ethä'))
+
+    ip_address = 'ffff:ffff:ffff:ffff:ffff:ffff:255.255.255.255'
+    assert table.acquire(entry(ip_address)).user_ip_address == ip_address
+
+    assert table.release_of_user(1, '1' * 49) == 0
+    assert table.release_of_user(1, ip_address) == 1
+    table.close()
+
+
+@pytest.mark.django_db
+def test_shared_memory_backend_full(shared_memory_backend, users):
+    models = [Group.objects.create(name='group-{}'.format(i)) for i in range(9)]
+
+    add_pessimistic_lock(make_request(), users[1], models[0])
+
+    # 8 slots - the 8 locks taken before the table ran full are rolled back
+    with pytest.raises(LockBackendFullError):
+        add_pessimistic_locks(make_request(), users[0], models[1:])
+
+    assert [get_pessimistic_lock_for_model(model) is not None for model in models] == [True] + [False] * 8
+
+
+@pytest.mark.django_db
+def test_shared_memory_backend_skips_inline_cleanup(shared_memory_backend, users, monkeypatch):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    add_pessimistic_lock(make_request(), users[0], model, timezone.now() - timedelta(minutes=10))
+
+    monkeypatch.setattr(shared_memory_backend.table, 'cleanup', lambda *args: pytest.fail('cleanup on lookup'))
+
+    assert get_pessimistic_lock_for_model(model) is None
+    assert add_pessimistic_lock(make_request(), users[1], model).user_id == users[1].pk
@@ -8,11 +8,22 @@
 #     Copyright (c) 2019. All rights reserved.
 #
 ################################################################
-from django.db import transaction, IntegrityError
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.db import connection, transaction, IntegrityError
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
 from django.utils import timezone
+from pessimist_locking import deferred
+from pessimist_locking.backends import DatabaseLockBackend
+from pessimist_locking.deferred import DeferredReleaseQueue
+from pessimist_locking.exceptions import SoftPessimisticLockException
 from pessimist_locking.locking_services import get_lock_duration, cleanup_outdated_pessimistic_locks, \
-    get_pessimistic_lock
+    get_pessimistic_lock, add_pessimistic_lock, add_pessimistic_locks, release_pessimistic_locks, \
+    renew_pessimistic_locks_of_user, get_pessimistic_lock_for_model, CLEANUP_LEASE_CACHE_KEY
 from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.testing import make_request
 from datetime import timedelta
 import pytest
 
@@ -69,7 +80,7 @@ def test_cleanup_created_at():
     createdat_tobe_deleted_1 = SoftPessimisticChangeLock(
         user_id=1,
         content_type_id=1,
-        object_id=1,
+        object_id=2,
         user_ip_address="127.0.0.1",
         created_at=current_time - timedelta(minutes=5)
     )
@@ -80,7 +91,7 @@ def test_cleanup_created_at():
     createdat_tobe_deleted_2 = SoftPessimisticChangeLock(
         user_id=1,
         content_type_id=1,
-        object_id=1,
+        object_id=3,
         user_ip_address="127.0.0.1",
         created_at=current_time - timedelta(minutes=15)
     )
@@ -91,7 +102,7 @@ def test_cleanup_created_at():
     createdat_tobe_not_deleted_1 = SoftPessimisticChangeLock(
         user_id=1,
         content_type_id=1,
-        object_id=1,
+        object_id=4,
         user_ip_address="127.0.0.1",
         created_at=current_time - timedelta(minutes=4)
     )
@@ -134,7 +145,7 @@ def test_cleanup_updated_at():
     updatedat_tobe_deleted1 = SoftPessimisticChangeLock(
         user_id=1,
         content_type_id=1,
-        object_id=1,
+        object_id=2,
         user_ip_address="127.0.0.1",
         created_at=current_time - timedelta(minutes=40),  # outdated
         updated_at=current_time - timedelta(minutes=5)  # at the threshold
@@ -146,7 +157,7 @@ def test_cleanup_updated_at():
     updatedat_tobe_deleted2 = SoftPessimisticChangeLock(
         user_id=1,
         content_type_id=1,
-        object_id=1,
+        object_id=3,
         user_ip_address="127.0.0.1",
         created_at=current_time - timedelta(minutes=40),  # outdated
         updated_at=current_time - timedelta(minutes=30)
@@ -230,7 +241,7 @@ def test_getter_singleresult():
     # create timestamp
     current_time = timezone.now()
 
-    # now lets create 2 valid locks - that could only be possible as manual db-insert or programming error
+    # a second lock on the same object is rejected by the database
     lock1 = SoftPessimisticChangeLock.objects.create(
         user_id=1,
         content_type_id=2,
@@ -243,25 +254,23 @@ def test_getter_singleresult():
     assert lock1.created_at is not None
     assert lock1.updated_at is None
 
-    lock2 = SoftPessimisticChangeLock.objects.create(
-        user_id=1,
-        content_type_id=2,
-        object_id=2,
-        user_ip_address="127.0.0.1",
-        created_at=current_time - timedelta(minutes=2)
-    )
-
-    assert lock2.id is not None
-    assert lock2.created_at is not None
-    assert lock2.updated_at is None
+    with pytest.raises(IntegrityError):
+        with transaction.atomic():
+            SoftPessimisticChangeLock.objects.create(
+                user_id=2,
+                content_type_id=2,
+                object_id=2,
+                user_ip_address="127.0.0.1",
+                created_at=current_time - timedelta(minutes=2)
+            )
 
-    assert SoftPessimisticChangeLock.objects.count() == 2
+    assert SoftPessimisticChangeLock.objects.count() == 1
 
     lock = get_pessimistic_lock(content_type_id=2, object_id=2, timestamp=current_time)
 
-    assert lock is not None
+    assert lock == lock1
     assert isinstance(lock, SoftPessimisticChangeLock)
-    assert SoftPessimisticChangeLock.objects.count() == 2
+    assert SoftPessimisticChangeLock.objects.count() == 1
 
 
 @pytest.mark.django_db
@@ -274,7 +283,7 @@ def test_getter_createdat():
     lock1 = SoftPessimisticChangeLock.objects.create(
         user_id=1,
         content_type_id=4,
-        object_id=4,
+        object_id=6,
         user_ip_address="127.0.0.1",
         created_at=current_time - timedelta(minutes=6)
     )
@@ -317,7 +326,7 @@ def test_getter_updatedat():
     lock1 = SoftPessimisticChangeLock.objects.create(
         user_id=1,
         content_type_id=5,
-        object_id=5,
+        object_id=7,
         user_ip_address="127.0.0.1",
         created_at=current_time - timedelta(minutes=60),
         updated_at=current_time - timedelta(minutes=10)
@@ -352,3 +361,239 @@ def test_getter_updatedat():
     assert lock is not None
     assert SoftPessimisticChangeLock.objects.count() == 2
     assert lock == lock2
+
+
+@pytest.fixture(params=[True, False], ids=['upsert', 'select_for_update'])
+def acquire_path(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(DatabaseLockBackend, '_supports_upsert', staticmethod(lambda connection: False))
+    return request.param
+
+
+def test_add_lock(acquire_path, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    current_time = timezone.now()
+
+    lock = add_pessimistic_lock(make_request(), users[0], model, current_time)
+    assert lock.id is not None
+    assert lock.user_id == users[0].pk
+    assert lock.user_ip_address == "127.0.0.1"
+    assert lock.created_at == current_time
+    assert lock.updated_at is None
+    assert lock.expires_at == current_time + timedelta(minutes=5)
+
+    # renew
+    renewed = add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=1))
+    assert renewed.id == lock.id
+    assert renewed.created_at == current_time
+    assert renewed.updated_at == current_time + timedelta(minutes=1)
+    assert renewed.expires_at == current_time + timedelta(minutes=6)
+
+    # deny
+    with pytest.raises(SoftPessimisticLockException) as e:
+        add_pessimistic_lock(make_request(), users[1], model, current_time + timedelta(minutes=2))
+    assert e.value.lock.user_id == users[0].pk
+    assert SoftPessimisticChangeLock.objects.get().updated_at == current_time + timedelta(minutes=1)
+
+    # take over after expiry
+    taken_over = add_pessimistic_lock(make_request(), users[1], model, current_time + timedelta(minutes=7))
+    assert taken_over.user_id == users[1].pk
+    assert taken_over.created_at == current_time + timedelta(minutes=7)
+    assert taken_over.updated_at is None
+    assert taken_over.expires_at == current_time + timedelta(minutes=12)
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+@override_settings(LOCK_INLINE_CLEANUP=False)
+def test_add_lock_single_statement(users, django_assert_num_queries):
+    backend = DatabaseLockBackend()
+    if not backend._supports_upsert(transaction.get_connection()):
+        pytest.skip('database has no upsert support')
+
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+
+    # mysql has no RETURNING - the lock is read afterwards
+    with django_assert_num_queries(2 if connection.vendor == 'mysql' else 1):
+        add_pessimistic_lock(make_request(), users[0], model)
+
+    # the upsert doesn't touch the other user's lock - the holder is read afterwards
+    with django_assert_num_queries(2):
+        with pytest.raises(SoftPessimisticLockException):
+            add_pessimistic_lock(make_request(), users[1], model)
+
+
+@override_settings(LOCK_RENEWAL_THRESHOLD_SECONDS=120)
+def test_add_lock_renewal_threshold(acquire_path, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    current_time = timezone.now()
+
+    lock = add_pessimistic_lock(make_request(), users[0], model, current_time)
+
+    # 4 minutes left - nothing written
+    with CaptureQueriesContext(connection) as queries:
+        fresh = add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=1))
+
+    assert fresh.id == lock.id
+    assert fresh.updated_at is None
+    assert fresh.expires_at == current_time + timedelta(minutes=5)
+    assert not [query for query in queries if query['sql'].startswith('UPDATE')]
+    assert SoftPessimisticChangeLock.objects.values_list('updated_at', 'expires_at').get() == (
+        None, current_time + timedelta(minutes=5)
+    )
+
+    # 1 minute left - renewed
+    renewed = add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=4))
+    assert renewed.updated_at == current_time + timedelta(minutes=4)
+    assert renewed.expires_at == current_time + timedelta(minutes=9)
+
+    # other users are still denied - without writing their lock
+    with pytest.raises(SoftPessimisticLockException):
+        add_pessimistic_lock(make_request(), users[1], model, current_time + timedelta(minutes=5))
+
+    assert SoftPessimisticChangeLock.objects.values_list('updated_at', 'expires_at').get() == (
+        current_time + timedelta(minutes=4), current_time + timedelta(minutes=9)
+    )
+
+    # heartbeats are coalesced as well
+    assert renew_pessimistic_locks_of_user('127.0.0.1', users[0], current_time + timedelta(minutes=5)) == 0
+    assert SoftPessimisticChangeLock.objects.get().expires_at == current_time + timedelta(minutes=9)
+    assert SoftPessimisticChangeLock.objects.get().updated_at == current_time + timedelta(minutes=4)
+
+    assert renew_pessimistic_locks_of_user('127.0.0.1', users[0], current_time + timedelta(minutes=8)) == 1
+    assert SoftPessimisticChangeLock.objects.get().expires_at == current_time + timedelta(minutes=13)
+
+
+@override_settings(LOCK_RENEWAL_THRESHOLD_SECONDS=120, LOCK_DEFERRED_RELEASE=True)
+def test_deferred_release_keeps_coalesced_renewal(acquire_path, users, monkeypatch):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    current_time = timezone.now()
+    release_queue = DeferredReleaseQueue(maxsize=10)
+    monkeypatch.setattr(deferred, '_release_queue', release_queue)
+
+    add_pessimistic_lock(make_request(), users[0], model, current_time)
+
+    monkeypatch.setattr(timezone, 'now', lambda: current_time + timedelta(seconds=5))
+    release_queue.submit('127.0.0.1', users[0])
+    release_queue.submit('127.0.0.2', users[0])
+
+    # opened again before the release ran - coalesced, so the pending release of that ip address is dropped
+    add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(seconds=6))
+    assert release_queue.queue.qsize() == 1
+    release_queue.flush()
+
+    assert get_pessimistic_lock_for_model(model, current_time + timedelta(seconds=7)).user_id == users[0].pk
+
+
+@pytest.mark.django_db
+def test_model_expires_at():
+    current_time = timezone.now()
+
+    created = SoftPessimisticChangeLock.objects.create(
+        user_id=1,
+        content_type_id=1,
+        object_id=1,
+        user_ip_address="127.0.0.1",
+        created_at=current_time
+    )
+    assert created.expires_at == current_time + timedelta(minutes=get_lock_duration())
+
+    updated = SoftPessimisticChangeLock.objects.create(
+        user_id=1,
+        content_type_id=1,
+        object_id=2,
+        user_ip_address="127.0.0.1",
+        created_at=current_time - timedelta(minutes=40),
+        updated_at=current_time
+    )
+    assert updated.expires_at == current_time + timedelta(minutes=get_lock_duration())
+
+
+@pytest.mark.django_db
+def test_add_lock_runs_inline_cleanup(users):
+    models = list(ContentType.objects.order_by('pk')[:3])
+    current_time = timezone.now()
+
+    with override_settings(LOCK_INLINE_CLEANUP=False):
+        add_pessimistic_lock(make_request(), users[1], models[0], current_time - timedelta(minutes=10))
+        add_pessimistic_lock(make_request(), users[0], models[1], current_time)
+
+    assert SoftPessimisticChangeLock.objects.count() == 2
+
+    # the acquisition of another object deletes the outdated lock
+    add_pessimistic_lock(make_request(), users[0], models[2], current_time)
+    assert set(SoftPessimisticChangeLock.objects.values_list('object_id', flat=True)) == {models[1].pk, models[2].pk}
+
+
+@pytest.mark.django_db
+def test_cleanup_interval(settings):
+    settings.LOCK_CLEANUP_INTERVAL_SECONDS = 60
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'lease'}}
+
+    current_time = timezone.now()
+
+    def create_outdated_lock(object_id):
+        SoftPessimisticChangeLock.objects.create(
+            user_id=1,
+            content_type_id=1,
+            object_id=object_id,
+            user_ip_address="127.0.0.1",
+            created_at=current_time - timedelta(minutes=10)
+        )
+
+    create_outdated_lock(1)
+    assert get_pessimistic_lock(content_type_id=1, object_id=1) is None
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+    # lease is taken - no cleanup within the interval, but outdated locks are still ignored
+    create_outdated_lock(2)
+    assert get_pessimistic_lock(content_type_id=1, object_id=2) is None
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+    caches['default'].delete(CLEANUP_LEASE_CACHE_KEY)
+    assert get_pessimistic_lock(content_type_id=1, object_id=2) is None
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+
+# the bulk acquisition takes over the outdated lock itself
+@override_settings(LOCK_INLINE_CLEANUP=False)
+def test_add_locks(users, django_assert_max_num_queries):
+    objects = list(Permission.objects.order_by('pk')[:10])
+    current_time = timezone.now()
+
+    # two objects are locked by someone else, one by the user and one lock is outdated
+    add_pessimistic_lock(make_request(), users[0], objects[0], current_time)
+    add_pessimistic_lock(make_request(), users[1], objects[1], current_time)
+    add_pessimistic_lock(make_request(), users[1], objects[3], current_time)
+    add_pessimistic_lock(make_request(), users[1], objects[2], current_time - timedelta(minutes=10))
+
+    with pytest.raises(SoftPessimisticLockException) as e:
+        add_pessimistic_locks(make_request(), users[0], objects, current_time + timedelta(minutes=1))
+
+    assert [lock.object_id for lock in e.value.locks] == [objects[1].pk, objects[3].pk]
+    assert e.value.lock == e.value.locks[0]
+    assert SoftPessimisticChangeLock.objects.count() == 4
+
+    assert release_pessimistic_locks('127.0.0.1', users[1], objects)[0] == 3
+
+    with django_assert_max_num_queries(6):
+        locks = add_pessimistic_locks(make_request(), users[0], reversed(objects), current_time + timedelta(minutes=1))
+
+    assert [lock.object_id for lock in locks] == [obj.pk for obj in objects]
+    assert all(lock.user_id == users[0].pk for lock in locks)
+    assert locks[0].created_at == current_time
+    assert locks[0].updated_at == current_time + timedelta(minutes=1)
+    assert SoftPessimisticChangeLock.objects.count() == 10
+
+
+def test_add_lock_once_per_request(users, django_assert_num_queries):
+    request = make_request()
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+
+    lock = add_pessimistic_lock(request, users[0], model)
+
+    with django_assert_num_queries(0):
+        assert add_pessimistic_lock(request, users[0], model) is lock
+
+    # other user still is denied
+    with pytest.raises(SoftPessimisticLockException):
+        add_pessimistic_lock(request, users[1], model)
@@ -0,0 +1,118 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.utils import timezone
+from pessimist_locking.locking_services import get_pessimistic_lock
+from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.test_backends import CACHE_BACKEND_SETTINGS
+from datetime import timedelta
+from io import StringIO
+import pytest
+
+
+def create_locks(count, created_at, first_object_id=1):
+    for object_id in range(first_object_id, first_object_id + count):
+        SoftPessimisticChangeLock.objects.create(
+            user_id=1,
+            content_type_id=1,
+            object_id=object_id,
+            user_ip_address="127.0.0.1",
+            created_at=created_at
+        )
+
+
+@pytest.mark.django_db
+def test_sweep_in_batches():
+    current_time = timezone.now()
+
+    create_locks(5, current_time - timedelta(minutes=10))
+    create_locks(1, current_time, first_object_id=6)
+
+    out = StringIO()
+    call_command('sweep_pessimistic_locks', batch_size=2, pause=0, stdout=out)
+
+    assert 'deleted 5 outdated locks' in out.getvalue()
+    assert list(SoftPessimisticChangeLock.objects.values_list('object_id', flat=True)) == [6]
+
+
+@pytest.mark.django_db
+@override_settings(LOCK_INLINE_CLEANUP=False)
+def test_inline_cleanup_disabled():
+    create_locks(1, timezone.now() - timedelta(minutes=10))
+
+    assert get_pessimistic_lock(content_type_id=1, object_id=1) is None
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+def create_session(user_id, expire_date):
+    session = SessionStore()
+    if user_id is not None:
+        session[SESSION_KEY] = str(user_id)
+    session.create()
+    Session.objects.filter(session_key=session.session_key).update(expire_date=expire_date)
+
+
+@pytest.mark.django_db
+def test_release_session_locks():
+    current_time = timezone.now()
+    users = [get_user_model().objects.create_user(username='editor{}'.format(i)) for i in range(3)]
+
+    for object_id, user in enumerate(users, start=1):
+        SoftPessimisticChangeLock.objects.create(
+            user_id=user.pk, content_type_id=1, object_id=object_id, user_ip_address="127.0.0.1",
+            created_at=current_time
+        )
+
+    create_session(users[0].pk, current_time + timedelta(days=1))
+    create_session(users[1].pk, current_time - timedelta(days=1))
+    create_session(None, current_time + timedelta(days=1))
+
+    out = StringIO()
+    call_command('release_session_locks', batch_size=1, stdout=out)
+
+    assert 'released 2 locks' in out.getvalue()
+    assert list(SoftPessimisticChangeLock.objects.values_list('user_id', flat=True)) == [users[0].pk]
+
+
+@pytest.mark.django_db
+def test_release_session_locks_keeps_locks_touched_meanwhile():
+    user = get_user_model().objects.create_user(username='editor')
+
+    # logged in and locked while the command read the sessions
+    SoftPessimisticChangeLock.objects.create(
+        user_id=user.pk, content_type_id=1, object_id=1, user_ip_address="127.0.0.1",
+        created_at=timezone.now() + timedelta(seconds=1)
+    )
+
+    out = StringIO()
+    call_command('release_session_locks', batch_size=1, stdout=out)
+
+    assert 'released 0 locks' in out.getvalue()
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+@pytest.mark.django_db
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+def test_release_session_locks_needs_session_table():
+    with pytest.raises(CommandError):
+        call_command('release_session_locks', stdout=StringIO())
+
+
+@pytest.mark.django_db
+@override_settings(**CACHE_BACKEND_SETTINGS)
+def test_release_session_locks_needs_enumerable_backend():
+    with pytest.raises(CommandError):
+        call_command('release_session_locks', stdout=StringIO())
@@ -0,0 +1,66 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib.contenttypes.models import ContentType
+from django.test import RequestFactory
+from django.utils import timezone
+from pessimist_locking.exceptions import SoftPessimisticLockException
+from pessimist_locking.locking_services import add_pessimistic_lock, release_pessimistic_locks_of_user, \
+    cleanup_outdated_pessimistic_locks
+from pessimist_locking.testing import make_request
+from pessimist_locking.views import metrics
+from datetime import timedelta
+import pytest
+
+
+prometheus_client = pytest.importorskip('prometheus_client')
+
+
+def get_sample(name):
+    return prometheus_client.REGISTRY.get_sample_value(name) or 0
+
+
+def test_lock_metrics(users):
+    current_time = timezone.now()
+    model = ContentType.objects.get_for_model(ContentType)
+    before = {name: get_sample(name) for name in (
+        'pessimist_locking_acquisitions_total', 'pessimist_locking_renewals_total', 'pessimist_locking_denials_total',
+        'pessimist_locking_releases_total', 'pessimist_locking_cleanup_deleted_total',
+        'pessimist_locking_acquire_latency_seconds_count',
+    )}
+
+    def delta(name):
+        return get_sample(name) - before[name]
+
+    add_pessimistic_lock(make_request(), users[0], model, current_time)
+    add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=1))
+
+    with pytest.raises(SoftPessimisticLockException):
+        add_pessimistic_lock(make_request(), users[1], model, current_time + timedelta(minutes=2))
+
+    release_pessimistic_locks_of_user('127.0.0.1', users[0])
+
+    add_pessimistic_lock(make_request(), users[1], model, current_time - timedelta(minutes=10))
+    cleanup_outdated_pessimistic_locks()
+
+    assert delta('pessimist_locking_acquisitions_total') == 2
+    assert delta('pessimist_locking_renewals_total') == 1
+    assert delta('pessimist_locking_denials_total') == 1
+    assert delta('pessimist_locking_releases_total') == 1
+    assert delta('pessimist_locking_cleanup_deleted_total') == 1
+    assert delta('pessimist_locking_acquire_latency_seconds_count') == 4
+
+
+def test_metrics_view(db):
+    response = metrics(RequestFactory().get('/metrics/'))
+
+    assert response.status_code == 200
+    assert response['Content-Type'] == prometheus_client.CONTENT_TYPE_LATEST
+    assert b'pessimist_locking_acquisitions_total' in response.content
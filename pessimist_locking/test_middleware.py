@@ -0,0 +1,211 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.http import HttpResponse
+from django.test import override_settings
+from django.urls import ResolverMatch
+from pessimist_locking.deferred import DeferredReleaseQueue
+from pessimist_locking.locking_services import add_pessimistic_lock, release_pessimistic_locks_of_user, \
+    aadd_pessimistic_lock, aget_pessimistic_lock, arelease_pessimistic_locks_of_user, LOCK_HOLDER_SESSION_KEY
+from pessimist_locking import middleware
+from pessimist_locking.middleware import SoftPessimisticLockReleaseMiddleware
+from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.testing import make_request
+from datetime import timedelta
+import asyncio
+import pytest
+
+
+def make_admin_request(user, path='/admin/', url_name='index', query=None):
+    request = make_request(user, data=query, path=path)
+    request.resolver_match = ResolverMatch(lambda r: None, (), {}, url_name=url_name) if url_name else None
+    return request
+
+
+def run_middleware(request):
+    return SoftPessimisticLockReleaseMiddleware(lambda r: HttpResponse())(request)
+
+
+@pytest.fixture
+def editor(editor):
+    editor.is_staff = True
+    editor.save()
+    editor.user_permissions.add(Permission.objects.get(codename='change_contenttype'))
+
+    # fresh instance to drop the permission cache
+    user = get_user_model().objects.get(pk=editor.pk)
+
+    add_pessimistic_lock(make_request(user), user, ContentType.objects.get_for_model(SoftPessimisticChangeLock))
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+    return user
+
+
+def test_release_when_leaving_change_view(editor):
+    run_middleware(make_admin_request(editor))
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+
+def test_keep_lock_on_change_view(editor):
+    run_middleware(
+        make_admin_request(editor, '/admin/contenttypes/contenttype/1/change/', 'contenttypes_contenttype_change')
+    )
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+def test_release_on_change_view_without_permission(editor):
+    run_middleware(make_admin_request(editor, '/admin/auth/user/1/change/', 'auth_user_change'))
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+
+@pytest.mark.parametrize('path, query, url_name', [
+    ('/static/admin/base.css', None, 'static'),
+    ('/admin/export/report.pdf', None, 'export'),
+    ('/admin/contenttypes/contenttype/', {'nolock': '1'}, 'contenttypes_contenttype_changelist'),
+    ('/404/', None, None),
+])
+def test_no_release(editor, django_assert_num_queries, path, query, url_name):
+    with django_assert_num_queries(0):
+        run_middleware(make_admin_request(editor, path, url_name, query))
+
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+def test_excluded_urls_setting(editor):
+    with override_settings(LOCK_EXCLUDE_URLS=['/admin/']):
+        run_middleware(make_admin_request(editor))
+
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+def test_anonymous_user_without_queries(db, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        run_middleware(make_admin_request(AnonymousUser(), '/'))
+
+
+def test_skip_release_without_holder_marker(editor, django_assert_num_queries):
+    request = make_admin_request(editor)
+    request.session = SessionStore()
+
+    with django_assert_num_queries(0):
+        run_middleware(request)
+
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+def test_release_clears_holder_marker(editor):
+    session = SessionStore()
+    model = ContentType.objects.get_for_model(ContentType)
+
+    request = make_admin_request(
+        editor, '/admin/contenttypes/contenttype/1/change/', 'contenttypes_contenttype_change'
+    )
+    request.session = session
+    add_pessimistic_lock(request, editor, model)
+    run_middleware(request)
+
+    assert session[LOCK_HOLDER_SESSION_KEY] is True
+    assert SoftPessimisticChangeLock.objects.count() == 2
+
+    request = make_admin_request(editor)
+    request.session = session
+    run_middleware(request)
+
+    assert LOCK_HOLDER_SESSION_KEY not in session
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+
+def test_release_keeps_locks_touched_later(editor):
+    lock = SoftPessimisticChangeLock.objects.get()
+
+    assert release_pessimistic_locks_of_user('127.0.0.1', editor, touched_before=lock.created_at - timedelta(seconds=1))[0] == 0
+    assert release_pessimistic_locks_of_user('127.0.0.1', editor, touched_before=lock.created_at)[0] == 1
+
+
+def test_deferred_release(editor, monkeypatch, django_assert_num_queries):
+    release_queue = DeferredReleaseQueue(maxsize=10)
+    monkeypatch.setattr(middleware, 'get_release_queue', lambda: release_queue)
+
+    with override_settings(LOCK_DEFERRED_RELEASE=True):
+        with django_assert_num_queries(0):
+            run_middleware(make_admin_request(editor))
+
+    assert release_queue.queue.qsize() == 1
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+    release_queue.flush()
+    assert release_queue.queue.empty()
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+
+def test_deferred_release_queue_full(editor):
+    release_queue = DeferredReleaseQueue(maxsize=1)
+    release_queue.submit('10.0.0.1', editor)
+
+    # no room left - released right away
+    release_queue.submit('127.0.0.1', editor)
+    assert SoftPessimisticChangeLock.objects.count() == 0
+    assert release_queue.queue.qsize() == 1
+
+
+def test_async_middleware(editor):
+    async def get_response(request):
+        return HttpResponse()
+
+    release_middleware = SoftPessimisticLockReleaseMiddleware(get_response)
+    assert asyncio.iscoroutinefunction(release_middleware)
+
+    async_to_sync(release_middleware)(make_admin_request(editor, '/static/admin/base.css', 'static'))
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+    async_to_sync(release_middleware)(make_admin_request(editor))
+    assert SoftPessimisticChangeLock.objects.count() == 0
+
+
+def test_async_services(editor):
+    model = ContentType.objects.get_for_model(ContentType)
+
+    lock = async_to_sync(aadd_pessimistic_lock)(make_admin_request(editor), editor, model)
+    assert async_to_sync(aget_pessimistic_lock)(lock.content_type_id, lock.object_id) == lock
+    assert async_to_sync(arelease_pessimistic_locks_of_user)('127.0.0.1', editor)[0] == 2
+
+
+@override_settings(LOCK_PROFILING=True)
+def test_profiling_header(editor):
+    model = ContentType.objects.get_for_model(ContentType)
+
+    def get_response(request):
+        add_pessimistic_lock(request, editor, model)
+        return HttpResponse()
+
+    response = SoftPessimisticLockReleaseMiddleware(get_response)(make_admin_request(editor))
+
+    timings = {metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')}
+    assert 'desc="calls=1 queries=' in timings['lock_add_pessimistic_lock']
+    assert 'desc="calls=1 queries=1"' in timings['lock_middleware_release_locks']
+    assert 'lock_release_pessimistic_locks_of_user' in timings
+
+
+@override_settings(LOCK_PROFILING=True)
+def test_profiling_header_async(editor):
+    async def get_response(request):
+        return HttpResponse()
+
+    response = async_to_sync(SoftPessimisticLockReleaseMiddleware(get_response))(make_admin_request(editor))
+    assert response['Server-Timing'].startswith('lock_middleware_release_locks;dur=')
+
+
+def test_no_profiling_header(editor):
+    assert not run_middleware(make_admin_request(editor)).has_header('Server-Timing')
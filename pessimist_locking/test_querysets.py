@@ -0,0 +1,99 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from pessimist_locking.admin import SoftPessimisticChangeLockModelAdmin
+from pessimist_locking.locking_services import add_pessimistic_lock
+from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.querysets import with_lock_info, add_lock_info, exclude_locked, SoftPessimisticLockQuerySet
+from pessimist_locking.testing import make_request
+from datetime import timedelta
+import pytest
+
+
+@pytest.fixture
+def locked(editor):
+    content_types = list(ContentType.objects.order_by('pk')[:3])
+
+    add_pessimistic_lock(make_request(editor), editor, content_types[0])
+    add_pessimistic_lock(make_request(editor), editor, content_types[1], timezone.now() - timedelta(minutes=10))
+
+    return content_types
+
+
+def test_with_lock_info(locked, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        content_types = {ct.pk: ct for ct in with_lock_info(ContentType.objects.all())}
+
+    assert content_types[locked[0].pk].lock_username == 'editor'
+    assert content_types[locked[0].pk].lock_user_ip_address == '127.0.0.1'
+    assert content_types[locked[0].pk].lock_expires_at is not None
+    assert content_types[locked[1].pk].lock_user_id is None
+    assert content_types[locked[2].pk].lock_user_id is None
+
+
+def test_exclude_locked(locked):
+    content_types = exclude_locked(ContentType.objects.all())
+
+    assert locked[0] not in content_types
+    assert locked[1] in content_types
+    assert locked[2] in content_types
+    assert content_types.count() == ContentType.objects.count() - 1
+
+
+def test_queryset_methods(locked):
+    queryset = SoftPessimisticLockQuerySet(ContentType)
+
+    assert queryset.exclude_locked().count() == ContentType.objects.count() - 1
+    assert queryset.with_lock_info().get(pk=locked[0].pk).lock_username == 'editor'
+
+
+def test_add_lock_info(locked, django_assert_num_queries):
+    content_types = list(ContentType.objects.order_by('pk')[:3])
+
+    # locks and holders - no matter how many objects
+    with django_assert_num_queries(2):
+        assert add_lock_info(content_types) == content_types
+
+    assert content_types[0].lock_username == 'editor'
+    assert content_types[0].lock_user_ip_address == '127.0.0.1'
+    assert content_types[0].lock_expires_at is not None
+    assert content_types[1].lock_user_id is None
+    assert content_types[2].lock_username is None
+
+    with django_assert_num_queries(0):
+        assert add_lock_info([]) == []
+
+
+def test_changelist_lock_holder(locked):
+    class LockHolderAdmin(SoftPessimisticChangeLockModelAdmin):
+        show_lock_holder = True
+
+    model_admin = LockHolderAdmin(ContentType, admin.site)
+    request = RequestFactory().get('/admin/contenttypes/contenttype/')
+    request.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    assert model_admin.get_list_display(request)[-1] == 'lock_holder'
+
+    with CaptureQueriesContext(connection) as queries:
+        changelist = model_admin.get_changelist_instance(request)
+        holders = {obj.pk: model_admin.lock_holder(obj) for obj in changelist.result_list}
+
+    assert [holders[content_type.pk] for content_type in locked] == ['editor (127.0.0.1)', '', '']
+
+    # the counts don't look at locks
+    counts = [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+    assert counts and not any(SoftPessimisticChangeLock._meta.db_table in sql for sql in counts)
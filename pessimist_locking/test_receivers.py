@@ -0,0 +1,59 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib.auth import logout
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import override_settings
+from pessimist_locking.locking_services import add_pessimistic_lock, get_pessimistic_lock_for_model, \
+    mark_lock_holder
+from pessimist_locking.testing import make_request
+
+
+def make_session_request(user, ip_address='127.0.0.1'):
+    request = make_request(user, ip_address=ip_address)
+    request.session = SessionStore()
+    return request
+
+
+def lock_models(editor):
+    models = list(ContentType.objects.all()[:2])
+
+    request = make_session_request(editor)
+    add_pessimistic_lock(request, editor, models[0])
+    mark_lock_holder(request)
+    add_pessimistic_lock(make_session_request(editor, '10.0.0.1'), editor, models[1])
+
+    return request, models
+
+
+def test_logout_releases_locks_of_its_ip_address(editor):
+    request, models = lock_models(editor)
+
+    logout(request)
+
+    assert get_pessimistic_lock_for_model(models[0]) is None
+    assert get_pessimistic_lock_for_model(models[1]).user_id == editor.pk
+
+
+@override_settings(LOCK_RELEASE_ON_LOGOUT=False)
+def test_logout_keeps_locks_if_disabled(editor):
+    request, models = lock_models(editor)
+
+    logout(request)
+
+    assert get_pessimistic_lock_for_model(models[0]).user_id == editor.pk
+
+
+def test_logout_without_locks_queries_nothing(editor, django_assert_num_queries):
+    request = make_session_request(editor)
+
+    with django_assert_num_queries(0):
+        logout(request)
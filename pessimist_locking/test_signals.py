@@ -0,0 +1,108 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from contextlib import contextmanager
+from django.contrib.contenttypes.models import ContentType
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from pessimist_locking.exceptions import SoftPessimisticLockException
+from pessimist_locking.locking_services import add_pessimistic_lock, release_pessimistic_locks_of_user, \
+    release_pessimistic_locks_of_users, cleanup_outdated_pessimistic_locks
+from pessimist_locking.signals import lock_acquired, lock_renewed, lock_denied, lock_released, locks_expired
+from pessimist_locking.testing import make_request
+from datetime import timedelta
+import pytest
+
+
+SPANS = []
+
+
+@contextmanager
+def record_span(name):
+    SPANS.append(name)
+    yield
+
+
+@pytest.fixture
+def received():
+    received = []
+    signals = {
+        'acquired': lock_acquired, 'renewed': lock_renewed, 'denied': lock_denied, 'released': lock_released,
+        'expired': locks_expired,
+    }
+    receivers = {}
+
+    for name, signal in signals.items():
+        def receiver(sender, name=name, **kwargs):
+            received.append((name, kwargs))
+
+        receivers[name] = receiver
+        signal.connect(receiver)
+
+    yield received
+
+    for name, signal in signals.items():
+        signal.disconnect(receivers[name])
+
+
+def test_lock_signals(users, received):
+    current_time = timezone.now()
+    model = ContentType.objects.get_for_model(ContentType)
+
+    lock = add_pessimistic_lock(make_request(), users[0], model, current_time)
+    add_pessimistic_lock(make_request(), users[0], model, current_time + timedelta(minutes=1))
+
+    with pytest.raises(SoftPessimisticLockException):
+        add_pessimistic_lock(make_request(), users[1], model, current_time + timedelta(minutes=2))
+
+    release_pessimistic_locks_of_user('127.0.0.1', users[0])
+
+    add_pessimistic_lock(make_request(), users[1], model, current_time - timedelta(minutes=10))
+    cleanup_outdated_pessimistic_locks()
+
+    assert [name for name, _ in received] == ['acquired', 'renewed', 'denied', 'released', 'acquired', 'expired']
+    assert received[0][1]['lock'] == lock and received[0][1]['user'] == users[0]
+    assert received[2][1]['lock'].user_id == users[0].pk and received[2][1]['user'] == users[1]
+    assert received[3][1]['count'] == 1 and received[3][1]['ip_address'] == '127.0.0.1'
+    assert received[5][1]['count'] == 1
+
+
+def test_release_of_users_signal(users, received):
+    models = list(ContentType.objects.order_by('pk')[:2])
+
+    add_pessimistic_lock(make_request(), users[0], models[0])
+    add_pessimistic_lock(make_request(ip_address='10.0.0.1'), users[1], models[1])
+    del received[:]
+
+    release_pessimistic_locks_of_users({users[0].pk, users[1].pk})
+    release_pessimistic_locks_of_users({users[0].pk})
+
+    # one signal for all users - none for nothing released
+    assert received == [('released', {'signal': lock_released, 'user': None, 'ip_address': None, 'count': 2})]
+
+
+def test_tracing_hook(users):
+    model = ContentType.objects.get_for_model(ContentType)
+    # the hook is imported by its dotted path - which may not be the module pytest imported
+    spans = import_string('pessimist_locking.test_signals.SPANS')
+    spans.clear()
+
+    add_pessimistic_lock(make_request(), users[0], model)
+    assert spans == []
+
+    with override_settings(LOCK_TRACING_HOOK='pessimist_locking.test_signals.record_span'):
+        add_pessimistic_lock(make_request(), users[0], model)
+        release_pessimistic_locks_of_user('127.0.0.1', users[0])
+
+    assert spans == [
+        'pessimist_locking.add_pessimistic_lock', 'pessimist_locking.cleanup_outdated_pessimistic_locks',
+        'pessimist_locking.release_pessimistic_locks_of_user'
+    ]
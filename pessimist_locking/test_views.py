@@ -0,0 +1,144 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from pessimist_locking.conf import get_lock_backend
+from pessimist_locking.locking_services import add_pessimistic_lock, renew_pessimistic_locks_of_user
+from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.test_backends import CACHE_BACKEND_SETTINGS
+from pessimist_locking.testing import make_request
+from pessimist_locking.views import heartbeat, release
+from datetime import timedelta
+import json
+
+
+def test_renew_locks_of_user(editor):
+    current_time = timezone.now()
+    content_types = list(ContentType.objects.order_by('pk')[:3])
+
+    add_pessimistic_lock(make_request(editor), editor, content_types[0], current_time - timedelta(minutes=1))
+    add_pessimistic_lock(make_request(editor), editor, content_types[1], current_time - timedelta(minutes=2))
+    add_pessimistic_lock(make_request(editor), editor, content_types[2], current_time - timedelta(minutes=10))
+
+    assert renew_pessimistic_locks_of_user('127.0.0.1', editor, current_time) == 2
+    assert renew_pessimistic_locks_of_user('10.0.0.1', editor, current_time) == 0
+
+    renewed = SoftPessimisticChangeLock.objects.filter(object_id__in=[ct.pk for ct in content_types[:2]])
+    assert all(lock.expires_at == current_time + timedelta(minutes=5) for lock in renewed)
+
+
+@override_settings(**CACHE_BACKEND_SETTINGS)
+def test_renew_locks_of_user_cache_backend(editor):
+    get_lock_backend().cache.clear()
+
+    current_time = timezone.now()
+    model = ContentType.objects.get_for_model(ContentType)
+
+    add_pessimistic_lock(make_request(editor), editor, model, current_time - timedelta(minutes=4))
+    assert renew_pessimistic_locks_of_user('127.0.0.1', editor, current_time) == 1
+
+    # still valid 4 minutes after the renewal
+    lock = add_pessimistic_lock(make_request(editor), editor, model, current_time + timedelta(minutes=4))
+    assert lock.created_at == current_time - timedelta(minutes=4)
+
+
+def test_heartbeat(editor, django_assert_num_queries):
+    add_pessimistic_lock(make_request(editor), editor, ContentType.objects.get_for_model(ContentType))
+
+    with django_assert_num_queries(1):
+        response = heartbeat(make_request(editor, 'post'))
+
+    assert response.status_code == 200
+    assert json.loads(response.content)['renewed'] == 1
+    assert parse_datetime(json.loads(response.content)['touched_at']) == SoftPessimisticChangeLock.objects.get().updated_at
+
+
+def test_heartbeat_of_page(editor, django_assert_num_queries):
+    current_time = timezone.now()
+    content_types = list(ContentType.objects.order_by('pk')[:2])
+
+    # lock X in one tab, lock Y in another tab half a minute later
+    add_pessimistic_lock(make_request(editor), editor, content_types[0], current_time - timedelta(seconds=60))
+    add_pessimistic_lock(make_request(editor), editor, content_types[1], current_time - timedelta(seconds=30))
+
+    # the heartbeat of Y's page renews Y only
+    content_type_id = ContentType.objects.get_for_model(ContentType).pk
+    data = {'content_type_id': content_type_id, 'object_id': content_types[1].pk}
+    with django_assert_num_queries(1):
+        response = heartbeat(make_request(editor, 'post', data=data))
+
+    assert json.loads(response.content)['renewed'] == 1
+
+    # X's tab was closed - its beacon still releases X
+    data = {
+        'content_type_id': content_type_id, 'object_id': content_types[0].pk,
+        'touched_at': (current_time - timedelta(seconds=60)).isoformat()
+    }
+    assert json.loads(release(make_request(editor, 'post', data=data)).content) == {'released': 1}
+    assert list(SoftPessimisticChangeLock.objects.values_list('object_id', flat=True)) == [content_types[1].pk]
+
+
+def test_heartbeat_denied(editor):
+    assert heartbeat(make_request(AnonymousUser(), 'post')).status_code == 403
+    assert heartbeat(make_request(AnonymousUser())).status_code == 405
+    assert heartbeat(make_request(editor, 'post', {'content_type_id': 'x', 'object_id': 1})).status_code == 400
+    assert heartbeat(make_request(editor, 'post', {'object_id': 1})).status_code == 400
+
+
+def test_release(editor, django_assert_num_queries):
+    current_time = timezone.now()
+    content_types = list(ContentType.objects.order_by('pk')[:2])
+    for content_type in content_types:
+        add_pessimistic_lock(make_request(editor), editor, content_type, current_time)
+
+    content_type_id = ContentType.objects.get_for_model(ContentType).pk
+
+    data = {'content_type_id': content_type_id, 'object_id': content_types[0].pk, 'touched_at': current_time.isoformat()}
+    with django_assert_num_queries(1):
+        response = release(make_request(editor, 'post', data=data))
+
+    assert response.status_code == 200
+    assert json.loads(response.content) == {'released': 1}
+    assert list(SoftPessimisticChangeLock.objects.values_list('object_id', flat=True)) == [content_types[1].pk]
+
+    # not held by that user
+    other = get_user_model().objects.create_user(username='other')
+    data = {'content_type_id': content_type_id, 'object_id': content_types[1].pk, 'touched_at': current_time.isoformat()}
+    assert json.loads(release(make_request(other, 'post', data=data)).content) == {'released': 0}
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+def test_release_keeps_lock_touched_later(editor):
+    current_time = timezone.now()
+    model = ContentType.objects.get_for_model(ContentType)
+
+    add_pessimistic_lock(make_request(editor), editor, model, current_time)
+
+    # the reload acquired the lock again before the beacon of the page it replaced arrived
+    add_pessimistic_lock(make_request(editor), editor, model, current_time + timedelta(seconds=1))
+
+    data = {'content_type_id': model.pk, 'object_id': model.pk, 'touched_at': current_time.isoformat()}
+    assert json.loads(release(make_request(editor, 'post', data=data)).content) == {'released': 0}
+    assert SoftPessimisticChangeLock.objects.count() == 1
+
+
+def test_release_denied(editor):
+    assert release(make_request(AnonymousUser(), 'post', {'content_type_id': 1, 'object_id': 1})).status_code == 403
+    assert release(make_request(editor, 'post', {'content_type_id': 'x', 'object_id': 1})).status_code == 400
+    assert release(make_request(editor, 'post', {'object_id': 1})).status_code == 400
+    assert release(make_request(editor, 'post', {'content_type_id': 1, 'object_id': 1})).status_code == 400
+    assert release(
+        make_request(editor, 'post', {'content_type_id': 1, 'object_id': 1, 'touched_at': 'x'})
+    ).status_code == 400
@@ -0,0 +1,260 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from pessimist_locking.conf import get_lock_backend, get_waiting_list
+from pessimist_locking.locking_services import add_pessimistic_lock, release_pessimistic_locks_of_user, \
+    wait_for_pessimistic_lock, await_for_pessimistic_lock, leave_waiting_list
+from pessimist_locking.models import SoftPessimisticChangeLock
+from pessimist_locking.test_backends import CACHE_BACKEND_SETTINGS
+from pessimist_locking.testing import make_request
+from pessimist_locking.views import wait, async_wait, leave
+from pessimist_locking.waiting import LocalWaitingList, CacheWaitingList
+from datetime import timedelta
+from unittest import mock
+import pytest
+import threading
+import time
+
+
+@pytest.fixture
+def waiting():
+    # waiting threads can't see the test transaction - so locks live in the cache. setting the waiting list backend
+    # starts with an empty waiting list
+    with override_settings(LOCK_WAITING_LIST=True, LOCK_WAIT_POLL_SECONDS=10,
+                           LOCK_WAITING_LIST_BACKEND='pessimist_locking.waiting.LocalWaitingList',
+                           **CACHE_BACKEND_SETTINGS):
+        get_lock_backend().cache.clear()
+        yield get_waiting_list()
+
+
+@pytest.mark.parametrize('waiting_list_class', [LocalWaitingList, CacheWaitingList])
+def test_waiting_list(waiting_list_class):
+    waiting_list = waiting_list_class()
+    key = (1, 1)
+
+    assert waiting_list.join(key, 'a') == 0
+    assert waiting_list.join(key, 'b') == 1
+    assert waiting_list.join(key, 'c') == 2
+    assert waiting_list.join(key, 'b') == 1
+    assert waiting_list.join((1, 2), 'd') == 0
+
+    waiting_list.leave(key, 'a')
+    assert waiting_list.join(key, 'c') == 1
+
+    # position() doesn't put back a waiter that left
+    assert waiting_list.position(key, 'c') == 1
+    assert waiting_list.position(key, 'a') is None
+    assert waiting_list.position((2, 2), 'a') is None
+    assert waiting_list.join(key, 'b') == 0
+
+    generation = waiting_list.generation(key)
+    assert waiting_list.wait(key, generation, 0.01) == generation
+
+    # releases of other objects don't wake up the waiters of key
+    waiting_list.publish([(1, 2)])
+    assert waiting_list.wait(key, generation, 0.01) == generation
+
+    waiting_list.publish([key])
+    assert waiting_list.wait(key, generation, 10) != generation
+
+    # unknown releases wake up everybody
+    generation = waiting_list.generation(key)
+    waiting_list.publish()
+    assert waiting_list.wait(key, generation, 10) != generation
+
+
+@pytest.mark.parametrize('waiting_list_class', [LocalWaitingList, CacheWaitingList])
+def test_waiting_list_drops_stale_waiters(waiting_list_class):
+    waiting_list = waiting_list_class()
+    key = (3, 3)
+
+    assert waiting_list.join(key, 'a') == 0
+    assert waiting_list.join(key, 'b') == 1
+
+    # a closed page stops asking - its waiter is dropped after a poll interval plus grace, not after wait timeouts
+    with override_settings(LOCK_WAIT_POLL_SECONDS=0, LOCK_WAIT_TIMEOUT_SECONDS=60), \
+            mock.patch.object(waiting_list_class, 'grace', 0.1):
+        time.sleep(0.2)
+        assert waiting_list.position(key, 'b') == 0
+        assert waiting_list.position(key, 'a') is None
+
+
+def test_local_waiting_list_drops_stale_keys():
+    waiting_list = LocalWaitingList()
+
+    waiting_list.join((1, 1), 'a')
+    waiting_list.publish([(1, 1)])
+    assert waiting_list._generations == {(1, 1): 1}
+
+    # the page was closed without leaving - the next publish() or join() forgets the key
+    with override_settings(LOCK_WAIT_POLL_SECONDS=0), mock.patch.object(LocalWaitingList, 'grace', 0.1):
+        time.sleep(0.2)
+        waiting_list.publish([(2, 2)])
+        assert waiting_list._waiters == {}
+        assert waiting_list._generations == {}
+
+        waiting_list.join((1, 1), 'a')
+        time.sleep(0.2)
+        waiting_list.join((2, 2), 'b')
+        assert list(waiting_list._waiters) == [(2, 2)]
+
+
+def test_wait_for_released_lock(waiting, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    add_pessimistic_lock(make_request(), users[0], model)
+
+    key = (ContentType.objects.get_for_model(ContentType).pk, model.pk)
+
+    assert wait_for_pessimistic_lock('127.0.0.1', users[1], key[0], key[1], 'first', timeout=0) == (False, 0)
+    assert wait_for_pessimistic_lock('127.0.0.1', users[1], key[0], key[1], 'second', timeout=0) == (False, 1)
+
+    threading.Timer(0.1, release_pessimistic_locks_of_user, ('127.0.0.1', users[0])).start()
+
+    # woken up by the release - long before the poll interval
+    started = time.monotonic()
+    assert wait_for_pessimistic_lock('127.0.0.1', users[1], key[0], key[1], 'first', timeout=5) == (True, 0)
+    assert time.monotonic() - started < 5
+
+    # first in line left - second is next
+    assert wait_for_pessimistic_lock('127.0.0.1', users[1], key[0], key[1], 'second', timeout=0) == (True, 0)
+
+
+def test_wait_ends_when_waiter_leaves(waiting, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    add_pessimistic_lock(make_request(), users[0], model)
+
+    key = (ContentType.objects.get_for_model(ContentType).pk, model.pk)
+
+    assert wait_for_pessimistic_lock('127.0.0.1', users[1], key[0], key[1], 'first', timeout=0) == (False, 0)
+    assert wait_for_pessimistic_lock('127.0.0.1', users[1], key[0], key[1], 'second', timeout=0) == (False, 1)
+
+    # the first waiter's page is closed while its wait request runs - the wait request ends and doesn't put it back
+    threading.Timer(0.1, leave_waiting_list, (key[0], key[1], 'first')).start()
+
+    started = time.monotonic()
+    assert wait_for_pessimistic_lock('127.0.0.1', users[1], key[0], key[1], 'first', timeout=5) == (False, None)
+    assert time.monotonic() - started < 5
+
+    assert wait_for_pessimistic_lock('127.0.0.1', users[1], key[0], key[1], 'second', timeout=0) == (False, 0)
+
+
+def test_await_for_released_lock(waiting, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    add_pessimistic_lock(make_request(), users[0], model)
+
+    key = (ContentType.objects.get_for_model(ContentType).pk, model.pk)
+    await_for_lock = async_to_sync(await_for_pessimistic_lock)
+
+    assert await_for_lock('127.0.0.1', users[1], key[0], key[1], 'first', timeout=0) == (False, 0)
+    assert await_for_lock('127.0.0.1', users[1], key[0], key[1], 'second', timeout=0.1) == (False, 1)
+
+    threading.Timer(0.1, release_pessimistic_locks_of_user, ('127.0.0.1', users[0])).start()
+
+    # noticed within the waiting list's poll interval - long before the lock's poll interval
+    started = time.monotonic()
+    assert await_for_lock('127.0.0.1', users[1], key[0], key[1], 'first', timeout=5) == (True, 0)
+    assert time.monotonic() - started < 5
+
+    assert await_for_lock('127.0.0.1', users[1], key[0], key[1], 'second', timeout=0) == (True, 0)
+
+
+def test_wait_for_expired_lock(waiting, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    lock = add_pessimistic_lock(make_request(), users[0], model, timezone.now() - timedelta(minutes=10))
+
+    assert wait_for_pessimistic_lock(
+        '127.0.0.1', users[1], lock.content_type_id, lock.object_id, 'first', timeout=0
+    ) == (True, 0)
+
+
+def test_wait_view(waiting, users):
+    request = RequestFactory().get('/locking/wait/', {'content_type_id': '1', 'object_id': '1', 'waiter': 'a'})
+    request.user = users[0]
+
+    response = wait(request)
+    assert response.status_code == 200
+    assert response.content == b'{"free": true, "position": 0}'
+
+    request = RequestFactory().get('/locking/wait/', {'content_type_id': '1'})
+    request.user = users[0]
+    assert wait(request).status_code == 400
+
+
+def test_wait_view_max_concurrent(waiting, users):
+    model = ContentType.objects.get_for_model(SoftPessimisticChangeLock)
+    lock = add_pessimistic_lock(make_request(), users[0], model)
+
+    request = RequestFactory().get(
+        '/locking/wait/', {'content_type_id': lock.content_type_id, 'object_id': lock.object_id, 'waiter': 'a'}
+    )
+    request.user = users[1]
+
+    # no wait request may stay open - the waiter gets its place and an answer right away
+    with override_settings(LOCK_WAIT_MAX_CONCURRENT=0):
+        response = wait(request)
+
+    assert response.status_code == 503
+    assert response.content == b'{"free": false, "position": 0}'
+
+    release_pessimistic_locks_of_user('127.0.0.1', users[0])
+
+    with override_settings(LOCK_WAIT_MAX_CONCURRENT=0):
+        assert wait(request).content == b'{"free": true, "position": 0}'
+
+
+def test_async_wait_view(waiting, users):
+    request = RequestFactory().get('/locking/async-wait/', {'content_type_id': '1', 'object_id': '1', 'waiter': 'a'})
+    request.user = users[0]
+
+    response = async_to_sync(async_wait)(request)
+    assert response.status_code == 200
+    assert response.content == b'{"free": true, "position": 0}'
+
+    request = RequestFactory().get('/locking/async-wait/', {'content_type_id': '1'})
+    request.user = users[0]
+    assert async_to_sync(async_wait)(request).status_code == 400
+
+    request.user = AnonymousUser()
+    assert async_to_sync(async_wait)(request).status_code == 403
+
+    request = RequestFactory().post('/locking/async-wait/')
+    request.user = users[0]
+    assert async_to_sync(async_wait)(request).status_code == 405
+
+
+def test_leave_view(waiting, users):
+    waiting.join((1, 1), 'a')
+    waiting.join((1, 1), 'b')
+
+    request = RequestFactory().post('/locking/leave/', {'content_type_id': '1', 'object_id': '1', 'waiter': 'a'})
+    request.user = users[0]
+
+    generation = waiting.generation((1, 1))
+
+    response = leave(request)
+    assert response.status_code == 200
+    assert waiting.position((1, 1), 'a') is None
+    assert waiting.position((1, 1), 'b') == 0
+
+    # the waiters behind are woken up
+    assert waiting.generation((1, 1)) != generation
+
+    request = RequestFactory().post('/locking/leave/', {'content_type_id': '1', 'object_id': '1'})
+    request.user = users[0]
+    assert leave(request).status_code == 400
+
+    request = RequestFactory().post('/locking/leave/', {'content_type_id': '1', 'object_id': '1', 'waiter': 'b'})
+    request.user = AnonymousUser()
+    assert leave(request).status_code == 403
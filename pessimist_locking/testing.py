@@ -0,0 +1,23 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.test import RequestFactory
+
+
+def make_request(user=None, method='get', data=None, path='/', ip_address='127.0.0.1'):
+    """
+    request of user from ip_address - for the lock services and views under test
+    """
+    request = getattr(RequestFactory(), method)(path, data or {}, REMOTE_ADDR=ip_address)
+
+    if user is not None:
+        request.user = user
+
+    return request
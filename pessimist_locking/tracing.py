@@ -0,0 +1,54 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from contextlib import ExitStack
+from functools import wraps
+from pessimist_locking.conf import get_tracing_hook
+from pessimist_locking.profiling import get_current_profile
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def traced(name):
+    """
+    decorator wrapping every call of the decorated function in a span of the hook configured by
+    settings.LOCK_TRACING_HOOK - a dotted path to a callable taking the span name and returning a context
+    manager, e.g. for opentelemetry
+
+        def lock_span(name):
+            return trace.get_tracer('pessimist_locking').start_as_current_span(name)
+
+    while a request is profiled (settings.LOCK_PROFILING) the call is recorded in its profile as well. without hook
+    and profile the function is called right away.
+    """
+    def decorator(func):
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            hook = get_tracing_hook()
+            profile = get_current_profile()
+
+            if hook is None and profile is None:
+                return func(*args, **kwargs)
+
+            with ExitStack() as stack:
+                if hook is not None:
+                    stack.enter_context(hook(name))
+
+                if profile is not None:
+                    stack.enter_context(profile.record(name))
+
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
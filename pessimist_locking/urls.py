@@ -0,0 +1,23 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from django.urls import path
+from pessimist_locking import views
+
+
+app_name = 'pessimist_locking'
+
+urlpatterns = [
+    path('heartbeat/', views.heartbeat, name='heartbeat'),
+    path('release/', views.release, name='release'),
+    path('wait/', views.wait, name='wait'),
+    path('async-wait/', views.async_wait, name='async_wait'),
+    path('leave/', views.leave, name='leave'),
+]
@@ -0,0 +1,213 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from asgiref.sync import sync_to_async
+from contextlib import contextmanager
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET, require_POST
+from pessimist_locking.conf import get_wait_max_concurrent
+from pessimist_locking.locking_services import renew_pessimistic_lock, renew_pessimistic_locks_of_user, \
+    release_pessimistic_lock, wait_for_pessimistic_lock, await_for_pessimistic_lock, leave_waiting_list
+from pessimist_locking.metrics import is_metrics_available, generate_metrics
+from pessimist_locking.utils import get_client_ip
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+# wait requests this process holds open - see wait_slot()
+_open_waits = 0
+_open_waits_lock = threading.Lock()
+
+
+@require_POST
+def heartbeat(request):
+    """
+    renews the lock of the current user on content_type_id/object_id - called periodically by the change form
+    (static/pessimist_locking/js/locking.js) so the lock doesn't expire while the user is still editing. answers the
+    renewal time - the page's release sends it back. the user's locks of other pages stay untouched, so a tab that was
+    closed meanwhile still releases its lock. without content_type_id/object_id all locks of the user are renewed.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'authentication required'}, status=403)
+
+    timestamp = timezone.now()
+
+    if 'content_type_id' in request.POST or 'object_id' in request.POST:
+        try:
+            content_type_id = int(request.POST['content_type_id'])
+            object_id = int(request.POST['object_id'])
+
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'content_type_id and object_id required'}, status=400)
+
+        renewed = renew_pessimistic_lock(get_client_ip(request), request.user, content_type_id, object_id, timestamp)
+
+    else:
+        renewed = renew_pessimistic_locks_of_user(get_client_ip(request), request.user, timestamp)
+
+    logger.debug("heartbeat of user: %s renewed %s locks", request.user, renewed)
+
+    return JsonResponse({'renewed': renewed, 'touched_at': timestamp.isoformat()})
+
+
+@require_POST
+def release(request):
+    """
+    releases the lock of the current user on content_type_id/object_id - sent by navigator.sendBeacon() when the
+    change form is left (static/pessimist_locking/js/locking.js). csrf protected by the form's csrfmiddlewaretoken.
+
+    touched_at is the lock's last touch the page knows of - a lock touched later (e.g. acquired again by a reload
+    that overtook the beacon) is kept.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'authentication required'}, status=403)
+
+    try:
+        content_type_id = int(request.POST['content_type_id'])
+        object_id = int(request.POST['object_id'])
+        touched_at = parse_datetime(request.POST['touched_at'])
+
+    except (KeyError, ValueError):
+        touched_at = None
+
+    if touched_at is None:
+        return JsonResponse({'error': 'content_type_id, object_id and touched_at required'}, status=400)
+
+    released, _ = release_pessimistic_lock(
+        get_client_ip(request), request.user, content_type_id, object_id, touched_before=touched_at
+    )
+    logger.debug("released %s locks of user: %s on %s/%s", released, request.user, content_type_id, object_id)
+
+    return JsonResponse({'released': released})
+
+
+@require_GET
+def wait(request):
+    """
+    long-poll of the wait page (templates/admin/pessimist_locking/wait.html) - answers as soon as the lock on
+    content_type_id/object_id is free for the waiter or after settings.LOCK_WAIT_TIMEOUT_SECONDS with the waiter's
+    position (null if the waiter left meanwhile). the request occupies a worker thread while it waits - with
+    settings.LOCK_WAIT_MAX_CONCURRENT requests open, further ones refresh the waiter's place and answer 503 right away
+    (the wait page asks again 5 seconds later). on asgi servers use async_wait instead (settings.LOCK_ASYNC_WAIT).
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'authentication required'}, status=403)
+
+    params = get_wait_params(request)
+    if params is None:
+        return JsonResponse({'error': 'content_type_id, object_id and waiter required'}, status=400)
+
+    with wait_slot() as open_wait:
+        free, position = wait_for_pessimistic_lock(
+            get_client_ip(request), request.user, *params, timeout=None if open_wait else 0
+        )
+
+    logger.debug("waiter: %s on %s/%s free: %s position: %s", params[2], params[0], params[1], free, position)
+
+    return JsonResponse({'free': free, 'position': position}, status=200 if open_wait or free else 503)
+
+
+async def async_wait(request):
+    """
+    async version of wait for asgi servers (django >= 3.1) - waits without occupying a thread, so there's no limit on
+    open wait requests. used by the wait page with settings.LOCK_ASYNC_WAIT.
+    """
+    # require_GET wraps views in a sync function
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return JsonResponse({'error': 'authentication required'}, status=403)
+
+    params = get_wait_params(request)
+    if params is None:
+        return JsonResponse({'error': 'content_type_id, object_id and waiter required'}, status=400)
+
+    free, position = await await_for_pessimistic_lock(get_client_ip(request), request.user, *params)
+    logger.debug("waiter: %s on %s/%s free: %s position: %s", params[2], params[0], params[1], free, position)
+
+    return JsonResponse({'free': free, 'position': position})
+
+
+def get_wait_params(request):
+    """
+    :return: content_type_id, object_id, waiter of a wait request - None if one is missing or invalid
+    """
+    try:
+        return int(request.GET['content_type_id']), int(request.GET['object_id']), request.GET['waiter'][:64]
+
+    except (KeyError, ValueError):
+        return None
+
+
+@contextmanager
+def wait_slot():
+    """
+    counts the wait request as open while the block runs - yields False if settings.LOCK_WAIT_MAX_CONCURRENT wait
+    requests are open already
+    """
+    global _open_waits
+
+    max_concurrent = get_wait_max_concurrent()
+
+    with _open_waits_lock:
+        open_wait = max_concurrent is None or _open_waits < max_concurrent
+        if open_wait:
+            _open_waits += 1
+
+    try:
+        yield open_wait
+
+    finally:
+        if open_wait:
+            with _open_waits_lock:
+                _open_waits -= 1
+
+
+@require_POST
+def leave(request):
+    """
+    takes the waiter off the waiting list of content_type_id/object_id - sent by navigator.sendBeacon() when the wait
+    page is left (static/pessimist_locking/js/wait.js), so the users behind don't wait for a page nobody looks at.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'authentication required'}, status=403)
+
+    try:
+        content_type_id = int(request.POST['content_type_id'])
+        object_id = int(request.POST['object_id'])
+        waiter = request.POST['waiter'][:64]
+
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'content_type_id, object_id and waiter required'}, status=400)
+
+    leave_waiting_list(content_type_id, object_id, waiter)
+    logger.debug("waiter: %s left %s/%s", waiter, content_type_id, object_id)
+
+    return JsonResponse({'left': True})
+
+
+def metrics(request):
+    """
+    exports the lock metrics in prometheus text format (needs prometheus_client). not part of pessimist_locking.urls -
+    mount it where prometheus scrapes and protect it like any other metrics endpoint, e.g.
+
+        path('metrics/locking/', pessimist_locking.views.metrics)
+    """
+    if not is_metrics_available():
+        return HttpResponse('prometheus_client is not installed', status=501, content_type='text/plain')
+
+    body, content_type = generate_metrics()
+    return HttpResponse(body, content_type=content_type)
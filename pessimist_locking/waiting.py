@@ -0,0 +1,273 @@
+################################################################
+#      _____  _____  __ __  _____  _____  _____  _____
+#     |__   ||  _  ||  |  ||  _  ||__   ||__   ||  _  | .DE
+#     |   __||     ||_   _||     ||   __||   __||     |
+#     |_____||__|__|  |_|  |__|__||_____||_____||__|__| GMBH
+#
+#     ZAYAZZA PROPRIETARY/CONFIDENTIAL.
+#     Copyright (c) 2019. All rights reserved.
+#
+################################################################
+from collections import OrderedDict
+from django.core.cache import caches
+from pessimist_locking.conf import get_lock_cache_alias, get_wait_poll_interval
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseWaitingList:
+    """
+    first in, first out list of users waiting for the lock on a content_type_id/object_id key - plus a notification
+    whenever locks on a key are released or expired.
+
+    a waiter is an id the wait page made up. it stays on the list as long as it asks for its position - waiters that
+    didn't do so for get_stale_after() seconds (closed the page) are dropped. a wait page that is left takes its
+    waiter off the list right away.
+    """
+
+    # seconds a waiter stays on the list without asking - the wait page asks again right away, after 5 seconds if
+    # the server was gone
+    grace = 15
+
+    # seconds between two generation checks of waiters that poll instead of blocking (CacheWaitingList, async waits)
+    poll_interval = 0.5
+
+    def join(self, key, waiter):
+        """
+        appends waiter to the list of key - or refreshes its entry
+
+        :return: position of waiter, 0 is first
+        """
+        raise NotImplementedError('subclasses of BaseWaitingList must provide a join() method')
+
+    def position(self, key, waiter):
+        """
+        refreshes the entry of waiter on the list of key - without appending it again once it left or was dropped
+
+        :return: position of waiter, 0 is first - None if waiter isn't on the list
+        """
+        raise NotImplementedError('subclasses of BaseWaitingList must provide a position() method')
+
+    def leave(self, key, waiter):
+        raise NotImplementedError('subclasses of BaseWaitingList must provide a leave() method')
+
+    def publish(self, keys=None):
+        """
+        tells the waiters of keys - all waiters if keys is None - locks were released or expired, so they check
+        whether their lock is free now
+        """
+        raise NotImplementedError('subclasses of BaseWaitingList must provide a publish() method')
+
+    def generation(self, key):
+        """
+        :return: marker of the last publish() concerning key - to be passed to wait()
+        """
+        raise NotImplementedError('subclasses of BaseWaitingList must provide a generation() method')
+
+    def wait(self, key, generation, timeout):
+        """
+        blocks until publish() concerned key after generation was read or timeout seconds passed
+
+        :return: current generation of key
+        """
+        raise NotImplementedError('subclasses of BaseWaitingList must provide a wait() method')
+
+    @classmethod
+    def get_stale_after(cls):
+        # a waiting wait request asks every poll interval
+        return get_wait_poll_interval() + cls.grace
+
+    def _join(self, waiters, waiter, now, append=True):
+        """
+        refreshes waiter in waiters (waiter -> last seen) and drops stale waiters
+
+        :return: position of waiter - None if it isn't in waiters and append is False
+        """
+        stale_before = now - self.get_stale_after()
+
+        for stale in [item for item, last_seen in waiters.items() if last_seen < stale_before and item != waiter]:
+            del waiters[stale]
+
+        if not append and waiter not in waiters:
+            return None
+
+        waiters[waiter] = now
+        return list(waiters).index(waiter)
+
+
+class LocalWaitingList(BaseWaitingList):
+    """
+    keeps waiting lists in process memory and wakes up waiting threads right away - good for a single process (e.g.
+    runserver or one worker with threads). lists whose waiters all went stale are dropped by join() and publish().
+    """
+
+    def __init__(self):
+        self._waiters = {}
+        # every publish() counts up _published - keys remember the count of the last publish() concerning them
+        self._published = 0
+        self._published_to_all = 0
+        self._generations = {}
+        self._condition = threading.Condition()
+
+    def join(self, key, waiter):
+        with self._condition:
+            now = time.monotonic()
+            self._purge(now)
+            return self._join(self._waiters.setdefault(key, OrderedDict()), waiter, now)
+
+    def _purge(self, now):
+        """
+        drops the lists of keys whose waiters all closed their page without leaving - and the generations of keys
+        nobody waits for
+        """
+        stale_before = now - self.get_stale_after()
+
+        for key, waiters in list(self._waiters.items()):
+            if all(last_seen < stale_before for last_seen in waiters.values()):
+                del self._waiters[key]
+
+        for key in set(self._generations).difference(self._waiters):
+            del self._generations[key]
+
+    def position(self, key, waiter):
+        with self._condition:
+            waiters = self._waiters.get(key)
+
+            if waiters is None:
+                return None
+
+            return self._join(waiters, waiter, time.monotonic(), append=False)
+
+    def leave(self, key, waiter):
+        with self._condition:
+            waiters = self._waiters.get(key)
+
+            if waiters is not None:
+                waiters.pop(waiter, None)
+
+                if not waiters:
+                    del self._waiters[key]
+                    self._generations.pop(key, None)
+
+    def publish(self, keys=None):
+        with self._condition:
+            self._purge(time.monotonic())
+            self._published += 1
+
+            if keys is None:
+                self._published_to_all = self._published
+            else:
+                # nobody waits for the other keys - no need to remember them
+                for key in set(keys).intersection(self._waiters):
+                    self._generations[key] = self._published
+
+            self._condition.notify_all()
+
+    def generation(self, key):
+        return max(self._published_to_all, self._generations.get(key, 0))
+
+    def wait(self, key, generation, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self.generation(key) != generation, timeout)
+            return self.generation(key)
+
+
+class CacheWaitingList(BaseWaitingList):
+    """
+    keeps waiting lists in the settings.LOCK_CACHE_ALIAS cache - use a shared cache (redis, memcached) to wait across
+    processes and hosts. waiters notice a publish() by polling a counter per key (and one for all keys) in the cache
+    every poll_interval seconds.
+
+    list updates are serialized by a short-lived mutex entry created with cache.add().
+    """
+
+    key_prefix = 'pessimist_locking:waiting'
+
+    mutex_timeout = 5
+
+    @property
+    def cache(self):
+        return caches[get_lock_cache_alias()]
+
+    def list_key(self, key):
+        return '{}:{}:{}'.format(self.key_prefix, *key)
+
+    def generation_key(self, key=None):
+        if key is None:
+            return '{}:generation'.format(self.key_prefix)
+
+        return self.list_key(key) + ':generation'
+
+    def _update(self, key, update):
+        """
+        calls update with the waiters (waiter -> last seen) of key and stores them afterwards
+        """
+        list_key = self.list_key(key)
+        mutex_key = list_key + ':mutex'
+
+        # wait a moment for a concurrent update - and go ahead without the mutex if it takes too long
+        for _ in range(100):
+            if self.cache.add(mutex_key, True, self.mutex_timeout):
+                break
+            time.sleep(0.01)
+        else:
+            logger.warning("waiting list of %s stays locked - updating anyway", key)
+
+        try:
+            waiters = OrderedDict(self.cache.get(list_key) or ())
+            result = update(waiters)
+
+            if waiters:
+                self.cache.set(list_key, list(waiters.items()), self.get_stale_after())
+            else:
+                self.cache.delete(list_key)
+
+            return result
+
+        finally:
+            self.cache.delete(mutex_key)
+
+    def join(self, key, waiter):
+        return self._update(key, lambda waiters: self._join(waiters, waiter, time.time()))
+
+    def position(self, key, waiter):
+        return self._update(key, lambda waiters: self._join(waiters, waiter, time.time(), append=False))
+
+    def leave(self, key, waiter):
+        self._update(key, lambda waiters: waiters.pop(waiter, None))
+
+    def publish(self, keys=None):
+        if keys is None:
+            self._count_up(self.generation_key(), None)
+            return
+
+        # counters of keys nobody waits for run out with the waiting lists
+        for key in set(keys):
+            self._count_up(self.generation_key(key), self.get_stale_after())
+
+    def _count_up(self, generation_key, timeout):
+        try:
+            self.cache.incr(generation_key)
+
+        except ValueError:
+            self.cache.add(generation_key, 1, timeout)
+
+    def generation(self, key):
+        generations = self.cache.get_many([self.generation_key(), self.generation_key(key)])
+        return generations.get(self.generation_key(), 0), generations.get(self.generation_key(key), 0)
+
+    def wait(self, key, generation, timeout):
+        deadline = time.monotonic() + timeout
+
+        while True:
+            current = self.generation(key)
+            remaining = deadline - time.monotonic()
+
+            if current != generation or remaining <= 0:
+                return current
+
+            time.sleep(min(self.poll_interval, remaining))
@@ -12,6 +12,11 @@ setup(
     version=__import__('pessimist_locking').VERSION,
     packages=find_packages(),
     include_package_data=True,
+    # django 2.2 doesn't depend on asgiref - locking_services and middleware import it
+    install_requires=['asgiref>=3.2'],
+    extras_require={
+        'metrics': ['prometheus_client>=0.7'],
+    },
     description='soft pessimistic locking extension for django',
     long_description=README,
     url='https://www.zayazza.de/',